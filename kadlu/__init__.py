@@ -1,45 +1,82 @@
 import os
 import logging
+import importlib
+from datetime import timedelta
 
 LOGLEVEL = os.environ.get('LOGLEVEL', 'INFO')
-logging.basicConfig(format='%(asctime)s  %(message)s', level=LOGLEVEL, datefmt='%Y-%m-%d %I:%M:%S')
-
-# data utils
-from .geospatial.data_sources.data_util import (
-        Capturing,
-        database_cfg,
-        dt_2_epoch,
-        epoch_2_dt,
-        ext,
-        index,
-        reshape_2D,
-        reshape_3D,
-        storage_cfg,
+
+# public attributes are imported on first access (PEP 562), so that
+# importing kadlu does not import plotting and data source dependencies,
+# or open the database. maps attribute name to (module, attribute),
+# where an attribute of None refers to the module itself
+_lazy = dict(
+        # data utils
+        Capturing       = ('.geospatial.data_sources.data_util', 'Capturing'),
+        database_cfg    = ('.geospatial.data_sources.data_util', 'database_cfg'),
+        dt_2_epoch      = ('.geospatial.data_sources.data_util', 'dt_2_epoch'),
+        epoch_2_dt      = ('.geospatial.data_sources.data_util', 'epoch_2_dt'),
+        ext             = ('.geospatial.data_sources.data_util', 'ext'),
+        index           = ('.geospatial.data_sources.data_util', 'index'),
+        reshape_2D      = ('.geospatial.data_sources.data_util', 'reshape_2D'),
+        reshape_3D      = ('.geospatial.data_sources.data_util', 'reshape_3D'),
+        storage_cfg     = ('.geospatial.data_sources.data_util', 'storage_cfg'),
+
+        # automatic fetching without loading
+        ifremer         = ('.geospatial.data_sources.ifremer', 'Ifremer'),
+
+        # loading with automatic fetching
+        source_map      = ('.geospatial.data_sources.source_map', 'source_map'),
+        chs             = ('.geospatial.data_sources.chs', 'Chs'),
+        era5            = ('.geospatial.data_sources.era5', 'Era5'),
+        era5_cfg        = ('.geospatial.data_sources.era5', 'era5_cfg'),
+        gebco           = ('.geospatial.data_sources.gebco', 'Gebco'),
+        hycom           = ('.geospatial.data_sources.hycom', 'Hycom'),
+        wwiii           = ('.geospatial.data_sources.wwiii', 'Wwiii'),
+        synthetic       = ('.geospatial.data_sources.synthetic', 'Synthetic'),
+
+        # load data from local files
+        load_netcdf     = ('.geospatial.data_sources.load_from_file', 'load_netcdf'),
+        load_raster     = ('.geospatial.data_sources.load_from_file', 'load_raster'),
+
+        # user-facing data loading API
+        load_map        = ('.geospatial.data_sources.source_map', 'load_map'),
+        aload           = ('.aio', 'aload'),
+        load_points     = ('.geospatial.data_sources.points', 'load_points'),
+
+        # systematic file testing for all files in kadlu_data/testfiles/
+        test_files      = ('.tests.geospatial.data_sources.test_files', 'test_files'),
+
+        # plotting tools
+        plot2D                  = ('.plot_util', 'plot2D'),
+        animate                 = ('.plot_util', 'animate'),
+        plot_transm_loss_horiz  = ('.plot_util', 'plot_transm_loss_horiz'),
+        plot_transm_loss_vert   = ('.plot_util', 'plot_transm_loss_vert'),
+
+        # stage-level timers and counters
+        instrument      = ('.instrument', None),
     )
 
-# automatic fetching without loading
-from .geospatial.data_sources.ifremer import Ifremer as ifremer 
 
-# loading with automatic fetching
-from .geospatial.data_sources.source_map import source_map 
-from .geospatial.data_sources.chs import Chs as chs
-from .geospatial.data_sources.era5 import Era5 as era5, era5_cfg
-from .geospatial.data_sources.gebco import Gebco as gebco
-from .geospatial.data_sources.hycom import Hycom as hycom
-from .geospatial.data_sources.wwiii import Wwiii as wwiii
+def _log_cfg():
+    """ configure logging on first use of the API rather than on import.
+        does nothing if the root logger already has handlers
+    """
+    logging.basicConfig(format='%(asctime)s  %(message)s', level=LOGLEVEL, datefmt='%Y-%m-%d %I:%M:%S')
 
-# load data from local files
-from .geospatial.data_sources.load_from_file import load_netcdf
-from .geospatial.data_sources.load_from_file import load_raster
 
-# user-facing data loading API
-from .geospatial.data_sources.source_map import load_map
+def __getattr__(name):
+    if name not in _lazy: 
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    _log_cfg()
+    module, attr = _lazy[name]
+    value = importlib.import_module(module, __name__)
+    if attr is not None: value = getattr(value, attr)
+    globals()[name] = value
+    return value
 
-# systematic file testing for all files in kadlu_data/testfiles/
-from .tests.geospatial.data_sources.test_files import test_files
 
-# plotting tools
-from .plot_util import *
+def __dir__():
+    return sorted(list(globals().keys()) + list(_lazy.keys()))
 
 
 def load(source, var, **kwargs):
@@ -64,6 +101,9 @@ def load(source, var, **kwargs):
             times are in epoch format
     """
 
+    from .geospatial.data_sources.source_map import load_map
+    _log_cfg()
+
     source, var = source.lower(), var.lower()
     if var == 'bathymetry' or var == 'depth' or var == 'elevation': var = 'bathy'
 
@@ -75,6 +115,52 @@ def load(source, var, **kwargs):
     return load_map[loadkey](**kwargs)
 
 
+def iter_load(source, var, chunk=timedelta(days=1), **kwargs):
+    """ automated fetching and loading, one time slice at a time
+
+        the time range is split into consecutive slices of length chunk,
+        and the data of each slice is fetched if needed, loaded and 
+        yielded before the next slice is read, so that memory use is 
+        bounded by the size of one slice. bathymetry has no time axis and
+        is yielded in one piece
+
+        args
+            source, var: strings
+                to view the complete list of sources and variables:
+                print(kadlu.source_map)
+            chunk: timedelta
+                length of each time slice
+            kwargs: dictionary
+                dict containing boundary coordinates, as for kadlu.load
+
+        yields ND numpy arrays, as returned by kadlu.load. data is stored
+        in whole epoch hours, so the bounds of the slices are rounded up to
+        whole hours, and slices do not overlap: a timestamp on the 
+        boundary of two slices is only included in the second, i.e. the 
+        slice starting at it
+
+        example:
+            for val, lat, lon, epoch in kadlu.iter_load('era5', 'waveheight', 
+                    chunk=timedelta(hours=6), **bounds):
+                print(epoch[0], val.mean())
+    """
+    assert chunk >= timedelta(hours=1), 'chunk must be at least one hour'
+    if var.lower() in ('bathy', 'bathymetry', 'depth', 'elevation'):
+        yield load(source, var, **kwargs)
+        return
+
+    from .geospatial.data_sources.data_util import ceil_hour
+    start, end = kwargs['start'], kwargs.get('end', kwargs['start'])
+    t, k = start, 1
+    while True:
+        bound = ceil_hour(start + k * chunk)  # start of the next slice
+        last = bound >= end
+        qry = dict(kwargs, start=t, end=end if last else bound - timedelta(hours=1))
+        yield load(source, var, **qry)
+        if last: return
+        t, k = bound, k + 1
+
+
 def load_file(filepath, **kwargs):
     """ loading from local files 
 
@@ -91,6 +177,10 @@ def load_file(filepath, **kwargs):
             val, lat, lon, [time, depth]
             times are in epoch format
     """
+    from .geospatial.data_sources.data_util import ext
+    from .geospatial.data_sources.load_from_file import load_netcdf, load_raster
+    _log_cfg()
+
     assert os.path.isfile(filepath), f'error: could not find {filepath}'
 
     if ext(filepath, ('.nc',)):
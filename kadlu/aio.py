@@ -0,0 +1,128 @@
+"""
+    Asynchronous data loading for use within an asyncio event loop.
+
+    Fetching, database queries and interpolation are blocking, so they are
+    run on a thread pool, leaving the event loop free to serve other
+    requests. Fetches are made with the same blocking HTTP client as the
+    synchronous API, which releases the GIL while waiting on the network.
+    The number of worker threads can be set in config.ini:
+
+        [async]
+        workers = 8
+
+    Identical requests awaited at the same time are coalesced, i.e. the
+    work is done once and every caller receives the result. Requests for
+    different regions that share fetch bins wait for each other's fetches
+    instead of downloading the bins twice (see fetch_handler.fetch_once).
+
+    Example:
+
+        >>> import asyncio, kadlu
+        >>> from kadlu.geospatial.ocean import Ocean
+        >>> async def main():
+        ...     temp, sal = await asyncio.gather(
+        ...         kadlu.aload('hycom', 'temp', **bounds),
+        ...         kadlu.aload('hycom', 'salinity', **bounds))
+        ...     ocean = await Ocean.acreate(load_bathymetry='chs', **bounds)
+        >>> asyncio.run(main())
+"""
+
+import json
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+_executor = None
+_pending = {}
+
+
+def executor():
+    """ thread pool shared by the asynchronous API, created on first use """
+    global _executor
+    if _executor is None:
+        from kadlu.geospatial.data_sources.data_util import cfg
+        _executor = ThreadPoolExecutor(cfg.getint('async', 'workers', fallback=8),
+                thread_name_prefix='kadlu')
+    return _executor
+
+
+async def run(fcn, *args, **kwargs):
+    """ call a blocking function on the thread pool and await its result """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), partial(fcn, *args, **kwargs))
+
+
+async def coalesce(key, fcn, *args, **kwargs):
+    """ call a blocking function on the thread pool, sharing the call with
+        any other caller awaiting the same key. if key is None, the call is
+        not shared
+
+        Args:
+            key: hashable
+                identifies the request, e.g. a source, variable and query
+            fcn: callable
+                blocking function, called with args and kwargs
+
+        Returns:
+            the result of fcn. the same object is returned to each caller
+            sharing the call
+    """
+    if key is None: return await run(fcn, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    key = (loop, key)
+    if key not in _pending:
+        future = loop.run_in_executor(executor(), partial(fcn, *args, **kwargs))
+        future.add_done_callback(lambda f: _pending.pop(key, None))
+        _pending[key] = future
+    # a cancelled caller does not cancel the call for the others
+    return await asyncio.shield(_pending[key])
+
+
+def request_key(**kwargs):
+    """ key identifying a request by its keyword arguments. returns None if 
+        an argument can't be described, e.g. a callable
+    """
+    from kadlu.geospatial.ocean import source_key
+    described = {}
+    for k, v in kwargs.items():
+        if callable(v): return None
+        if isinstance(v, (list, tuple, np.ndarray)): v = source_key(v)
+        described[k] = v
+    return json.dumps(described, sort_keys=True, default=str)
+
+
+async def aload(source, var, **kwargs):
+    """ asynchronous kadlu.load: fetch and load data without blocking the
+        event loop. concurrent identical requests are loaded once, and
+        each caller receives a copy of the arrays
+
+        args
+            source, var: strings
+                to view the complete list of sources and variables:
+                print(kadlu.source_map)
+
+            kwargs: dictionary
+                dict containing boundary coordinates, as for kadlu.load
+
+        returns the arrays returned by kadlu.load, ordered by:
+            val, lat, lon, [time, depth]
+        as an ND numpy array, or as a tuple if the arrays differ in shape
+        (e.g. gridded bathymetry with lat and lon axes)
+    """
+    import kadlu
+    key = request_key(**kwargs)
+    if key is not None: key = ('load', source.lower(), var.lower(), key)
+    result = await coalesce(key, kadlu.load, source, var, **kwargs)
+    if isinstance(result, np.ndarray): return result.copy()
+    return type(result)(np.array(arr, copy=True) for arr in result)
+
+
+async def ocean(cls, **kwargs):
+    """ create an Ocean on the thread pool. concurrent requests with the
+        same data sources and boundaries share the same Ocean
+    """
+    key = request_key(**kwargs)
+    return await coalesce(None if key is None else ('ocean', key), cls, **kwargs)
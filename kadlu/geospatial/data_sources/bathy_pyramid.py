@@ -0,0 +1,235 @@
+"""
+    multi-resolution bathymetry tile pyramid
+
+    bathymetry is rasterized into 1°x1° tiles at the native resolution of
+    the source (level 0), and each following level halves the resolution
+    by averaging 2x2 blocks of cells. tiles are stored as numpy arrays in
+    the storage directory, and are memory-mapped when loaded
+
+    cells without source data (e.g. land, or areas not surveyed by CHS)
+    are stored as NaN, which serves as the nodata mask of the tile. the
+    source loaders fetch the region of a tile before loading it, so a
+    stored tile holds all of the source data for its region. a tile for
+    which no data was loaded at all is not stored, and is rebuilt each
+    time it is loaded, so that data fetched later reaches the pyramid
+
+    a level can be chosen to match the horizontal resolution of a model
+    grid, so that coarse model runs don't load and interpolate full
+    resolution data
+"""
+
+import os
+import logging
+from os.path import isfile
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.source_map import load_map
+from kadlu.geospatial.data_sources.data_util import storage_cfg
+
+
+# native resolution of each source in degrees per cell
+base_res = dict(
+        gebco   = 1 / 240,      # 15 arc-seconds
+        chs     = 1 / 1000,     # NONNA-100 geotiffs, 0.001° per pixel
+    )
+
+# number of levels in the pyramid of each source. the cells of a 1° tile
+# can be halved this many times minus one without remainder
+num_levels = dict(
+        gebco   = 5,            # 240 to 15 cells per degree
+        chs     = 4,            # 1000 to 125 cells per degree
+    )
+
+# metres per degree of latitude
+deg_m = 111.32e3
+
+
+def tile_path(source, level, south, west):
+    """ filepath of the tile with its southwest corner at (south, west) """
+    return f'{storage_cfg()}bathy_pyramid{os.sep}{source}{os.sep}{level}' \
+           f'{os.sep}{south:+03d}{west:+04d}.npy'
+
+
+def rasterize(val, lat, lon, south, west, res):
+    """ average bathymetric points into the cells of a 1° tile
+
+        args:
+            val, lat, lon: arrays
+                bathymetric values and coordinates. val may be a 2D grid
+                with lat and lon axes, or 1D arrays of equal length
+            south, west: int
+                southwest corner of the tile
+            res: float
+                cell size in degrees
+
+        return:
+            grid: 2D float32 array
+                mean value of the points within each cell. NaN where no
+                points were found
+    """
+    n = int(round(1 / res))
+    if np.ndim(val) == 2: lat, lon = map(np.ravel, np.meshgrid(lat, lon, indexing='ij'))
+    val = np.ravel(val)
+    # points on the edge of a cell (e.g. CHS pixel corners) are placed in
+    # the cell north or east of the edge despite rounding errors
+    rows = np.floor(np.round((np.asarray(lat) - south) / res, 6)).astype(int)
+    cols = np.floor(np.round((np.asarray(lon) - west)  / res, 6)).astype(int)
+    keep = (rows >= 0) & (rows < n) & (cols >= 0) & (cols < n) & ~np.isnan(val)
+    cells = rows[keep] * n + cols[keep]
+    total = np.bincount(cells, weights=val[keep], minlength=n*n)
+    count = np.bincount(cells, minlength=n*n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (total / count).reshape(n, n).astype(np.float32)
+
+
+def downsample(grid):
+    """ halve the resolution of a grid by averaging 2x2 blocks of cells.
+        NaN cells are excluded from the average
+    """
+    n, m = grid.shape[0] // 2, grid.shape[1] // 2
+    blocks = grid.reshape(n, 2, m, 2)
+    valid = ~np.isnan(blocks)
+    total = np.where(valid, blocks, 0).sum(axis=(1, 3))
+    count = valid.sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (total / count).astype(np.float32)
+
+
+def tile_range(south, north, west, east):
+    """ southwest corners of the 1° tiles intersecting the boundaries """
+    lats = range(int(np.floor(south)), max(int(np.ceil(north)), int(np.floor(south)) + 1))
+    lons = range(int(np.floor(west)),  max(int(np.ceil(east)),  int(np.floor(west))  + 1))
+    return [(y, x) for y in lats for x in lons]
+
+
+def build_tile(source, south, west):
+    """ build the pyramid levels of a 1° tile from the source data
+
+        the source data is loaded with the loader of the source in
+        load_map. empty cells are stored as NaN. the levels are not 
+        stored if no data was loaded for the tile
+
+        args:
+            source: string
+                bathymetry source, one of 'gebco' or 'chs'
+            south, west: int
+                southwest corner of the tile
+
+        return:
+            grids: list of 2D float32 arrays
+                the tile at each level of the pyramid
+    """
+    val, lat, lon = load_map[f'bathy_{source}'](
+            south=south, north=south+1, west=west, east=west+1)
+    grids = [rasterize(val, lat, lon, south, west, base_res[source])]
+    for level in range(1, num_levels[source]): grids.append(downsample(grids[-1]))
+
+    if np.isnan(grids[0]).all():
+        logging.info(f'{source} bathymetry pyramid tile {south:+03d}{west:+04d} '
+                      'has no data, the tile will not be stored')
+        return grids
+
+    for level, grid in enumerate(grids):
+        path = tile_path(source, level, south, west)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, grid, allow_pickle=False)
+    return grids
+
+
+def build_pyramid(source, south, north, west, east):
+    """ build pyramid tiles for the given region from the source data
+
+        tiles that already exist are skipped. source data is loaded one
+        tile at a time with the loader of the source in load_map
+
+        args:
+            source: string
+                bathymetry source, one of 'gebco' or 'chs'
+            south, north: float
+                ymin, ymax coordinate boundaries (latitude). range: -90, 90
+            west, east: float
+                xmin, xmax coordinate boundaries (longitude). range: -180, 180
+    """
+    assert source in base_res.keys(), f'no pyramid resolution defined for {source}'
+    for y, x in tile_range(south, north, west, east):
+        paths = [tile_path(source, level, y, x) for level in range(num_levels[source])]
+        if all(map(isfile, paths)): continue
+
+        logging.info(f'building {source} bathymetry pyramid tile {y:+03d}{x:+04d}')
+        build_tile(source, y, x)
+
+
+def pyramid_level(source, spacing):
+    """ coarsest pyramid level with a cell size no larger than spacing
+
+        args:
+            source: string
+                bathymetry source, one of 'gebco' or 'chs'
+            spacing: float
+                horizontal resolution to be resolved, in metres
+
+        return:
+            level: int
+    """
+    cell_m = base_res[source] * deg_m * 2 ** np.arange(num_levels[source])
+    return int(max(0, np.count_nonzero(cell_m <= spacing) - 1))
+
+
+def load_pyramid(source, level=0, **kwargs):
+    """ load bathymetry from the pyramid tiles of the given level
+
+        missing tiles are built from the source data. tiles that are not
+        stored (see build_tile) are rebuilt at each call
+
+        args:
+            source: string
+                bathymetry source, one of 'gebco' or 'chs'
+            level: int
+                pyramid level. resolution is halved at each level
+            south, north: float
+                ymin, ymax coordinate boundaries (latitude). range: -90, 90
+            west, east: float
+                xmin, xmax coordinate boundaries (longitude). range: -180, 180
+
+        return:
+            val, lat, lon: arrays
+                if every cell within the boundaries has a value, val is a
+                2D grid with lat and lon axes. otherwise, empty cells are
+                dropped and val, lat, lon are 1D arrays of equal length
+    """
+    south, north = kwargs['south'], kwargs['north']
+    west, east = kwargs['west'], kwargs['east']
+    assert 0 <= level < num_levels[source], f'no pyramid level {level} for {source}'
+
+    res = base_res[source] * 2 ** level
+    n = int(round(1 / res))
+    tiles = tile_range(south, north, west, east)
+    y0, x0 = min(t[0] for t in tiles), min(t[1] for t in tiles)
+    ny, nx = len(set(t[0] for t in tiles)), len(set(t[1] for t in tiles))
+
+    # cell centres of the mosaic, and the cells within the boundaries
+    lat = y0 + (np.arange(ny * n) + 0.5) * res
+    lon = x0 + (np.arange(nx * n) + 0.5) * res
+    rows = np.nonzero((lat >= south) & (lat <= north))[0]
+    cols = np.nonzero((lon >= west)  & (lon <= east))[0]
+    val = np.full((len(rows), len(cols)), np.nan, dtype=np.float32)
+
+    # read the overlapping region of each tile
+    for y, x in tiles:
+        path = tile_path(source, level, y, x)
+        if isfile(path): tile = np.load(path, mmap_mode='r', allow_pickle=False)
+        else:            tile = build_tile(source, y, x)[level]
+        r = rows[(rows >= (y - y0) * n) & (rows < (y - y0 + 1) * n)]
+        c = cols[(cols >= (x - x0) * n) & (cols < (x - x0 + 1) * n)]
+        if len(r) == 0 or len(c) == 0: continue
+        val[np.ix_(np.searchsorted(rows, r), np.searchsorted(cols, c))] = \
+                tile[r[0] - (y - y0) * n : r[-1] - (y - y0) * n + 1,
+                     c[0] - (x - x0) * n : c[-1] - (x - x0) * n + 1]
+
+    lat, lon = lat[rows], lon[cols]
+    if not np.isnan(val).any(): return val.astype(float), lat, lon
+
+    ygrid, xgrid = np.meshgrid(lat, lon, indexing='ij')
+    keep = ~np.isnan(val)
+    return np.array((val[keep], ygrid[keep], xgrid[keep])).astype(float)
@@ -9,24 +9,35 @@ import os
 import json
 import logging
 import requests
+import threading
 import warnings
 from PIL import Image
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import numpy as np
 
 import kadlu.geospatial.data_sources.fetch_handler
+from kadlu import instrument
+from kadlu.geospatial.data_sources.load_from_file import read_raster
 from kadlu.geospatial.data_sources.data_util        import          \
         database_cfg,                                               \
+        bulk_insert,                                                \
+        query_rows,                                                 \
         storage_cfg,                                                \
         insert_hash,                                                \
         serialized,                                                 \
         fmt_coords,                                                 \
         chs_table,                                                  \
-        str_def
+        str_def,                                                    \
+        cfg
 
 
-conn, db = database_cfg()
+# base URL of the image server. can be changed in config.ini with 'url' in section [chs]
+chs_src = cfg.get('chs', 'url',
+        fallback="https://gisp.dfo-mpo.gc.ca/arcgis/rest/services/FGP/CHS_NONNA_100/")
+chs_workers = 4  # number of concurrent tile downloads
+worker = threading.local()  # http session of each download thread
 
 
 def parse_sw_corner(path):
@@ -39,9 +50,112 @@ def parse_sw_corner(path):
     return south, west
 
 
+def chs_session():
+    """ connection-pooled http session for requests to the CHS image server """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=chs_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def open_worker_session(sessions):
+    """ give the calling download thread its own http session.
+        requests.Session is not thread-safe, so sessions are not shared
+        between threads. sessions are appended to the given list, to be
+        closed once the downloads are complete
+    """
+    worker.session = chs_session()
+    sessions.append(worker.session)
+
+
+def download_tile_worker(url, fpath):
+    """ download_tile using the http session of the calling thread """
+    return download_tile(worker.session, url, fpath)
+
+
+def download_tile(session, url, fpath, chunk_size=2**16):
+    """ stream a file to disk, resuming a partial download if one exists
+
+        data is written to fpath with a '.part' suffix, which is renamed
+        to fpath once the download is complete. if a partial file exists,
+        only the remaining bytes are requested
+
+        args:
+            session: requests.Session
+                http session used for the download
+            url: string
+                file URL
+            fpath: string
+                complete filepath of the downloaded file
+
+        return:
+            fpath
+    """
+    part = f'{fpath}.part'
+    offset = os.path.getsize(part) if os.path.isfile(part) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+    received = 0
+    with instrument.timer('download', source='chs'), \
+            session.get(url, headers=headers, stream=True) as payload:
+        if payload.status_code == 416: pass  # partial file is already complete
+        else:
+            assert payload.status_code in (200, 206), f'error fetching {url}'
+            mode = 'ab' if payload.status_code == 206 else 'wb'
+            with open(part, mode) as f:
+                for chunk in payload.iter_content(chunk_size=chunk_size): 
+                    f.write(chunk)
+                    received += len(chunk)
+    instrument.gauge('download.bytes', received, 'B', source='chs')
+    os.replace(part, fpath)
+    return fpath
+
+
+def insert_chs(filepath, south, north, west, east):
+    """ decode a downloaded bathymetry geotiff and insert it into the database """
+    conn, db = database_cfg()
+    # open image and interpret pixels as elevation
+    with instrument.timer('parse', source='chs'):
+        im = Image.open(filepath)
+        raster = read_raster(im)
+    val, mask = raster.data, np.flip(raster.mask, axis=0)
+
+    # generate latlon arrays
+    file_south, file_west = parse_sw_corner(filepath)
+    dlat = 0.001
+    if file_south < 68:
+        dlon = 0.001
+    elif file_south >=68 and file_south < 80:
+        dlon = 0.002
+    elif file_south >= 80:
+        dlon = 0.004
+    file_xmax = im.size[0] * dlon + file_west
+    file_ymax = im.size[1] * dlat + file_south
+    file_lon = np.linspace(start=file_west,  stop=file_xmax, num=im.size[0])
+    file_lat = np.linspace(start=file_south, stop=file_ymax, num=im.size[1])
+
+    # select non-masked entries, remove missing, build grid
+    z1 = np.flip(val, axis=0)
+    x1, y1 = np.meshgrid(file_lon, file_lat)
+    x2, y2, z2 = x1[~mask], y1[~mask], np.abs(z1[~mask])
+
+    # insert into db
+    n, dups = bulk_insert(conn, chs_table, [z2, y2, x2], 'chs')
+    logging.info(f"CHS {filepath.split('/')[-1]} bathymetry in region "
+          f"{fmt_coords(dict(south=south,west=west,north=north,east=east))}. "
+          f"processed and inserted {n} rows. "
+          f"{np.count_nonzero(mask)} null values removed, "
+          f"{dups} duplicate rows ignored")
+
+
 def fetch_chs(south, north, west, east, band_id=1):
     """ download bathymetric geotiffs, process them, and insert into db
 
+        tiles are downloaded concurrently, each download thread using 
+        its own http session. each tile is decoded and inserted into the 
+        database as soon as its download completes, while the remaining 
+        downloads continue
+
         args:
             south, north: float
                 ymin, ymax coordinate boundaries. range: -90, 90
@@ -51,14 +165,14 @@ def fetch_chs(south, north, west, east, band_id=1):
         return: 
             True if new data was downloaded and processed, else False
     """
+    session = chs_session()
 
     # api call: get raster IDs within bounding box
-    source = "https://gisp.dfo-mpo.gc.ca/arcgis/rest/services/FGP/CHS_NONNA_100/"
     spatialRel = "esriSpatialRelIntersects"
     spatialReference = "4326"  # WGS-84 spec
     geometry = json.dumps({"xmin":west, "ymin":south, "xmax":east, "ymax":north})
-    url1 = f"{source}ImageServer/query?geometry={geometry}&returnIdsOnly=true&geometryType=esriGeometryEnvelope&spatialRel={spatialRel}&f=json&outFields=*&inSR={spatialReference}"
-    req1 = requests.get(url1)
+    url1 = f"{chs_src}ImageServer/query?geometry={geometry}&returnIdsOnly=true&geometryType=esriGeometryEnvelope&spatialRel={spatialRel}&f=json&outFields=*&inSR={spatialReference}"
+    req1 = session.get(url1)
     assert(req1.status_code == 200)
     assert("error" not in json.loads(req1.text).keys())
 
@@ -68,8 +182,9 @@ def fetch_chs(south, north, west, east, band_id=1):
     assert(len(rasterIds) > 0)
     for chunk in range(0, int(len(rasterIds) / 20) + 1):  # max request size is 20 at a time
         rasterIdsCSV = ','.join([f"{x}" for x in rasterIds[chunk * 20:(chunk+1) * 20]])
-        url2 = f"{source}ImageServer/download?geometry={geometry}&geometryType=esriGeometryPolygon&format=TIFF&f=json&rasterIds={rasterIdsCSV}"
-        req2 = requests.get(url2)
+        if rasterIdsCSV == '': continue
+        url2 = f"{chs_src}ImageServer/download?geometry={geometry}&geometryType=esriGeometryPolygon&format=TIFF&f=json&rasterIds={rasterIdsCSV}"
+        req2 = session.get(url2)
         assert(req2.status_code == 200)
         jsondata = json.loads(req2.text)
         assert("error" not in jsondata.keys())
@@ -77,71 +192,34 @@ def fetch_chs(south, north, west, east, band_id=1):
 
     # api call: for each tiff image, download the associated rasters
     filepaths = []
-    imgnum = 1
-    for img in imgs:
-        fname = img['id'].split('\\')[-1]
-        fpath = f"{storage_cfg()}{fname}"
-        filepaths.append(fpath)
-        if os.path.isfile(fpath): 
-            logging.info(f'CHS {fname} bathymetry: file found, skipping download')
-        else:
-            logging.info(f"CHS bathymetry: downloading {imgnum}/{len(imgs)} "
-                          "from CHS NONNA-100...")
+    downloads = {}
+    sessions = []
+    with ThreadPoolExecutor(max_workers=chs_workers, 
+            initializer=open_worker_session, initargs=(sessions,)) as executor:
+        for img in imgs:
+            fname = img['id'].split('\\')[-1]
+            fpath = f"{storage_cfg()}{fname}"
+            filepaths.append(fpath)
+            if os.path.isfile(fpath): 
+                logging.info(f'CHS {fname} bathymetry: file found, skipping download')
+                continue
             assert(len(img['rasterIds']) == 1)
-            url3 = f"{source}ImageServer/file?id={img['id'][0:]}&rasterId={img['rasterIds'][0]}"
-            tiff = requests.get(url3)
-            assert(tiff.status_code == 200)
-            with open(fpath, "wb") as f: f.write(tiff.content)
-            imgnum += 1
-
-    logging.info(f'CHS bathymetry: processing {len(filepaths)} '
-                 f'file{"s" if len(filepaths)!=1 else ""}')
-
-    # read downloaded files and process them for DB insertion
-    for filepath in filepaths:
-        # open image and interpret pixels as elevation
-        im = Image.open(filepath)
-        nan = float(im.tag[42113][0])
-        val = np.ndarray((im.size[0], im.size[1]))
-        for yi in range(im.size[1]):
-            val[:,yi] = np.array(list(map(im.getpixel, zip(
-                    [yi for xi in range(im.size[0])], 
-                    range(im.size[1])))))
-        mask = np.flip(val == nan, axis=0)
-
-        # generate latlon arrays
-        file_south, file_west = parse_sw_corner(filepath)
-        dlat = 0.001
-        if file_south < 68:
-            dlon = 0.001
-        elif file_south >=68 and file_south < 80:
-            dlon = 0.002
-        elif file_south >= 80:
-            dlon = 0.004
-        file_xmax = im.size[0] * dlon + file_west
-        file_ymax = im.size[1] * dlat + file_south
-        file_lon = np.linspace(start=file_west,  stop=file_xmax, num=im.size[0])
-        file_lat = np.linspace(start=file_south, stop=file_ymax, num=im.size[1])
-
-        # select non-masked entries, remove missing, build grid
-        z1 = np.flip(val, axis=0)
-        x1, y1 = np.meshgrid(file_lon, file_lat)
-        x2, y2, z2 = x1[~mask], y1[~mask], np.abs(z1[~mask])
-        source = ['chs' for z in z2]
-        grid = list(map(tuple, np.vstack((z2, y2, x2, source)).T))
-
-        # insert into db
-        n1 = db.execute(f"SELECT COUNT(*) FROM {chs_table}").fetchall()[0][0]
-        db.executemany(f"INSERT OR IGNORE INTO {chs_table} VALUES (?,?,?,?)", grid)
-        n2 = db.execute(f"SELECT COUNT(*) FROM {chs_table}").fetchall()[0][0]
-        db.execute("COMMIT")
-        conn.commit()
-        logging.info(f"CHS {filepath.split('/')[-1]} bathymetry in region "
-              f"{fmt_coords(dict(south=south,west=west,north=north,east=east))}. "
-              f"processed and inserted {n2-n1} rows. "
-              f"{len(z1[~mask]) - len(grid)} null values removed, "
-              f"{len(grid) - (n2-n1)} duplicate rows ignored")
+            url3 = f"{chs_src}ImageServer/file?id={img['id'][0:]}&rasterId={img['rasterIds'][0]}"
+            downloads[executor.submit(download_tile_worker, url3, fpath)] = fpath
+
+        logging.info(f"CHS bathymetry: downloading {len(downloads)}/{len(filepaths)} "
+                      "files from CHS NONNA-100...")
+
+        # process previously downloaded files while downloads are in flight
+        for filepath in filepaths:
+            if filepath not in downloads.values(): 
+                insert_chs(filepath, south, north, west, east)
+
+        # process the downloaded files as they complete
+        for future in as_completed(downloads):
+            insert_chs(future.result(), south, north, west, east)
 
+    for s in sessions + [session]: s.close()
     return True
 
 
@@ -162,6 +240,7 @@ def load_chs(south, north, west, east):
             lon:
                 x-grid coordinate values
     """
+    conn, db = database_cfg()
     # check for missing data
     qryargs = dict(
             south=south, west=west,
@@ -171,20 +250,17 @@ def load_chs(south, north, west, east):
             'bathy', 'chs', parallel=False, **qryargs)
 
     # load the data
-    db.execute(' AND '.join([f"SELECT * FROM {chs_table} WHERE lat >= ?",
-                                                              "lat <= ?",
-                                                              "lon >= ?",
-                                                              "lon <= ?"]),
-               tuple(map(str, [south, north, west, east])))
-    
-    rowdata = np.array(db.fetchall(), dtype=object).T
+    rowdata = query_rows(db, ' AND '.join([
+                        f"SELECT val, lat, lon FROM {chs_table} WHERE lat >= ?",
+                                                                  "lat <= ?",
+                                                                  "lon >= ?",
+                                                                  "lon <= ?"]),
+               tuple(map(str, [south, north, west, east])), table=chs_table)
     #assert len(rowdata) == 4, "no data found for query range"
-    if len(rowdata) == 0:
+    if rowdata.shape[1] == 0:
         logging.warning('CHS bathymetry: no data found, returning empty arrays')
-        return np.array([[],[],[],[]])
 
-    bathy, lat, lon, source = rowdata
-    return np.array((bathy, lat, lon)).astype(float)
+    return rowdata
 
 
 class Chs():
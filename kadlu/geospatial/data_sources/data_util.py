@@ -7,6 +7,7 @@ import sys
 import json
 import pickle
 import sqlite3
+import threading
 #import logging
 import warnings
 import configparser
@@ -20,6 +21,8 @@ from io import StringIO
 
 import numpy as np
 
+from kadlu import instrument
+
 
 #LOGLEVEL = os.environ.get('LOGLEVEL', 'INFO')
 #logging.basicConfig(format='%(asctime)s  %(message)s', level=LOGLEVEL, datefmt='%Y-%m-%d %I:%M:%S')
@@ -27,7 +30,7 @@ import numpy as np
 
 # database tables for data fetching and loading
 chs_table    = 'chs_bathy'
-#hycom_tables = ['salinity', 'water_temp', 'water_u', 'water_v']
+hycom_tables = ['hycom_salinity', 'hycom_water_temp', 'hycom_water_u', 'hycom_water_v']
 wwiii_tables = ['hs', 'dp', 'tp', 'windU', 'windV']
 era5_tables  = [
         'significant_height_of_combined_wind_waves_and_swell',
@@ -37,6 +40,31 @@ era5_tables  = [
         'v_component_of_wind'
     ]
 
+# derived tables containing the magnitude of u, v component pairs,
+# materialized when the components are inserted
+uv_tables = dict(
+        wind_speed  = ('u_component_of_wind', 'v_component_of_wind'),
+        windUV      = ('windU', 'windV'),
+    )
+hycom_uv_tables = dict(
+        hycom_water_uv = ('hycom_water_u', 'hycom_water_v'),
+    )
+hycom_uv_cols = ('lat', 'lon', 'time', 'depth')
+
+
+class ThreadConnections(dict):
+    """ open database connections of a thread, keyed by filepath and
+        process. the connections are closed when the thread exits and
+        its thread-local data is released. connections inherited from a
+        parent process are left to the parent
+    """
+    def __del__(self):
+        for (dbpath, pid), (conn, db) in self.items():
+            if pid == os.getpid(): conn.close()
+
+# database connections of the current thread, see ThreadConnections
+connections = threading.local()
+
 
 cfg = configparser.ConfigParser()       # read .ini into dictionary object
 cfgfile = os.path.join(dirname(dirname(dirname(dirname(__file__)))), "config.ini")
@@ -44,6 +72,11 @@ cfg.read(cfgfile)
 
 
 
+# number of rows staged at a time by bulk_insert. configure in config.ini
+# with 'batch_size = N' in section [database]
+batch_size = cfg.getint('database', 'batch_size', fallback=100000)
+
+
 ext = lambda filepath, extensions: isinstance(extensions, tuple) and any(x == filepath.lower()[-len(x):] for x in extensions)
 
 
@@ -93,14 +126,25 @@ def database_cfg():
         time is stored as an integer in the database, where each value
         is epoch hours since 2000-01-01 00:00
 
+        the database is opened and its tables are created on the first 
+        call. later calls from the same process and thread return the 
+        same connection, which is closed once the thread exits
+
         returns:
             conn:   
                 database connection object
             db:
                 connection cursor object
     """
-    conn = sqlite3.connect(storage_cfg() + 'geospatial.db')
+    dbpath = storage_cfg() + 'geospatial.db'
+    key = (dbpath, os.getpid())
+    if not hasattr(connections, 'open'): connections.open = ThreadConnections()
+    if key in connections.open: return connections.open[key]
+
+    # the connection may be closed by another thread, once its own has exited
+    conn = sqlite3.connect(dbpath, check_same_thread=False)
     db = conn.cursor()
+    existing = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='table'")]
 
     # bathymetry table (CHS)
     db.execute(f'CREATE TABLE IF NOT EXISTS {chs_table} ' 
@@ -113,7 +157,7 @@ def database_cfg():
 
 
     # wave data tables
-    for var in era5_tables + wwiii_tables:
+    for var in era5_tables + wwiii_tables + list(uv_tables.keys()):
         db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
                     '( val     REAL    NOT NULL, ' 
                     '  lat     REAL    NOT NULL, ' 
@@ -123,9 +167,166 @@ def database_cfg():
         db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
                    f'idx_{var} on {var}(time, lon, lat, val, source)')
 
+    # ocean data tables (HYCOM)
+    for var in hycom_tables + list(hycom_uv_tables.keys()):
+        db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
+                    '( val     REAL NOT NULL,' 
+                    '  lat     REAL NOT NULL,' 
+                    '  lon     REAL NOT NULL,' 
+                    '  time    INT  NOT NULL,' 
+                    '  depth   INT  NOT NULL,' 
+                    '  source  TEXT NOT NULL )')
+        db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
+                   f'idx_{var} on {var}(time, lon, lat, depth, val, source)')
+
+    # populate new derived tables from previously fetched components
+    for var, (u, v) in uv_tables.items():
+        if var not in existing and u in existing and v in existing:
+            derive_uv(conn, var, u, v)
+    for var, (u, v) in hycom_uv_tables.items():
+        if var not in existing and u in existing and v in existing:
+            derive_uv(conn, var, u, v, cols=hycom_uv_cols)
+
+    connections.open[key] = conn, db
     return conn, db
 
 
+def derive_uv(conn, table, u, v, kwargs=None, cols=('lat', 'lon', 'time')):
+    """ materialize the magnitude sqrt(u^2 + v^2) of component pairs
+
+        rows of the u and v tables with matching coordinates are joined,
+        and their magnitude is inserted into the derived table, ignoring
+        duplicates. this is done once when the components are inserted,
+        so that loading the magnitude is a range read of a single table
+
+        args:
+            conn: sqlite3.Connection
+                database connection
+            table: string
+                name of the derived table
+            u, v: string
+                names of the component tables
+            kwargs: dict
+                if given, only rows within the south, north, west, east,
+                start, end boundaries are joined
+            cols: tuple
+                coordinate columns used to match the components
+
+        return:
+            number of rows inserted
+    """
+    on = ' AND '.join(f'{u}.{c} == {v}.{c}' for c in cols)
+    sql = (f'INSERT OR IGNORE INTO {table} SELECT '
+           f'sqrt({u}.val * {u}.val + {v}.val * {v}.val), '
+           + ', '.join(f'{u}.{c}' for c in cols) + f', {u}.source '
+           f'FROM {u} INNER JOIN {v} ON {on} AND {u}.source == {v}.source')
+    args = ()
+    if kwargs is not None:
+        lon = 'AND' if kwargs['west'] <= kwargs['east'] else 'OR'
+        sql += (f' WHERE {u}.time >= ? AND {u}.time <= ? AND {u}.lat >= ? '
+                f'AND {u}.lat <= ? AND ({u}.lon >= ? {lon} {u}.lon <= ?)')
+        args = (dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end']),
+                kwargs['south'], kwargs['north'], kwargs['west'], kwargs['east'])
+    db = conn.cursor()
+    with conn:
+        db.execute(sql, args)
+        return db.execute('SELECT changes()').fetchone()[0]
+
+
+def bulk_insert(conn, table, columns, source, batch=None):
+    """ insert column arrays into a table, ignoring duplicate rows
+
+        rows are written in batches to a temporary staging table, and each
+        batch is merged into the target table with a single 
+        INSERT OR IGNORE ... SELECT statement. the source string is bound
+        once per batch instead of being repeated for each row. all batches
+        are committed in one transaction. row counts are obtained from 
+        changes(), so the cost of insertion does not depend on the size of
+        the target table
+
+        args:
+            conn: sqlite3.Connection
+                database connection
+            table: string
+                name of the target table
+            columns: list of arrays
+                column values ordered as in the table, excluding the 
+                source column. arrays should be cast to the column types,
+                e.g. integer time
+            source: string
+                data source name stored in the source column
+            batch: int
+                number of rows staged at a time. defaults to batch_size
+
+        return:
+            inserted: int
+                number of new rows
+            duplicates: int
+                number of rows ignored as duplicates
+    """
+    batch = batch or batch_size
+    columns = [np.asarray(col) for col in columns]
+    n = len(columns[0]) if len(columns) > 0 else 0
+    names = ', '.join(f'c{i}' for i in range(len(columns)))
+    stage = f'stage_{table}'
+
+    db = conn.cursor()
+    db.execute(f'CREATE TEMP TABLE IF NOT EXISTS {stage} ({names})')
+    inserted = 0
+    with instrument.timer('db.insert', table=table, source=source), conn:
+        for i in range(0, n, batch):
+            db.executemany(f'INSERT INTO {stage} VALUES ({", ".join("?" * len(columns))})',
+                    zip(*(col[i:i+batch].tolist() for col in columns)))
+            db.execute(f'INSERT OR IGNORE INTO {table} SELECT {names}, ? FROM {stage}', 
+                    (source, ))
+            inserted += db.execute('SELECT changes()').fetchone()[0]
+            db.execute(f'DELETE FROM {stage}')
+    instrument.gauge('db.rows', inserted, table=table, source=source)
+    instrument.gauge('db.duplicates', n - inserted, table=table, source=source)
+    return inserted, n - inserted
+
+
+def query_rows(db, sql, args=(), table=None, batch=None):
+    """ run a select query and read the result into a float array
+
+        rows are read with fetchmany into an array sized from the first
+        batch, whose capacity is doubled as needed, so that the query
+        runs once and the full result is never held as python objects.
+        all selected columns must be numeric
+
+        args:
+            db: sqlite3.Cursor
+                database cursor
+            sql: string
+                select statement
+            args: tuple
+                query parameters
+            table: string
+                table name, used to label the query timings
+            batch: int
+                number of rows read at a time. defaults to batch_size
+
+        return:
+            array with one row for each selected column
+    """
+    batch = batch or batch_size
+    with instrument.timer('db.query', table=table):
+        db.execute(sql, args)
+        rows = db.fetchmany(batch)
+        rowdata = np.empty((len(db.description), len(rows)))
+        i = 0
+        while len(rows) > 0:
+            if i + len(rows) > rowdata.shape[1]:
+                grow = max(rowdata.shape[1], len(rows))
+                rowdata = np.concatenate((rowdata, np.empty((len(rowdata), grow))), axis=1)
+            rowdata[:, i:i+len(rows)] = np.array(rows, dtype=float).T
+            i += len(rows)
+            rows = db.fetchmany(batch)
+        if i < rowdata.shape[1]: rowdata = rowdata[:, :i].copy()
+    instrument.gauge('db.rows', i, table=table)
+    return rowdata
+
+
 def bin_db():
     """ database for storing serialized objects in memory 
         
@@ -202,19 +403,59 @@ def serialized(kwargs={}, seed=''):
     return True
 
 
+def floor_hour(t):
+    """ round a datetime down to a whole hour """
+    return t.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(t):
+    """ round a datetime up to a whole hour """
+    return floor_hour(t) if floor_hour(t) == t else floor_hour(t) + timedelta(hours=1)
+
+
 def dt_2_epoch(dt_arr, t0=datetime(2000,1,1,0,0,0)):
-    """ convert datetimes to epoch hours """
-    delta = lambda dt: (dt - t0).total_seconds()/60/60
-    if isinstance(dt_arr, (list, np.ndarray)): return list(map(int, map(delta, dt_arr)))
-    elif isinstance(dt_arr, (datetime)): return int(delta(dt_arr))
+    """ convert datetimes to epoch hours
+
+        conversion is vectorized with numpy datetime64. hours are 
+        truncated towards zero
+
+        args:
+            dt_arr: datetime, datetime64, or list/array of either
+                datetimes to be converted
+            t0: datetime
+                epoch. defaults to 2000-01-01 00:00
+
+        return:
+            integer for scalar input, otherwise an array of int64
+    """
+    if isinstance(dt_arr, (datetime, np.datetime64)):
+        return int(dt_2_epoch(np.array([dt_arr]), t0)[0])
+    elif isinstance(dt_arr, (list, tuple, np.ndarray)):
+        delta = np.asarray(dt_arr, dtype='datetime64[us]') - np.datetime64(t0, 'us')
+        return (delta // np.timedelta64(1, 'us') / 3.6e9).astype(np.int64)
     else: raise ValueError('input must be datetime or array of datetimes')
 
 
 def epoch_2_dt(ep_arr, t0=datetime(2000,1,1,0,0,0)):
-    """ convert epoch hours to datetimes """
-    delta = lambda ep : t0 + timedelta(hours=ep)
-    if isinstance(ep_arr, (list, np.ndarray)): return list(map(delta, ep_arr))
-    elif isinstance(ep_arr, (float, int)): return delta(ep_arr)
+    """ convert epoch hours to datetimes
+
+        conversion is vectorized with numpy datetime64, at a resolution
+        of one microsecond
+
+        args:
+            ep_arr: number, or list/array of numbers
+                epoch hours to be converted
+            t0: datetime
+                epoch. defaults to 2000-01-01 00:00
+
+        return:
+            datetime for scalar input, otherwise an array of datetimes
+    """
+    if isinstance(ep_arr, (list, tuple, np.ndarray)):
+        delta = np.round(np.asarray(ep_arr, dtype=float) * 3.6e9).astype('timedelta64[us]')
+        return (np.datetime64(t0, 'us') + delta).astype(datetime)
+    elif isinstance(ep_arr, (float, int, np.number)) and not isinstance(ep_arr, bool):
+        return epoch_2_dt(np.array([ep_arr]), t0)[0]
     else: raise ValueError('input must be integer or array of integers')
 
 
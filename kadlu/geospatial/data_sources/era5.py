@@ -9,6 +9,7 @@ import os
 import logging
 import warnings
 import configparser
+from hashlib import md5
 from os.path import isfile, dirname
 from datetime import datetime, timedelta
 
@@ -17,8 +18,13 @@ import pygrib
 import numpy as np
 
 import kadlu.geospatial.data_sources.fetch_handler
+from kadlu import instrument
 from kadlu.geospatial.data_sources.data_util    import              \
         database_cfg,                                               \
+        bulk_insert,                                                \
+        query_rows,                                                 \
+        derive_uv,                                                  \
+        uv_tables,                                                  \
         storage_cfg,                                                \
         insert_hash,                                                \
         serialized,                                                 \
@@ -32,7 +38,6 @@ from kadlu.geospatial.data_sources.data_util    import              \
 
 logging.getLogger('cdsapi').setLevel(logging.WARNING)
 
-conn, db = database_cfg()
 
 era5_varmap = dict(zip(
         ('significant_height_of_combined_wind_waves_and_swell',
@@ -43,6 +48,11 @@ era5_varmap = dict(zip(
          ),
         ('waveheight', 'wavedir', 'waveperiod', 'wind_u', 'wind_v')))
 
+# grib message short names of each variable, used to split downloaded files
+era5_shortnames = dict(zip(
+        ('swh', 'mwd', 'mwp', '10u', '10v'),
+        tuple(era5_varmap.keys())))
+
 
 cfg = configparser.ConfigParser()       # read .ini into dictionary object
 cfgfile = os.path.join(dirname(dirname(dirname(dirname(__file__)))), "config.ini")
@@ -73,11 +83,97 @@ def era5_cfg(key=None, url=None):
     return 
 
 
+def bbox_index(msg, kwargs):
+    """ index the grid of a grib message within the query boundaries
+
+        grib longitudes are adjusted from 0..360 to -180..180. the 
+        returned indices can be used to slice the values of any message
+        sharing the same grid
+
+        args:
+            msg: pygrib message
+                message on a regular lat/lon grid
+            kwargs: dict
+                query boundaries containing south, north, west, east
+
+        return:
+            rows, cols: arrays
+                latitude and longitude indices within the boundaries
+            lat, lon: arrays
+                latitude and longitude axes of the grid
+    """
+    lats, lons = msg.latlons()
+    lat = lats[:,0]
+    lon = ((lons[0,:] + 180) % 360) - 180
+    rows = np.nonzero((lat >= kwargs['south']) & (lat <= kwargs['north']))[0]
+    cols = np.nonzero((lon >= kwargs['west'])  & (lon <= kwargs['east']))[0]
+    return rows, cols, lat, lon
+
+
+def grid_key(msg):
+    """ describe the lat/lon grid of a grib message from its header """
+    return tuple(msg[k] for k in ('Ni', 'Nj',
+            'latitudeOfFirstGridPointInDegrees', 'longitudeOfFirstGridPointInDegrees',
+            'latitudeOfLastGridPointInDegrees',  'longitudeOfLastGridPointInDegrees'))
+
+
+def plan_era5(variables, kwargs):
+    """ plan the CDS retrieval requests needed to fetch a query
+
+        all variables are merged into a single request per month, 
+        restricted to the query area. the area is rounded outwards to
+        the 0.5° wave model grid, which is shared by the 0.25° 
+        atmospheric grid
+
+        args:
+            variables: list of strings
+                variable names according to ERA5 docs
+            kwargs: dict
+                query boundaries containing south, north, west, east, 
+                start, end
+
+        return:
+            list of (filename, request) tuples. request is the 
+            dictionary passed to cdsapi.Client.retrieve
+    """
+    area = [np.ceil(kwargs['north']*2)/2, np.floor(kwargs['west']*2)/2,
+            np.floor(kwargs['south']*2)/2, np.ceil(kwargs['east']*2)/2]
+    days = []
+    t = datetime(kwargs['start'].year, kwargs['start'].month, kwargs['start'].day)
+    while t <= kwargs['end'] and (t < kwargs['end'] or not days):
+        days.append(t)
+        t += timedelta(days=1)
+
+    plan = []
+    for month in sorted(set((d.year, d.month) for d in days)):
+        mdays = [d for d in days if (d.year, d.month) == month]
+        request = {
+                'product_type' : 'reanalysis',
+                'format'       : 'grib',
+                'variable'     : sorted(variables),
+                'year'         : f'{month[0]:04d}',
+                'month'        : f'{month[1]:02d}',
+                'day'          : [d.strftime('%d') for d in mdays],
+                'time'         : [f'{h:02d}:00' for h in range(24)],
+                'area'         : [float(a) for a in area],
+            }
+        key = md5(repr(sorted(request.items())).encode('utf-8')).hexdigest()[:8]
+        fname = (f'ERA5_reanalysis_{mdays[0].strftime("%Y-%m-%d")}_'
+                 f'{mdays[-1].strftime("%Y-%m-%d")}_{key}.grb2')
+        plan.append((fname, request))
+
+    return plan
+
+
 def fetch_era5(var, kwargs):
-    """ fetch global era5 data for specified variable and time range
+    """ fetch era5 data for specified variables within the query boundaries
+
+        variables are retrieved together, using one request per month
+        of the query range restricted to the query area. the downloaded
+        file is split per variable when inserted into the database
 
         args:
-            var: string
+            var: string or list of strings
                 the variable short name of desired wave parameter 
                 according to ERA5 docs.  the complete list can be found 
                 here (table 7 for wave params):
@@ -104,80 +200,97 @@ def fetch_era5(var, kwargs):
 
     assert 6 == sum(map(lambda kw: kw in kwargs.keys(), 
         ['south', 'north', 'west', 'east', 'start', 'end'])), 'malformed query'
-    t = datetime(kwargs['start'].year,   kwargs['start'].month,
-                 kwargs['start'].day,    kwargs['start'].hour)
-    assert kwargs['end'] - kwargs['start'] <= timedelta(days=1, hours=1), \
-            'use fetch_handler for this instead'
+    t = datetime(kwargs['start'].year, kwargs['start'].month, 1)
+    assert kwargs['end'] <= datetime(t.year + t.month // 12, t.month % 12 + 1, 1), \
+            'query must be contained within one month, use fetch_handler for this'
         
     # check if data has been fetched already
-    if serialized(kwargs, f'fetch_era5_{era5_varmap[var]}'): return False
+    variables = [var] if isinstance(var, str) else list(var)
+    variables = [v for v in variables 
+                 if not serialized(kwargs, f'fetch_era5_{era5_varmap[v]}')]
+    if len(variables) == 0: return False
 
     # fetch the data
-    fname = f'ERA5_reanalysis_{var}_{t.strftime("%Y-%m-%d")}.grb2'
-    fpath = f'{storage_cfg()}{fname}'
-    if not isfile(fpath):
-        with dev_null():
-            c.retrieve('reanalysis-era5-single-levels', {
-                       'product_type' : 'reanalysis',
-                       'format'       : 'grib',
-                       'variable'     : var,
-                       'year'         : t.strftime("%Y"),
-                       'month'        : t.strftime("%m"),
-                       'day'          : t.strftime("%d"),
-                       'time'         : [datetime(t.year, t.month, t.day, h)
-                                         .strftime('%H:00') for h in range(24)]
-                    }, fpath)
-    
-    # load the data file and insert it into the database
-    assert isfile(fpath)
-    grb = pygrib.open(fpath)
-    agg = np.array([[],[],[],[],[]])
-    table = var[4:] if var[0:4] == '10m_' else var
-
-    for msg, num in zip(grb, range(1, grb.messages)):
-        if msg.validDate < kwargs['start'] or msg.validDate > kwargs['end']: 
-            continue
-
-        # read grib data
-        z, y, x = msg.data()
-        if np.ma.is_masked(z):
-            z2 = z[~z.mask].data
-            y2 = y[~z.mask]
-            x2 = x[~z.mask]
-        else:  # wind data has no mask
-            z2 = z.reshape(-1)
-            y2 = y.reshape(-1)
-            x2 = x.reshape(-1)
-
-        # adjust latitude-zero to 180th meridian
-        x3 = ((x2 + 180) % 360) - 180
-
-        # index coordinates, select query range subset, aggregate results
-        xix = np.logical_and(x3>=kwargs['west'],  x3<=kwargs['east'])
-        yix = np.logical_and(y2>=kwargs['south'], y2<=kwargs['north'])
-        idx = np.logical_and(xix, yix)
-        agg = np.hstack((agg, [z2[idx],
-                               y2[idx],
-                               x3[idx],
-                               dt_2_epoch([msg.validDate for i in z2[idx]]),
-                               ['era5' for i in z2[idx]]]))
+    for fname, request in plan_era5(variables, kwargs):
+        fpath = f'{storage_cfg()}{fname}'
+        if not isfile(fpath):
+            logging.info(f'ERA5 {kwargs["start"].date().isoformat()}: requesting '
+                         f'{", ".join(request["variable"])} in region {fmt_coords(kwargs)}')
+            with instrument.timer('download', source='era5'), dev_null():
+                c.retrieve('reanalysis-era5-single-levels', request, fpath)
+            instrument.gauge('download.bytes', os.path.getsize(fpath), 'B', source='era5')
+        assert isfile(fpath)
+        insert_era5(fpath, variables, kwargs)
+
+    for v in variables: insert_hash(kwargs, f'fetch_era5_{era5_varmap[v]}')
+    return True
 
-    # perform the insertion
-    if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
-    n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.executemany(f"INSERT OR IGNORE INTO {table} "
-                   f"VALUES (?,?,?,CAST(? AS INT),?)", agg.T)
-    n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.execute("COMMIT")
-    conn.commit()
-    insert_hash(kwargs, f'fetch_era5_{era5_varmap[var]}')
-    if 'lock' in kwargs.keys(): kwargs['lock'].release()
-
-    logging.info(f"ERA5 {msg.validDate.date().isoformat()} {var}: "
-                 f"processed and inserted {n2-n1} rows in region {fmt_coords(kwargs)}. "
-                 f"{len(agg[0])- (n2-n1)} duplicates ignored")
 
-    return True
+def insert_era5(fpath, variables, kwargs):
+    """ split a downloaded era5 file by variable and insert the values 
+        within the query boundaries into the database
+
+        args:
+            fpath: string
+                complete filepath of the grib file
+            variables: list of strings
+                variable names to be inserted. messages of other variables
+                are skipped
+            kwargs: dict
+                query boundaries containing south, north, west, east, 
+                start, end
+    """
+    conn, db = database_cfg()
+    with instrument.timer('parse', source='era5'):
+        grb = pygrib.open(fpath)
+
+        # collect output columns for each variable
+        grids = {}
+        columns = {v: [] for v in variables}
+
+        for msg in grb:
+            # message headers are read without decoding the values
+            v = era5_shortnames.get(msg['shortName'])
+            if v not in columns: continue
+            if msg.validDate < kwargs['start'] or msg.validDate > kwargs['end']: 
+                continue
+
+            # variables may be on different grids (e.g. 0.25° atmosphere 
+            # and 0.5° wave fields): index each grid only once
+            key = grid_key(msg)
+            if key not in grids:
+                rows, cols, lat, lon = bbox_index(msg, kwargs)
+                grids[key] = (rows, cols, *np.meshgrid(lat[rows], lon[cols], indexing='ij'))
+            rows, cols, ygrid, xgrid = grids[key]
+
+            # read the query range subset of the grib data
+            z = msg.values[rows][:, cols]
+            keep = ~np.ma.getmaskarray(z)  # wind data has no mask
+            columns[v].append((np.ma.getdata(z)[keep], ygrid[keep], xgrid[keep],
+                               np.full(np.count_nonzero(keep), dt_2_epoch(msg.validDate))))
+
+        grb.close()
+
+    # perform the insertion
+    for v in variables:
+        table = v[4:] if v[0:4] == '10m_' else v
+        if len(columns[v]) > 0: 
+            val, y, x, epoch = map(np.concatenate, zip(*columns[v]))
+        else: 
+            val, y, x, epoch = np.empty((4, 0))
+        if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
+        n, dups = bulk_insert(conn, table, [val, y, x, epoch.astype(np.int64)], 'era5')
+        if 'lock' in kwargs.keys(): kwargs['lock'].release()
+
+        logging.info(f"ERA5 {kwargs['start'].date().isoformat()} {v}: "
+                     f"processed and inserted {n} rows in region {fmt_coords(kwargs)}. "
+                     f"{dups} duplicates ignored")
+
+    # materialize wind speed from the wind components
+    if any('component_of_wind' in v for v in variables):
+        if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
+        derive_uv(conn, 'wind_speed', *uv_tables['wind_speed'], kwargs)
+        if 'lock' in kwargs.keys(): kwargs['lock'].release()
 
 
 def load_era5(var, kwargs):
@@ -201,6 +314,7 @@ def load_era5(var, kwargs):
             epoch:
                 timestamps in epoch hours since jan 1 2000
     """
+    conn, db = database_cfg()
     if 'time' in kwargs.keys() and not 'start' in kwargs.keys():
         kwargs['start'] = kwargs['time']
         del kwargs['time']
@@ -211,30 +325,28 @@ def load_era5(var, kwargs):
         ['south', 'north', 'west', 'east', 'start', 'end'])), 'malformed query'
 
     # check for missing data
+    fetch_var = 'wind_uv' if var == 'wind_speed' else era5_varmap[var]
     kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
-            era5_varmap[var], 'era5', parallel=1, **kwargs)
+            fetch_var, 'era5', parallel=1, **kwargs)
 
     # load the data
     table = var[4:] if var[0:4] == '10m_' else var  # table cant start with int
-    sql = ' AND '.join([f"SELECT * FROM {table} WHERE lat >= ?",
+    sql = ' AND '.join([f"SELECT val, lat, lon, time FROM {table} WHERE lat >= ?",
         'lat <= ?',
         'lon >= ?',
         'lon <= ?',
         'time >= ?',
         'time <= ?']) + ' ORDER BY time, lat, lon ASC'
-    db.execute(sql, tuple(map(str, [
+    rowdata = query_rows(db, sql, tuple(map(str, [
             kwargs['south'],                kwargs['north'], 
             kwargs['west'],                 kwargs['east'], 
             dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end'])
-        ])))
-    rowdata = np.array(db.fetchall(), dtype=object).T
+        ])), table=table)
     #assert len(rowdata) > 0, "no data found for query"
-    if len(rowdata) == 0:
+    if rowdata.shape[1] == 0:
         logging.warning(f'ERA5 {var}: no data found in region {fmt_coords(kwargs)}, returning empty arrays')
-        return np.array([[],[],[],[]])
 
-    val, lat, lon, epoch, source = rowdata 
-    return np.array((val, lat, lon, epoch), dtype=np.float)
+    return rowdata
 
 
 class Era5():
@@ -250,8 +362,8 @@ class Era5():
     def fetch_wind_v(self, **kwargs):
         return fetch_era5('10m_v_component_of_wind', kwargs)
     def fetch_wind_uv(self, **kwargs):
-        return fetch_era5('10m_u_component_of_wind', kwargs) and\
-               fetch_era5('10m_v_component_of_wind', kwargs)
+        return fetch_era5(['10m_u_component_of_wind', 
+                           '10m_v_component_of_wind'], kwargs)
 
     def load_windwaveswellheight(self, **kwargs):
         return load_era5('significant_height_of_combined_wind_waves_and_swell', kwargs)
@@ -264,37 +376,10 @@ class Era5():
     def load_wind_v(self, **kwargs):
         return load_era5('10m_v_component_of_wind', kwargs)
     def load_wind_uv(self, **kwargs):
-        """ an SQL join is used for loading wind data to deal with the
-            edge case where u,v coordinates are not in matching pairs in
-            the data. the JOIN ensures only values with a matching pair
-            are loaded
+        """ wind speed is materialized from matching pairs of u, v 
+            components when they are inserted
         """
-        kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
-                era5_varmap['10m_u_component_of_wind'], 'era5', parallel=1, **kwargs)
-        kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
-                era5_varmap['10m_v_component_of_wind'], 'era5', parallel=1, **kwargs)
-
-        sql = ' AND '.join(['SELECT u_component_of_wind.val, u_component_of_wind.lat, u_component_of_wind.lon, u_component_of_wind.time, v_component_of_wind.val FROM u_component_of_wind '\
-            'INNER JOIN v_component_of_wind '\
-            'ON u_component_of_wind.lat == v_component_of_wind.lat',
-            'u_component_of_wind.lon == v_component_of_wind.lon',
-            'u_component_of_wind.time == v_component_of_wind.time '\
-            'WHERE u_component_of_wind.lat >= ?',
-            'u_component_of_wind.lat <= ?',
-            'u_component_of_wind.lon >= ?',
-            'u_component_of_wind.lon <= ?',
-            'u_component_of_wind.time >= ?',
-            'u_component_of_wind.time <= ?']) + ' ORDER BY u_component_of_wind.time, u_component_of_wind.lat, u_component_of_wind.lon ASC'
-
-        db.execute(sql, tuple(map(str, [
-                kwargs['south'],                kwargs['north'], 
-                kwargs['west'],                 kwargs['east'], 
-                dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end'])
-            ])))
-
-        wind_u, lat, lon, epoch, wind_v = np.array(db.fetchall()).T
-        val = np.sqrt(np.square(wind_u), np.square(wind_v))
-        return np.array((val, lat, lon, epoch)).astype(float)
+        return load_era5('wind_speed', kwargs)
 
 
     def __str__(self):
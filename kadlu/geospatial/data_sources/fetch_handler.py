@@ -2,31 +2,161 @@
 
 import time
 import logging
+import threading
 from os import getpid
+from functools import partial
 from datetime import datetime, timedelta
 
 import numpy as np
 
 from kadlu.geospatial.data_sources import source_map
 from kadlu.geospatial.data_sources.data_util import serialized
+from kadlu.geospatial.data_sources.data_util import insert_hash
 from kadlu.geospatial.data_sources.data_util import fmt_coords
+from kadlu.geospatial.data_sources.data_util import hash_key as bin_key
 
 
-def bin_request(fetchfcn, hash_key, dx=2, dy=2, dt=timedelta(days=1), **kwargs):
+# bins are grouped by the source file containing their data, so that each 
+# file is only parsed once. ERA5 requests and WWIII files contain one month
+file_groups = dict(
+        era5  = lambda qry: (qry['start'].year, qry['start'].month),
+        wwiii = lambda qry: (qry['start'].year, qry['start'].month),
+    )
+
+# variables fetched together in a single request. bins are indexed with the
+# hash key of each variable, so that later requests for either are skipped
+batch_vars = dict(
+        wind_uv_era5 = ('wind_u', 'wind_v'),
+        water_uv_hycom = ('water_u', 'water_v'),
+    )
+
+
+# bins being fetched by a thread of this process, mapped by hash key to an
+# event that is set once the fetch is complete, and a list receiving the
+# exception raised if the fetch failed. concurrent requests for the same
+# bins wait for the first request instead of fetching them again
+inflight = {}
+inflight_lock = threading.Lock()
+
+
+def fetch_once(fetch, bins, keys):
+    """ fetch bins that are not being fetched by another thread, then
+        wait for the others to complete. if another thread fails to fetch
+        a bin, its exception is raised in the threads waiting for it
+
+        args:
+            fetch:
+                callable receiving the list of bins claimed by this thread
+            bins:
+                list of query dictionaries
+            keys:
+                tuple of hash key strings identifying the fetched data
+    """
+    claimed, waiting = [], []
+    with inflight_lock:
+        for qry in bins:
+            ids = [bin_key(qry, key) for key in keys]
+            busy = [inflight[i] for i in ids if i in inflight]
+            if busy: 
+                waiting += busy
+                continue
+            entry = (threading.Event(), [])
+            for i in ids: inflight[i] = entry
+            claimed.append((ids, entry, qry))
+    try:
+        if len(claimed) > 0: fetch([qry for _, _, qry in claimed])
+    except BaseException as err:
+        for _, (done, failed), _ in claimed: failed.append(err)
+        raise
+    finally:
+        with inflight_lock:
+            for ids, (done, failed), _ in claimed:
+                for i in ids: del inflight[i]
+                done.set()
+    for done, failed in waiting:
+        done.wait()
+        if failed: raise failed[0]
+
+
+def merge_bins(bins):
+    """ return the bounding query containing all of the given bins """
+    qry = bins[0].copy()
+    for key, fcn in (('west', min), ('east', max), ('south', min),
+                     ('north', max), ('start', min), ('end', max)):
+        qry[key] = fcn(b[key] for b in bins)
+    return qry
+
+
+# query keys of the lower and upper boundaries along each axis of a bin
+bin_axes = dict(time=('start', 'end'), lon=('west', 'east'), lat=('south', 'north'))
+
+
+def join_bins(blocks, axis):
+    """ join blocks of bins that are adjacent along an axis and have the 
+        same extent along the other axes
+
+        args:
+            blocks: list of lists of query dictionaries
+                each block of bins must fill its bounding query
+            axis: string
+                'time', 'lon', or 'lat'
+
+        return:
+            list of lists of query dictionaries. each block fills its
+            bounding query
+    """
+    lo, hi = bin_axes[axis]
+    groups = {}
+    for block in blocks:
+        box = merge_bins(block)
+        extent = tuple(box[k] for a in bin_axes.keys() if a != axis for k in bin_axes[a])
+        groups.setdefault(extent, []).append((box, block))
+    joined = []
+    for group in groups.values():
+        group.sort(key=lambda item: item[0][lo])
+        joined.append(list(group[0][1]))
+        for (prev, _), (box, block) in zip(group, group[1:]):
+            if prev[hi] == box[lo]: joined[-1] += block
+            else: joined.append(list(block))
+    return joined
+
+
+def contiguous_bins(bins):
+    """ split bins into blocks whose bounding queries contain no other bins,
+        e.g. bins already fetched between two pending bins. bins are joined
+        along time first, then longitude, then latitude
+    """
+    blocks = [[qry] for qry in bins]
+    for axis in bin_axes.keys(): blocks = join_bins(blocks, axis)
+    return blocks
+
+
+def bin_request(fetchfcn, hash_key, dx=2, dy=2, dt=timedelta(days=1), 
+        groupby=None, **kwargs):
     """ check fetch query hash history and generate fetch requests
 
         requests are batched into dx° * dy° * dt request bins,
         with the entire range of depths included in each bin.
         coordinates are rounded to nearest outer-boundary degree integer,
-        a query hash is stored if a fetch request is successful
+        a query hash is stored if a fetch request is successful.
+        bins already being fetched by another thread are not requested
+        again, the call returns once they are complete
 
         args:
+            hash_key:
+                string or tuple of strings identifying the fetched data.
+                a bin is pending if any of the keys has not been stored
             dx:
                 delta longitude bin size (int)
             dy: 
                 delta latitude bin size (int)
             dt:
                 delta time bin size (timedelta)
+            groupby:
+                callable mapping a bin to the source file containing its
+                data. if given, contiguous pending bins sharing a file
+                are fetched with a single bounding request and marked as
+                fetched together
 
         return: nothing
     """
@@ -39,7 +169,9 @@ def bin_request(fetchfcn, hash_key, dx=2, dy=2, dt=timedelta(days=1), **kwargs):
     kwargs['south'] = max(-90, ylimit(kwargs['south'], lower))
     kwargs['north'] = min(+90, ylimit(kwargs['north'], upper))
 
-    # fetch data chunks
+    # find data chunks that haven't been fetched yet
+    keys = (hash_key, ) if isinstance(hash_key, str) else hash_key
+    pending = []
     t = datetime(kwargs['start'].year, kwargs['start'].month, kwargs['start'].day)
     while t < kwargs['end']:
         for x in range(kwargs['west'], kwargs['east'], dx):
@@ -54,14 +186,32 @@ def bin_request(fetchfcn, hash_key, dx=2, dy=2, dt=timedelta(days=1), **kwargs):
                     qry['bottom'] = 5000
 
                 #if not serialized(qry, f'fetch_{src}_{var}'):
-                if not serialized(qry, hash_key):
-                    fetchfcn(**qry.copy())
+                if not all(serialized(qry, key) for key in keys):
+                    pending.append(qry)
                 else:
                     logging.debug(f'FETCH_HANDLER DEBUG MSG: '
                             f'already fetched {t.date().isoformat()} '
                             f'{fmt_coords(qry)} {hash_key}! continuing...')
         t += dt
 
+    if groupby is None:
+        def fetch(claimed):
+            for qry in claimed: fetchfcn(**qry.copy())
+        fetch_once(fetch, pending, keys)
+        return
+
+    # fetch each source file once for each contiguous block of pending bins
+    # it contains, so that bins fetched previously are not requested again
+    def fetch(claimed):
+        groups = {}
+        for qry in claimed: groups.setdefault(groupby(qry), []).append(qry)
+        for bins in groups.values():
+            for block in contiguous_bins(bins):
+                fetchfcn(**merge_bins(block))
+                for qry in block:
+                    for key in keys: insert_hash(qry, key)
+    fetch_once(fetch, pending, keys)
+
     return 
 
 
@@ -69,9 +219,12 @@ def fetch_handler(var, src, **kwargs):
     """ middleware to map fetch requests to the associated function 
 
         args:
-            var: string
+            var: string or list of strings
                 variable type (string)
-                must be one of the variables listed in source_map
+                must be one of the variables listed in source_map.
+                if a list is given and the source is listed in 
+                source_map.batch_fetch_map, the variables are fetched 
+                together in a single request for each bin
             src: string
                 data source (string)
                 must be one of the sources listed in source_map
@@ -80,6 +233,19 @@ def fetch_handler(var, src, **kwargs):
                 dict keys: north, south, west, east, top, bottom, start, end
     """
 
+    if not isinstance(var, str):
+        var = list(dict.fromkeys(var))
+        if len(var) == 1 or src not in source_map.batch_fetch_map.keys():
+            for v in var: fetch_handler(v, src, **kwargs)
+            return
+        for v in var: assert f'{v}_{src}' in source_map.fetch_map.keys(), \
+                f'invalid query, could not find {src=} for var={v}'
+        fetchfcn = partial(source_map.batch_fetch_map[src], tuple(var))
+        hash_key = tuple(dict.fromkeys(f'fetch_{src}_{w}' 
+                for v in var for w in batch_vars.get(f'{v}_{src}', (v, ))))
+        bin_request(fetchfcn, hash_key, groupby=file_groups.get(src), **kwargs)
+        return
+
     assert f'{var}_{src}' in source_map.fetch_map.keys() \
             or f'{var}U_{src}' in source_map.fetch_map.keys(), 'invalid query, '\
         f'could not find {src=} for {var=}. options are: '\
@@ -92,15 +258,16 @@ def fetch_handler(var, src, **kwargs):
         for k in ('start', 'end', 'top', 'bottom', 'lock'):
             if k in qry.keys(): del qry[k]  # trim hash indexing entropy
         # TODO: split into 1-degree bins for better indexing
-        source_map.fetch_map[f'{var}_{src}'](**qry.copy())
+        fetch_once(lambda claimed: source_map.fetch_map[f'{var}_{src}'](**qry.copy()),
+                [qry], (f'fetch_{src}_{var}', ))
         return
 
     # determine how data should be fetched from input variable and source
     fetchfcn = source_map.fetch_map[f'{var}_{src}']
 
     # bin the requests for fetching
-    hash_key = f'fetch_{src}_{var}'
-    bin_request(fetchfcn, hash_key, **kwargs)
+    hash_key = tuple(f'fetch_{src}_{v}' for v in batch_vars.get(f'{var}_{src}', (var, )))
+    bin_request(fetchfcn, hash_key, groupby=file_groups.get(src), **kwargs)
     
     return 
 
@@ -1,48 +1,247 @@
 import os
+import zlib
+import struct
 import logging
-import zipfile
+import hashlib
 import requests
 
 from kadlu.geospatial.data_sources.load_from_file import load_netcdf
 from kadlu.geospatial.data_sources.data_util        import          \
         storage_cfg,                                                \
         insert_hash,                                                \
-        serialized
+        serialized,                                                 \
+        cfg
+
+
+gebco_src = cfg.get('gebco', 'url',
+        fallback='https://www.bodc.ac.uk/data/open_download/gebco/gebco_2020/zip/')
+
+# expected sha256 digest of the zip archive. configure in config.ini with
+# 'sha256 = <hex digest>' in section [gebco]
+gebco_sha256 = cfg.get('gebco', 'sha256', fallback=None)
+
+# number of times an interrupted download is resumed
+gebco_retries = cfg.getint('gebco', 'retries', fallback=5)
+
+
+class ZipMemberExtractor():
+    """ incrementally extract a member of a zip archive from a byte stream
+
+        zip local file headers are parsed as the archive bytes arrive, so
+        the member can be decompressed to disk before the download of the
+        archive has completed. supports stored and deflated members,
+        data descriptors, and zip64 sizes. the CRC-32 of the extracted
+        member is verified against the archive
+
+        args:
+            suffix: string
+                extract the first member with a filename ending in suffix
+            fpath: string
+                complete filepath of the extracted output
+
+        attrs:
+            name: string
+                filename of the extracted member within the archive
+            done: boolean
+                True once the member has been extracted and verified
+    """
+
+    def __init__(self, suffix, fpath):
+        self.suffix, self.fpath = suffix, fpath
+        self.name, self.done = None, False
+        self.buf = b''
+        self.member = None  # header of the member currently being read
+        self.out = None
+
+    def close(self):
+        """ close the output file """
+        if self.out is not None: self.out.close()
+
+    def feed(self, data):
+        """ process the next chunk of archive bytes """
+        self.buf += data
+        while not self.done and self._step(): pass
+
+    def _step(self):
+        """ consume as much of the buffer as possible. returns False if
+            more data is needed
+        """
+        if self.member is None: return self._read_header()
+        m = self.member
+        if m['descriptor_pending']: return self._read_descriptor()
+
+        if m['method'] == 8:
+            data = m['inflate'].decompress(self.buf)
+            self.buf = m['inflate'].unused_data
+            self._write(data)
+            if not m['inflate'].eof: return False
+        else:
+            assert m['method'] == 0, f'unsupported zip compression method {m["method"]}'
+            assert not m['flags'] & 8, 'stored members with data descriptors are not supported'
+            n = min(m['remaining'], len(self.buf))
+            self._write(self.buf[:n])
+            self.buf, m['remaining'] = self.buf[n:], m['remaining'] - n
+            if m['remaining'] > 0: return False
+
+        if m['flags'] & 8:
+            m['descriptor_pending'] = True
+            return True
+        return self._finish(m['crc'])
+
+    def _read_header(self):
+        if len(self.buf) < 30: return False
+        sig, _, flags, method, _, _, crc, csize, usize, nlen, elen = \
+                struct.unpack('<IHHHHHIIIHH', self.buf[:30])
+        assert sig == 0x04034b50, f'{self.suffix} member not found in archive'
+        if len(self.buf) < 30 + nlen + elen: return False
+        name = self.buf[30:30+nlen].decode('utf-8')
+        extra = self.buf[30+nlen:30+nlen+elen]
+        self.buf = self.buf[30+nlen+elen:]
+
+        # zip64 extended information field
+        zip64 = False
+        while len(extra) >= 4:
+            tag, size = struct.unpack('<HH', extra[:4])
+            if tag == 0x0001:
+                zip64 = True
+                fields = extra[4:4+size]
+                if usize == 0xFFFFFFFF: usize, fields = struct.unpack('<Q', fields[:8])[0], fields[8:]
+                if csize == 0xFFFFFFFF: csize = struct.unpack('<Q', fields[:8])[0]
+            extra = extra[4+size:]
+
+        target = self.name is None and name.endswith(self.suffix)
+        if target:
+            self.name = name
+            self.out = open(self.fpath, 'wb')
+        self.member = dict(name=name, flags=flags, method=method, crc=crc,
+                remaining=csize, zip64=zip64, target=target, crc_out=0,
+                descriptor_pending=False, inflate=zlib.decompressobj(-15))
+        return True
+
+    def _read_descriptor(self):
+        size = 20 if self.member['zip64'] else 12
+        if len(self.buf) < 4 + size: return False
+        if struct.unpack('<I', self.buf[:4])[0] == 0x08074b50: self.buf = self.buf[4:]
+        crc = struct.unpack('<I', self.buf[:4])[0]
+        self.buf = self.buf[size:]
+        return self._finish(crc)
+
+    def _write(self, data):
+        if not self.member['target']: return
+        self.out.write(data)
+        self.member['crc_out'] = zlib.crc32(data, self.member['crc_out'])
+
+    def _finish(self, crc):
+        if self.member['target']:
+            self.out.close()
+            assert self.member['crc_out'] == crc, f'CRC-32 mismatch in {self.name}'
+            self.done = True
+        self.member = None
+        return True
+
+
+def fetch_gebco(url, fpath, sha256=None, chunk_size=2**20, retries=5):
+    """ download the gebco zip archive and extract the netcdf member
+
+        the netcdf member is decompressed while the archive is 
+        downloading, and the archive itself is not stored. if the 
+        connection is interrupted, the download is resumed with a range
+        request at the last byte received, and extraction continues from
+        the state of the decompressor. if the process is interrupted, the
+        download starts over
+
+        args:
+            url: string
+                archive URL
+            fpath: string
+                complete filepath of the extracted netcdf file
+            sha256: string
+                expected sha256 digest of the archive. if None, the
+                download stops once the netcdf member has been extracted
+            chunk_size: int
+                number of bytes read at a time
+            retries: int
+                number of times an interrupted download is resumed
+
+        return:
+            name of the extracted member within the archive
+    """
+    extractor = ZipMemberExtractor('.nc', f'{fpath}.part')
+    digest = hashlib.sha256()
+    offset, attempt, complete = 0, 0, False
+    try:
+        while not complete:
+            headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+            try:
+                with requests.get(url, headers=headers, stream=True) as payload:
+                    if payload.status_code == 416: break  # nothing left to read
+                    assert payload.status_code in (200, 206), 'error fetching file'
+                    if payload.status_code == 200 and offset > 0:  # range not supported
+                        logging.info(f'{os.path.basename(url)}: range requests not '
+                                      'supported, restarting download')
+                        extractor.close()
+                        extractor = ZipMemberExtractor('.nc', f'{fpath}.part')
+                        digest, offset = hashlib.sha256(), 0
+                    for chunk in payload.iter_content(chunk_size=chunk_size):
+                        digest.update(chunk)
+                        offset += len(chunk)
+                        if not extractor.done: extractor.feed(chunk)
+                        elif sha256 is None: break
+                    complete = True
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError) as err:
+                attempt += 1
+                assert attempt <= retries, f'error fetching {url}: {err}'
+                logging.info(f'resuming download of {os.path.basename(url)} at {offset} bytes')
+
+        assert extractor.done, 'archive is incomplete'
+        if sha256 is not None:
+            assert digest.hexdigest() == sha256, f'checksum mismatch for {url}'
+        os.replace(f'{fpath}.part', fpath)
+    finally:
+        extractor.close()
+        if os.path.isfile(f'{fpath}.part'): os.remove(f'{fpath}.part')
+    return extractor.name
+
 
 class Gebco():
 
-    def fetch_bathymetry(self, **kwargs):
-        """ fetch gebco netcdf bathymetry, and return the filepath of extracted data """
+    def fetch_bathymetry(self, pyramid=False, **kwargs):
+        """ fetch gebco netcdf bathymetry, and return the filepath of extracted data
+
+            if pyramid is True, the bathymetry within the query boundaries
+            (global by default) is also converted to the tiles of the
+            bathymetry pyramid
+        """
 
         if not serialized(seed='gebco_bathy.nc'):
             logging.info('downloading and decompressing gebco bathymetry from netcdf (~8GB)... ')
-
-            # download zipped netcdf to storage directory
-            url = 'https://www.bodc.ac.uk/data/open_download/gebco/gebco_2020/zip/'
-            with requests.get(url, stream=True) as payload_netcdf:
-                assert payload_netcdf.status_code == 200, 'error fetching file'
-                with open(storage_cfg()+'gebco_netcdf.zip', 'wb') as f:
-                    for chunk in payload_netcdf.iter_content(chunk_size=8192): 
-                        f.write(chunk)
-
-            # unzip it
-            with zipfile.ZipFile(storage_cfg()+'gebco_netcdf.zip', 'r') as zipf:
-                zipf.extractall(storage_cfg())
-            unzipped = zipfile.ZipFile(storage_cfg()+"gebco_netcdf.zip", "r").namelist()
-            ncpath = [_ for _ in unzipped if _[-3:] == '.nc'][0]
-            os.rename(storage_cfg() + ncpath, storage_cfg() + 'gebco_bathy.nc')
-            renamed = [fname if fname[-3:] != ".nc" else "gebco_bathy.nc" for fname in unzipped]
+            if gebco_sha256 is None:
+                logging.warning('no sha256 digest configured for the gebco archive, '
+                                'add sha256 to section [gebco] of config.ini to verify it')
+            ncpath = fetch_gebco(gebco_src, storage_cfg() + 'gebco_bathy.nc', 
+                    gebco_sha256, retries=gebco_retries)
 
             # store some metadata
             insert_hash(seed='gebco_bathy.nc')
 
-            logging.info(f'extracted {renamed} to {storage_cfg()}')
+            logging.info(f'extracted {ncpath} to {storage_cfg()}gebco_bathy.nc')
+
+        if pyramid:
+            # imported here to avoid a circular import through source_map
+            from kadlu.geospatial.data_sources.bathy_pyramid import build_pyramid
+            bounds = dict(south=-90, north=90, west=-180, east=180)
+            bounds.update({k: kwargs[k] for k in bounds.keys() if k in kwargs.keys()})
+            build_pyramid('gebco', **bounds)
 
         return storage_cfg() + 'gebco_bathy.nc'
 
 
     def load_bathymetry(self, **kwargs):
+        """ load gebco bathymetry within the query boundaries. only the
+            query region is read from the netcdf file. pass stride=n to
+            read every nth grid point
+        """
         val, lat, lon = load_netcdf(filename=self.fetch_bathymetry(), **kwargs)
         return val * -1, lat, lon
 
-
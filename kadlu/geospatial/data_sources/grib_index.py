@@ -0,0 +1,189 @@
+"""
+    message index and decoded field cache for grib files
+
+    the index maps each message in a grib file to its variable name,
+    valid time, and byte range, so that messages within a query can be
+    read and decoded without scanning the whole file. decoded fields can
+    optionally be cached as memory-mapped float32 arrays, in which case
+    later queries read only the requested region from disk
+"""
+
+import os
+import logging
+from contextlib import contextmanager
+from os.path import isfile, getmtime
+
+import numpy as np
+import pygrib
+
+try: import fcntl
+except ImportError: fcntl = None  # windows: cache creation is not locked
+
+from kadlu.geospatial.data_sources.data_util import dt_2_epoch
+
+
+index_dtype = np.dtype([
+        ('name',    'U64'),
+        ('time',    'i8'),     # epoch hours
+        ('offset',  'i8'),     # byte offset of message in file
+        ('length',  'i8'),     # message length in bytes
+    ])
+
+
+def message_ranges(fpath):
+    """ yield the byte offset and length of each message in a grib file
+        by reading the indicator section (section 0) of each message
+    """
+    with open(fpath, 'rb') as f:
+        offset = 0
+        while True:
+            f.seek(offset)
+            head = f.read(16)
+            if len(head) < 16: return
+            assert head[:4] == b'GRIB', f'{fpath}: corrupt message at byte {offset}'
+            if head[7] == 2: length = int.from_bytes(head[8:16], 'big')
+            else:            length = int.from_bytes(head[4:7],  'big')
+            yield offset, length
+            offset += length
+
+
+def read_message(fpath, entry):
+    """ read a single message from a grib file using its index entry """
+    with open(fpath, 'rb') as f:
+        f.seek(entry['offset'])
+        return pygrib.fromstring(f.read(entry['length']))
+
+
+def index_grib(fpath):
+    """ load the message index of a grib file, building it if necessary
+
+        the index is stored next to the grib file as a numpy array, and
+        is rebuilt if the grib file has changed since it was indexed.
+        the lat/lon grid axes of the file are stored alongside the index
+
+        args:
+            fpath: string
+                complete filepath of the grib file
+
+        return:
+            index: structured numpy array
+                one entry per message with fields name, time, offset, length
+            lat, lon: arrays
+                grid axes. longitudes are adjusted to -180..180
+    """
+    idxfile, gridfile = f'{fpath}.idx.npy', f'{fpath}.grid.npz'
+    if isfile(idxfile) and getmtime(idxfile) >= getmtime(fpath):
+        grid = np.load(gridfile, allow_pickle=False)
+        return np.load(idxfile, allow_pickle=False), grid['lat'], grid['lon']
+
+    logging.info(f'indexing {os.path.basename(fpath)}...')
+    index = []
+    lat, lon = None, None
+    with open(fpath, 'rb') as f:
+        for offset, length in message_ranges(fpath):
+            f.seek(offset)
+            msg = pygrib.fromstring(f.read(length))  # values are not decoded
+            index.append((msg['name'], dt_2_epoch(msg.validDate), offset, length))
+            if lat is None:
+                lats, lons = msg.latlons()
+                lat, lon = lats[:,0], ((lons[0,:] + 180) % 360) - 180
+
+    index = np.array(index, dtype=index_dtype)
+    np.savez(gridfile, lat=lat, lon=lon)
+    np.save(idxfile, index, allow_pickle=False)
+    return index, lat, lon
+
+
+@contextmanager
+def file_lock(lockfile):
+    """ hold an exclusive lock on lockfile across processes. the lock is
+        released by the operating system if the process exits
+    """
+    with open(lockfile, 'a') as f:
+        if fcntl is not None: fcntl.flock(f, fcntl.LOCK_EX)
+        try: yield
+        finally:
+            if fcntl is not None: fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def field_cache(fpath, index, lat, lon):
+    """ open the decoded field cache of a grib file
+
+        the cache is created, or recreated if older than the grib file,
+        under a lock shared by all processes. new cache files are written
+        to temporary files and moved into place, the flags last, so that
+        the fields of a cache opened by another process are never
+        truncated
+
+        return:
+            fields: memory-mapped float32 array
+                decoded values with shape (messages, lat, lon).
+                masked values are stored as NaN
+            decoded: memory-mapped boolean array
+                flags the messages that have been decoded
+    """
+    fieldfile, flagfile = f'{fpath}.fields.npy', f'{fpath}.decoded.npy'
+    shape = (len(index), len(lat), len(lon))
+    with file_lock(f'{fpath}.cache.lock'):
+        if not isfile(flagfile) or getmtime(flagfile) < getmtime(fpath):
+            part = f'.{os.getpid()}.part'
+            np.lib.format.open_memmap(fieldfile + part, mode='w+',
+                    dtype=np.float32, shape=shape).flush()
+            with open(flagfile + part, 'wb') as f:
+                np.save(f, np.zeros(len(index), dtype=bool), allow_pickle=False)
+            os.replace(fieldfile + part, fieldfile)
+            os.replace(flagfile + part, flagfile)
+        fields = np.load(fieldfile, mmap_mode='r+')
+        decoded = np.load(flagfile, mmap_mode='r+')
+    return fields, decoded
+
+
+def iter_fields(fpath, south, north, west, east, start, end, cache=False):
+    """ read grib messages within the query boundaries
+
+        only the messages valid between start and end are read. if
+        cache is True, each message is decoded at most once, and later
+        reads are served from the decoded field cache
+
+        args:
+            fpath: string
+                complete filepath of the grib file
+            south, north, west, east: float
+                query boundaries
+            start, end: datetime
+                query time range
+            cache: boolean
+                store decoded fields as memory-mapped float32 arrays
+
+        yields:
+            name: string
+                variable name of the message
+            epoch: int
+                valid time of the message in epoch hours
+            values: masked array
+                message values within the query boundaries
+            lat, lon: arrays
+                grid axes of the values
+    """
+    index, lat, lon = index_grib(fpath)
+    rows = np.nonzero((lat >= south) & (lat <= north))[0]
+    cols = np.nonzero((lon >= west)  & (lon <= east))[0]
+    if cache: fields, decoded = field_cache(fpath, index, lat, lon)
+
+    t0, t1 = dt_2_epoch(start), dt_2_epoch(end)
+    for num in np.nonzero((index['time'] >= t0) & (index['time'] <= t1))[0]:
+        entry = index[num]
+        if cache:
+            if not decoded[num]:
+                values = read_message(fpath, entry).values
+                fields[num] = np.ma.filled(values.astype(np.float32), np.nan)
+                fields.flush()  # the field is on disk before it is flagged
+                decoded[num] = True
+            z = np.ma.masked_invalid(fields[num][rows][:, cols])
+        else:
+            z = read_message(fpath, entry).values[rows][:, cols]
+        yield entry['name'], entry['time'], np.ma.asarray(z), lat[rows], lon[cols]
+
+    if cache:
+        fields.flush()
+        decoded.flush()
@@ -8,10 +8,10 @@
         https://tds.hycom.org/thredds/dodsC/GLBv0.08/expt_53.X/data/2015.html
 """
 
-import time
 import logging
 import requests
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import reduce
 from datetime import datetime, timedelta
 from os.path import isfile
@@ -19,8 +19,14 @@ from os.path import isfile
 import numpy as np
 
 import kadlu.geospatial.data_sources.fetch_handler
+from kadlu import instrument
 from kadlu.geospatial.data_sources.data_util        import          \
         database_cfg,                                               \
+        bulk_insert,                                                \
+        query_rows,                                                 \
+        derive_uv,                                                  \
+        hycom_uv_tables,                                            \
+        hycom_uv_cols,                                              \
         storage_cfg,                                                \
         insert_hash,                                                \
         serialized,                                                 \
@@ -28,31 +34,23 @@ from kadlu.geospatial.data_sources.data_util        import          \
         epoch_2_dt,                                                 \
         fmt_coords,                                                 \
         str_def,                                                    \
-        index
+        index,                                                      \
+        cfg
 
 
-hycom_src = "https://tds.hycom.org/thredds/dodsC/GLBv0.08/expt_53.X/data"
+# base URL of the dataset. can be changed in config.ini with 'url' in section [hycom]
+hycom_src = cfg.get('hycom', 'url',
+        fallback="https://tds.hycom.org/thredds/dodsC/GLBv0.08/expt_53.X/data")
 
 
-hycom_varmap = dict(zip(
-        ('salinity', 'water_temp', 'water_u', 'water_v'),
-        ('salinity',       'temp', 'water_u', 'water_v')))
-
+# years available from the hycom server, and number of concurrent
+# requests used to fetch their metadata
+hycom_years = tuple(map(str, range(1994, 2016)))
+hycom_workers = 8
 
-# database config
-conn, db = database_cfg()
-hycom_tables = ['hycom_salinity', 'hycom_water_temp', 'hycom_water_u', 'hycom_water_v']
-for var in hycom_tables:
-    db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
-                '( val     REAL NOT NULL,' 
-                '  lat     REAL NOT NULL,' 
-                '  lon     REAL NOT NULL,' 
-                '  time    INT  NOT NULL,' 
-                '  depth   INT  NOT NULL,' 
-                '  source  TEXT NOT NULL )')
-
-    db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
-               f'idx_{var} on {var}(time, lon, lat, depth, val, source)')
+hycom_varmap = dict(zip(
+        ('salinity', 'water_temp', 'water_u', 'water_v', 'water_uv'),
+        ('salinity',       'temp', 'water_u', 'water_v', 'water_uv')))
 
 
 def slices_str(var, slices, steps=(1, 1, 1, 1)):
@@ -62,60 +60,70 @@ def slices_str(var, slices, steps=(1, 1, 1, 1)):
     return f"{var}{sliced}"
 
 
-def fetch_grid():
-    """ download lat/lon/time arrays for grid indexing """
+def fetch_ascii(url):
+    """ request an ascii response from the hycom server and return its body """
+    payload = requests.get(url)
+    assert payload.status_code == 200, "couldn't access hycom server"
+    meta, data = payload.text.split\
+    ("---------------------------------------------\n")
+    return data
 
-    logging.info("fetching hycom lat/lon grid arrays...")
-    url = f"{hycom_src}/2015.ascii?lat%5B0:1:3250%5D,lon%5B0:1:4499%5D"
-    grid_netcdf = requests.get(url)
-    assert(grid_netcdf.status_code == 200)
 
-    meta, data = grid_netcdf.text.split\
-    ("---------------------------------------------\n")
+def fetch_latlon():
+    """ download lat/lon arrays for grid indexing """
+    logging.info("fetching hycom lat/lon grid arrays...")
+    data = fetch_ascii(f"{hycom_src}/2015.ascii?lat%5B0:1:3250%5D,lon%5B0:1:4499%5D")
     lat_csv, lon_csv = data.split("\n\n")[:-1]
-    lat = np.array(lat_csv.split("\n")[1].split(", "), dtype=np.float)
-    lon = np.array(lon_csv.split("\n")[1].split(", "), dtype=np.float)
+    lat = np.array(lat_csv.split("\n")[1].split(", "), dtype=float)
+    lon = np.array(lon_csv.split("\n")[1].split(", "), dtype=float)
 
     np.save(f"{storage_cfg()}hycom_lats.npy", lat, allow_pickle=False)
     np.save(f"{storage_cfg()}hycom_lons.npy", lon, allow_pickle=False)
+    return
 
-    ### END XY GRIDS ###
-    """ fetch timestamps from hycom (epoch hours since 2000-01-01 00:00) """
-
-    epoch = {}
 
-    for year in map(str, range(1994, 2016)):
-        url = f"{hycom_src}/{year}.ascii?time"
-        time_netcdf = requests.get(url)
-        assert(time_netcdf.status_code == 200)
-        meta, data = time_netcdf.text.split\
-        ("---------------------------------------------\n")
-        csv = data.split("\n\n")[:-1][0]
-        epoch[year] = np.array(csv.split("\n")[1].split(', ')[1:], dtype=float)
-        time.sleep(0.5)
+def fetch_times(year):
+    """ fetch timestamps of one year from hycom (epoch hours since 2000-01-01 00:00) """
+    data = fetch_ascii(f"{hycom_src}/{year}.ascii?time")
+    csv = data.split("\n\n")[:-1][0]
+    epoch = np.array(csv.split("\n")[1].split(', ')[1:], dtype=float)
+    np.save(f"{storage_cfg()}hycom_epoch_{year}.npy", epoch, allow_pickle=False)
+    return
 
-    np.save(f"{storage_cfg()}hycom_epoch.npy", epoch)
 
-    ### END TIME GRID ### 
+def fetch_grid(years=hycom_years, latlon=True):
+    """ download lat/lon/time arrays for grid indexing
 
+        requests are made concurrently. each year of timestamps is stored
+        in a seperate file, so that a single year can be refreshed
+        by passing years=['YYYY'], latlon=False
+    """
+    logging.info(f"fetching hycom timestamps for {len(years)} years...")
+    with ThreadPoolExecutor(max_workers=hycom_workers) as executor:
+        futures = [executor.submit(fetch_times, year) for year in years]
+        if latlon: futures.append(executor.submit(fetch_latlon))
+        for future in as_completed(futures): future.result()
     return
 
 
 def load_grid():
     """ put spatial grid into memory """
-    if not isfile(f"{storage_cfg()}hycom_lats.npy"): fetch_grid()
-    return (np.load(f"{storage_cfg()}hycom_lats.npy"),
-            np.load(f"{storage_cfg()}hycom_lons.npy"))
-
+    if not isfile(f"{storage_cfg()}hycom_lats.npy"): fetch_latlon()
+    return (np.load(f"{storage_cfg()}hycom_lats.npy", mmap_mode='r', allow_pickle=False),
+            np.load(f"{storage_cfg()}hycom_lons.npy", mmap_mode='r', allow_pickle=False))
 
-#def fetch_times():
-#    return
 
+def load_times(years=hycom_years):
+    """ put timestamps into memory. missing years are fetched first
 
-def load_times():
-    """ put timestamps into memory """
-    if not isfile(f"{storage_cfg()}hycom_epoch.npy"): fetch_grid()
-    return np.load(f"{storage_cfg()}hycom_epoch.npy", allow_pickle=True).item()
+        return:
+            dictionary of memory-mapped epoch arrays keyed by year string
+    """
+    path = lambda year: f"{storage_cfg()}hycom_epoch_{year}.npy"
+    missing = [year for year in years if not isfile(path(year))]
+    if len(missing) > 0: fetch_grid(missing, latlon=False)
+    return {year: np.load(path(year), mmap_mode='r', allow_pickle=False) 
+            for year in years}
 
 
 def load_depth():
@@ -126,9 +134,45 @@ def load_depth():
         900.0, 1000.0, 1250.0, 1500.0, 2000.0, 2500.0, 3000.0, 4000.0, 5000.0])
 
 
+def parse_ascii(data, variables, shape):
+    """ split an OPeNDAP ascii response into an array for each variable
+
+        args:
+            data: string
+                body of the ascii response following the header
+            variables: list of strings
+                names of the requested variables
+            shape: tuple
+                shape of the requested slices of each variable
+
+        return:
+            dictionary of arrays keyed by variable name
+    """
+    cubes = {}
+    for block in data.split("\n\n"):
+        if block.strip() == '': continue
+        header, payload = block.split("\n", 1)
+        name = header.split("[", 1)[0].split(".")[-1]
+        dims = header.count("[")
+        if name not in variables or dims != len(shape): continue  # grid map vectors
+
+        cube = np.ndarray(shape, dtype=float)
+        for arr in payload.strip("\n").split("\n"):
+            ix_str, row_csv = arr.split(", ", 1)
+            a, b, c = [int(x) for x in ix_str[1:-1].split("][")]
+            cube[a][b][c] = np.array(row_csv.split(", "), dtype=int)
+        cubes[name] = cube
+
+    assert sorted(cubes.keys()) == sorted(variables), 'incomplete response from hycom server'
+    return cubes
+
+
 def fetch_hycom(self, var, year, slices, kwargs):
     """ download data from hycom, prepare it, and load into database
 
+        several variables sharing the same slices are fetched in a single 
+        request, and split into their tables on insertion
+
         args:
             year: string
                 string value between 1994 and 2016
@@ -142,8 +186,8 @@ def fetch_hycom(self, var, year, slices, kwargs):
                     (800, 840),     # x grid index: xmin, xmax (lon)
                     (900, 1000)     # y grid index: ymin, ymax (lat)
                 ]
-            var: string
-                variable to be fetched. complete list of variables here
+            var: string or list of strings
+                variables to be fetched. complete list of variables here
                 https://tds.hycom.org/thredds/dodsC/GLBv0.08/expt_53.X/data/2015.html
             lat: array
                 the first array returned by load_grid()
@@ -159,60 +203,65 @@ def fetch_hycom(self, var, year, slices, kwargs):
 
         return: nothing
     """
+    conn, db = database_cfg()
+    variables = [var] if isinstance(var, str) else list(var)
 
     # generate request
     t1 = datetime.now()
-    url = f"{hycom_src}/{year}.ascii?{slices_str(var, slices)}"
-    with requests.get(url, stream=True) as payload_netcdf:
+    constraint = ','.join(slices_str(v, slices) for v in variables)
+    url = f"{hycom_src}/{year}.ascii?{constraint}"
+    with instrument.timer('download', source='hycom', year=year), \
+            requests.get(url, stream=True) as payload_netcdf:
         assert payload_netcdf.status_code == 200, "couldn't access hycom server"
         meta, data = payload_netcdf.text.split\
         ("---------------------------------------------\n")
+    instrument.gauge('download.bytes', len(payload_netcdf.content), 'B', source='hycom')
 
     t2 = datetime.now()
 
-    # parse response into numpy array
-    arrs = data.split("\n\n")[:-1]
-    shape_str, payload = arrs[0].split("\n", 1)
-    shape = tuple([int(x) for x in shape_str.split("[", 1)[1][:-1].split("][")])
-    cube = np.ndarray(shape, dtype=np.float)
-
-    for arr in payload.split("\n"):
-        ix_str, row_csv = arr.split(", ", 1)
-        a, b, c = [int(x) for x in ix_str[1:-1].split("][")]
-        cube[a][b][c] = np.array(row_csv.split(", "), dtype=np.int)
-
-    # build coordinate grid, populate with values, adjust scaling, remove nulls
-    flatten = reduce(np.multiply, map(lambda s : s[1] - s[0] +1, slices))
-    add_offset =  20 if 'salinity' in var or 'water_temp' in var else 0
-    null_value = -10 if 'salinity' in var or 'water_temp' in var else -30
-    grid = np.array([(None, y, x, t, d, 'hycom') 
-            for t in self.epoch[year][slices[0][0] : slices[0][1] +1]
-            for d in self.depth      [slices[1][0] : slices[1][1] +1]
-            for y in self.ygrid      [slices[2][0] : slices[2][1] +1]
-            for x in self.xgrid      [slices[3][0] : slices[3][1] +1]])
-    grid[:,0] = np.reshape(cube, flatten) * 0.001 + add_offset
-    grid = grid[grid[:,0] != null_value]
-
-    # batch database insertion ignoring duplicates
-    if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
-    n1 = db.execute(f"SELECT COUNT(*) FROM hycom_{var}").fetchall()[0][0]
-    db.executemany(f"INSERT OR IGNORE INTO hycom_{var} VALUES "
-                    "(?, ?, ?, CAST(? AS INT), CAST(? AS INT), ?)", grid)
-    n2 = db.execute(f"SELECT COUNT(*) FROM hycom_{var}").fetchall()[0][0]
-    db.execute("COMMIT")
-    conn.commit()
-    insert_hash(kwargs, f'fetch_hycom_{hycom_varmap[var]}')
-    if 'lock' in kwargs.keys(): kwargs['lock'].release()
-
-    t3 = datetime.now()
-
-    logging.info(f"HYCOM {epoch_2_dt([self.epoch[year][slices[0][0]]])[0].date().isoformat()} "
-          f"{var}: downloaded {int(len(payload_netcdf.content)/8/1000)} Kb "
-          f"in {(t2-t1).seconds}.{str((t2-t1).microseconds)[0:3]}s. "
-          f"parsed and inserted {n2 - n1} rows in "
-          f"{(t3-t2).seconds}.{str((t3-t2).microseconds)[0:3]}s. "
-          f"{flatten - len(grid)} null values removed, "
-          f"{len(grid) - (n2 - n1)} duplicates ignored")
+    # parse response into numpy arrays
+    shape = tuple(s[1] - s[0] + 1 for s in slices)
+    with instrument.timer('parse', source='hycom', year=year):
+        cubes = parse_ascii(data, variables, shape)
+
+    # build coordinate grid shared by each variable
+    flatten = reduce(np.multiply, shape)
+    t, d, y, x = map(np.ravel, np.meshgrid(
+            self.epoch[year][slices[0][0] : slices[0][1] +1],
+            self.depth      [slices[1][0] : slices[1][1] +1],
+            self.ygrid      [slices[2][0] : slices[2][1] +1],
+            self.xgrid      [slices[3][0] : slices[3][1] +1], indexing='ij'))
+
+    for v in variables:
+        # populate with values, adjust scaling, remove nulls
+        add_offset =  20 if 'salinity' in v or 'water_temp' in v else 0
+        null_value = -10 if 'salinity' in v or 'water_temp' in v else -30
+        val = np.reshape(cubes[v], flatten) * 0.001 + add_offset
+        keep = val != null_value
+
+        # batch database insertion ignoring duplicates
+        if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
+        n, dups = bulk_insert(conn, f'hycom_{v}', [val[keep], y[keep], x[keep], 
+                t[keep].astype(np.int64), d[keep].astype(np.int64)], 'hycom')
+        insert_hash(kwargs, f'fetch_hycom_{hycom_varmap[v]}')
+        if 'lock' in kwargs.keys(): kwargs['lock'].release()
+
+        t3 = datetime.now()
+
+        logging.info(f"HYCOM {epoch_2_dt(self.epoch[year][slices[0][0]]).date().isoformat()} "
+              f"{v}: downloaded {int(len(payload_netcdf.content)/8/1000)} Kb "
+              f"in {(t2-t1).seconds}.{str((t2-t1).microseconds)[0:3]}s. "
+              f"parsed and inserted {n} rows in "
+              f"{(t3-t2).seconds}.{str((t3-t2).microseconds)[0:3]}s. "
+              f"{flatten - np.count_nonzero(keep)} null values removed, "
+              f"{dups} duplicates ignored")
+
+    # materialize current speed from the current components
+    if 'water_u' in variables or 'water_v' in variables:
+        if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
+        derive_uv(conn, 'hycom_water_uv', *hycom_uv_tables['hycom_water_uv'], 
+                kwargs, cols=hycom_uv_cols)
+        if 'lock' in kwargs.keys(): kwargs['lock'].release()
 
     return
 
@@ -243,6 +292,7 @@ def load_hycom(self, var, kwargs):
             depth: array
                 measured in meters
     """
+    conn, db = database_cfg()
     # check if grids are initialized
     if not self.grids:
         self.ygrid, self.xgrid = load_grid()
@@ -269,7 +319,7 @@ def load_hycom(self, var, kwargs):
              'start', 'end', 'top', 'bottom'])), 'malformed query'
 
     assert kwargs['start'] <= kwargs['end']
-    sql = ' AND '.join([f"SELECT * FROM hycom_{var} WHERE lat >= ?",
+    sql = ' AND '.join([f"SELECT val, lat, lon, time, depth FROM hycom_{var} WHERE lat >= ?",
             'lat <= ?',
             'lon >= ?',
             'lon <= ?',
@@ -280,24 +330,25 @@ def load_hycom(self, var, kwargs):
             "source == 'hycom' "]
 
         ) + 'ORDER BY time, depth, lat, lon ASC'
-    db.execute(sql, tuple(map(str, [
+    rowdata = query_rows(db, sql, tuple(map(str, [
             kwargs['south'],                kwargs['north'], 
             kwargs['west'],                 kwargs['east'],
             dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end']),
             kwargs['top'],                  kwargs['bottom']
-        ])))
-    rowdata = np.array(db.fetchall(), dtype=object).T
+        ])), table=f'hycom_{var}')
 
     #assert len(rowdata) > 0, f'no data for query: {kwargs}'
-    if len(rowdata) == 0:
+    if rowdata.shape[1] == 0:
         logging.warning(f'HYCOM {var}: no data found in region {fmt_coords(kwargs)}, returning empty arrays')
-        return np.array([[],[],[],[],[]])
 
-    return rowdata[0:5].astype(float)
+    return rowdata
 
 
 def fetch_idx(self, var, kwargs): 
-    """ convert user query to grid index slices, handle edge cases """
+    """ convert user query to grid index slices, handle edge cases 
+
+        var may be a list of variables, which are fetched together
+    """
 
     def _idx(self, var, year, kwargs): 
         """ build indices for query and call fetch_hycom """
@@ -323,7 +374,7 @@ def fetch_idx(self, var, kwargs):
         assert n > 0, f"{n} records available within query boundaries: {kwargs}"
 
         logging.info(f"HYCOM {kwargs['start'].date().isoformat()} "
-              f"downloading {n} {var} values in region {fmt_coords(kwargs)}...")
+              f"downloading {n} {', '.join(var)} values in region {fmt_coords(kwargs)}...")
         fetch_hycom(self=self, slices=slices, var=var, year=year, kwargs=kwargs)
         return
 
@@ -338,12 +389,14 @@ def fetch_idx(self, var, kwargs):
             "use fetch handler for this"
 
     # query local database for existing checksums
-    if serialized(kwargs, f'fetch_hycom_{hycom_varmap[var]}'): return False
-    if not serialized(seed='fetch_hycom_grid'):
-        fetch_grid()
-        insert_hash(seed='fetch_hycom_grid')
-
+    var = [var] if isinstance(var, str) else list(var)
+    var = [v for v in var if not serialized(kwargs, f'fetch_hycom_{hycom_varmap[v]}')]
+    if len(var) == 0: return False
+    # grids already loaded by this instance are not fetched again
     if not self.grids:
+        if not serialized(seed='fetch_hycom_grid'):
+            fetch_grid()
+            insert_hash(seed='fetch_hycom_grid')
         self.ygrid, self.xgrid = load_grid()
         self.epoch = load_times()
         self.depth = load_depth()
@@ -356,10 +409,9 @@ def fetch_idx(self, var, kwargs):
         kwargs1, kwargs2 = kwargs.copy(), kwargs.copy()
         kwargs1['east'] = self.xgrid[-1]
         kwargs2['west'] = self.xgrid[0]
-        if not serialized(kwargs1, f'fetch_hycom_{hycom_varmap[var]}'):
-            _idx(self, var, year, kwargs1)
-        if not serialized(kwargs2, f'fetch_hycom_{hycom_varmap[var]}'):
-            _idx(self, var, year, kwargs2)
+        for kw in (kwargs1, kwargs2):
+            pending = [v for v in var if not serialized(kw, f'fetch_hycom_{hycom_varmap[v]}')]
+            if len(pending) > 0: _idx(self, pending, year, kw)
     else:
         _idx(self, var, year, kwargs)
 
@@ -393,51 +445,23 @@ class Hycom():
     def fetch_temp    (self, **kwargs): return fetch_idx(self,  'water_temp', kwargs)
     def fetch_water_u (self, **kwargs): return fetch_idx(self,  'water_u',    kwargs)
     def fetch_water_v (self, **kwargs): return fetch_idx(self,  'water_v',    kwargs)
-    def fetch_water_uv(self, **kwargs): return fetch_idx(self,  'water_u',    kwargs) and\
-                                               fetch_idx(self,  'water_v',    kwargs)
+    def fetch_water_uv(self, **kwargs): return fetch_idx(self, ['water_u', 'water_v'], kwargs)
+    def fetch_batch(self, variables, **kwargs):
+        """ fetch several variables in a single request per query slice.
+            variables are named as in hycom_varmap values, e.g. 'temp'
+        """
+        names = dict(zip(hycom_varmap.values(), hycom_varmap.keys()))
+        names['water_uv'] = ['water_u', 'water_v']
+        var = []
+        for v in variables:
+            var += names[v] if isinstance(names[v], list) else [names[v]]
+        return fetch_idx(self, list(dict.fromkeys(var)), kwargs)
 
     def load_salinity (self, **kwargs): return load_hycom(self, 'salinity',   kwargs)
     def load_temp     (self, **kwargs): return load_hycom(self, 'water_temp', kwargs)
     def load_water_u  (self, **kwargs): return load_hycom(self, 'water_u',    kwargs)
     def load_water_v  (self, **kwargs): return load_hycom(self, 'water_v',    kwargs)
-    def load_water_uv (self, **kwargs):
-        kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
-                hycom_varmap['water_u'], 'hycom', parallel=1, **kwargs)
-        kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
-                hycom_varmap['water_v'], 'hycom', parallel=1, **kwargs)
-
-        sql = ' AND '.join(['SELECT hycom_water_u.val, hycom_water_u.lat, hycom_water_u.lon, hycom_water_u.time, hycom_water_u.depth, hycom_water_v.val FROM hycom_water_u '\
-                'INNER JOIN hycom_water_v '\
-                'ON hycom_water_u.lat == hycom_water_v.lat',
-                'hycom_water_u.lon == hycom_water_v.lon',
-                'hycom_water_u.time == hycom_water_v.time '\
-                'WHERE hycom_water_u.lat >= ?',
-                'hycom_water_u.lat <= ?',
-                'hycom_water_u.lon >= ?',
-                'hycom_water_u.lon <= ?',
-                'hycom_water_u.time >= ?',
-                'hycom_water_u.time <= ?',
-                'hycom_water_u.depth >= ?',
-                'hycom_water_u.depth <= ?',
-            ]) + ' ORDER BY hycom_water_u.time, hycom_water_u.lat, hycom_water_u.lon ASC'
-
-        db.execute(sql, tuple(map(str, [
-                kwargs['south'],                kwargs['north'], 
-                kwargs['west'],                 kwargs['east'], 
-                dt_2_epoch(kwargs['start']),    dt_2_epoch(kwargs['end']),
-                kwargs['top'],                  kwargs['bottom'],
-            ])))
-        qry = np.array(db.fetchall()).T
-
-        if len(qry) == 0:
-            logging.warning(f'HYCOM water_uv: no data found in region {fmt_coords(kwargs)}, returning empty arrays')
-            return np.array([[],[],[],[],[]])
-
-        logging.debug(f'{qry.shape}  {qry[:,0]}')
-        water_u, lat, lon, epoch, depth, water_v = qry
-        val = np.sqrt(np.square(water_u.astype(float)), np.square(water_v.astype(float)))
-        return np.array((val, lat, lon, epoch, depth)).astype(float)
-
+    def load_water_uv (self, **kwargs): return load_hycom(self, 'water_uv',   kwargs)
 
     def __str__(self):
         info = '\n'.join([
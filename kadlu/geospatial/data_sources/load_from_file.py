@@ -1,15 +1,9 @@
+import os
 import logging
-from PIL import Image
-from functools import reduce
 from xml.etree import ElementTree as ET
 import json
 from datetime import datetime
 
-import matplotlib
-#if 'Qt5Agg' in matplotlib.rcsetup.all_backends: matplotlib.use('Qt5Agg')
-import mpl_scatter_density
-import matplotlib.pyplot as plt
-import netCDF4
 import numpy as np
 
 from kadlu.geospatial.data_sources.data_util        import          \
@@ -22,6 +16,63 @@ from kadlu.geospatial.data_sources.data_util        import          \
         index
 
 
+def plotting():
+    """ import matplotlib when plotting, rather than when the module is imported """
+    import matplotlib
+    #if 'Qt5Agg' in matplotlib.rcsetup.all_backends: matplotlib.use('Qt5Agg')
+    import mpl_scatter_density  # registers the scatter_density projection
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def axis_slice(arr, lo, hi, stride=1):
+    """ map coordinate boundaries to an index slice using binary search
+
+        args:
+            arr: 1D array
+                sorted coordinate axis, ascending or descending
+            lo, hi: float
+                lower and upper boundaries (inclusive)
+            stride: int
+                step size of the slice
+
+        returns:
+            slice of the axis within the boundaries
+    """
+    if len(arr) > 1 and arr[0] > arr[-1]:
+        n = len(arr)
+        return slice(n - np.searchsorted(arr[::-1], hi, side='right'),
+                     n - np.searchsorted(arr[::-1], lo, side='left'), stride)
+    return slice(np.searchsorted(arr, lo, side='left'),
+                 np.searchsorted(arr, hi, side='right'), stride)
+
+
+def read_raster(im, rows=slice(None), cols=slice(None)):
+    """ decode the pixels of an image within a window as a numpy array
+
+        args:
+            im: PIL image
+                raster image, e.g. as returned by PIL.Image.open
+            rows, cols: slice
+                pixel row (y) and column (x) index ranges of the window.
+                by default the entire image is read
+
+        returns:
+            values: numpy 2D masked array
+                pixel values as floats with shape (rows, cols). pixels 
+                matching the GDAL nodata value (tag 42113) are masked
+    """
+    r0, r1, _ = rows.indices(im.size[1])
+    c0, c1, _ = cols.indices(im.size[0])
+    window = (c0, r0, max(c0, c1), max(r0, r1))
+    if window == (0, 0, im.size[0], im.size[1]): arr = np.asarray(im, dtype=float)
+    else: arr = np.asarray(im.crop(window), dtype=float)
+
+    nodata = getattr(im, 'tag_v2', {}).get(42113)
+    mask = arr == float(nodata) if nodata is not None else np.zeros(arr.shape, dtype=bool)
+    return np.ma.MaskedArray(arr, mask=mask)
+
+
 def load_raster(filepath, plot=False, cmap=None, **kwargs):
     """ load data from raster file 
 
@@ -44,6 +95,7 @@ def load_raster(filepath, plot=False, cmap=None, **kwargs):
     if kwargs == {}: kwargs.update(dict(south=-90,west=-180,north=90,east=180))
 
     # load raster
+    from PIL import Image
     Image.MAX_IMAGE_PIXELS = 500000000
     im = Image.open(filepath)
 
@@ -55,11 +107,12 @@ def load_raster(filepath, plot=False, cmap=None, **kwargs):
         meta        = im.tag_v2[42112]  # GdalMetadata
         xml         = ET.fromstring(meta)
         params      = {tag.attrib['name'] : tag.text for tag in xml}
-        lat = np.arange(y, y + (dy * im.size[1]), dy)[ :: -1] -90
-        rng_lat = (abs(index(kwargs['north'], lat[::-1])-len(lat)), 
-                   abs(index(kwargs['south'], lat[::-1])-len(lat)))
-        lon = np.arange(x, x + (dx * im.size[0]), dx)
-        rng_lon = index(kwargs['east'], lon), index(kwargs['west'], lon)
+        lat = y - dy * np.arange(im.size[1])  # first row is the northern edge
+        window = axis_slice(lat, kwargs['south'], kwargs['north'])
+        rng_lat = window.start, window.stop
+        lon = x + dx * np.arange(im.size[0])
+        window = axis_slice(lon, kwargs['west'], kwargs['east'])
+        rng_lon = window.start, window.stop
         logging.info(f'{xml.tag}\nraster coordinate system: {im.tag_v2[34737]}'
                      f'\n{json.dumps(params, indent=2, sort_keys=True)}')
 
@@ -75,20 +128,14 @@ def load_raster(filepath, plot=False, cmap=None, **kwargs):
     else: assert False, f'error {filepath}: unknown metadata tag encoding'
     assert not (z or dz), f'error {filepath}: 3D rasters not supported yet'
 
-    # construct grid and decode pixel values
-    if reduce(np.multiply, (rng_lon[1] - rng_lon[0], rng_lat[1] - rng_lat[0])) > 10000000: 
+    # decode pixel values within the query window
+    if (rng_lon[1] - rng_lon[0]) * (rng_lat[1] - rng_lat[0]) > 10000000: 
         logging.info('this could take a few moments...')
-    grid = np.ndarray((len(np.arange(rng_lon[0], rng_lon[1])), len(np.arange(rng_lat[0], rng_lat[1]))))
-    for yi in np.arange(rng_lon[0], rng_lon[1]) -rng_lon[0]: 
-        grid[yi] = np.array(list(map(im.getpixel, zip(
-            map(int, [yi for xi in np.arange(rng_lon[0], rng_lon[1]) -rng_lon[0]]), 
-            map(int,               np.arange(rng_lat[0], rng_lat[1]) -rng_lat[0] )
-        ))))
-    mask = grid == float(im.tag_v2[42113])
-    val = np.ma.MaskedArray(grid, mask=mask)
+    val = read_raster(im, slice(*rng_lat), slice(*rng_lon)).T
 
     # plot the data
     if plot:
+        plt = plotting()
         x1, y1 = np.meshgrid(lon[rng_lon[0]:rng_lon[1]], lat[rng_lat[0]:rng_lat[1]], indexing='ij')
         fig = plt.figure()
         if (rng_lon[1]-rng_lon[0]) * (rng_lat[1]-rng_lat[0]) >= 100000:
@@ -105,9 +152,12 @@ def load_raster(filepath, plot=False, cmap=None, **kwargs):
     return val, lat[rng_lat[0]:rng_lat[1]], lon[rng_lon[0]:rng_lon[1]]
 
 
-def load_netcdf(filename, var=None, plot=False, cmap=None, **kwargs):
+def load_netcdf(filename, var=None, plot=False, cmap=None, stride=1, **kwargs):
     """ read environmental data from netcdf and output to gridded numpy array
 
+        coordinate axes are read once, and only the hyperslab of the 
+        values within the query boundaries is read from the file
+
         args:
             filename: string
                 complete filepath descriptor of netcdf file to be read
@@ -121,6 +171,9 @@ def load_netcdf(filename, var=None, plot=False, cmap=None, **kwargs):
                 print(matplotlib.pyplot.colormaps())
                 if None is supplied, pyplot will default to 
                 matplotlib.pyplot.cm.cividis
+            stride: int
+                decimation factor of the lat and lon axes. e.g. stride=4
+                reads every fourth grid point
 
         returns:
             values: numpy 2D array
@@ -129,6 +182,7 @@ def load_netcdf(filename, var=None, plot=False, cmap=None, **kwargs):
     """
     if kwargs == {}: kwargs.update(dict(south=-90,west=-180,north=90,east=180,
             start=datetime(1,1,1), end=datetime.now(), top=0, bottom=9999))
+    import netCDF4
     ncfile = netCDF4.Dataset(filename)
 
     varmap = dict(
@@ -155,50 +209,60 @@ def load_netcdf(filename, var=None, plot=False, cmap=None, **kwargs):
     assert sum(key in varmap.keys() for key in ncfile.variables.keys()) >= len(axes)-1, 'not all vars match'
     assert len(uvars) <= 1, f'more than one unknown variable: {uvars = }'
 
-    logging.info(f'loading {var or uvars[0]} from {ncfile.getncattr("title")}')
-
-    rng_lat = index(kwargs['west'],  ncfile[axes['y']][:].data), index(kwargs['east'],  ncfile[axes['y']][:].data)
-    rng_lon = index(kwargs['south'], ncfile[axes['x']][:].data), index(kwargs['north'], ncfile[axes['x']][:].data)
+    title = ncfile.title if 'title' in ncfile.ncattrs() else os.path.basename(filename)
+    logging.info(f'loading {var or uvars[0]} from {title}')
 
-    out = {} if not 'v' in axes.keys() else dict(val=ncfile[axes['v']][:].data[rng_lat[0]:rng_lat[1], rng_lon[0]:rng_lon[1]])
-    out.update(dict(lat=ncfile[axes['y']][:].data[rng_lat[0]:rng_lat[1]], lon=ncfile[axes['x']][:].data[rng_lon[0]:rng_lon[1]]))
+    # read each coordinate axis once, and map the boundaries to index ranges
+    coords = {key: ncfile[axes[key]][:].data for key in ('x', 'y', 't', 'z') 
+              if key in axes.keys() and ncfile[axes[key]].ndim == 1}
+    slices = dict(
+            y=axis_slice(coords['y'], kwargs['south'], kwargs['north'], stride),
+            x=axis_slice(coords['x'], kwargs['west'],  kwargs['east'],  stride),
+        )
+    out = dict(lat=coords['y'][slices['y']], lon=coords['x'][slices['x']])
 
     # temporal index range
     if 't' in axes.keys(): 
         if ncfile.variables[axes['t']].units == 'days since 1990-01-01T00:00:00Z':
             t0 = datetime(1990,1,1)
-            rng_t = (index(dt_2_epoch(kwargs['start'], t0), ncfile[axes['t']][:].data * 24), 
-                     index(dt_2_epoch(kwargs['end'], t0), ncfile[axes['t']][:].data * 24))
-            out['time'] = epoch_2_dt(ncfile[axes['t']][:].data[rng_t[0]:rng_t[1]] * 24, t0)
+            slices['t'] = axis_slice(coords['t'] * 24, 
+                    dt_2_epoch(kwargs['start'], t0), dt_2_epoch(kwargs['end'], t0))
+            out['time'] = epoch_2_dt(coords['t'][slices['t']] * 24, t0)
         else:
             assert False, 'unknown time unit'
 
     # vertical index range
-    if 'z' in axes.keys() and 'v' in axes.keys(): 
-        rng_z = (index(kwargs['top'], ncfile[axes['z']][:].data),
-                 index(kwargs['bottom'], ncfile[axes['z']][:].data))
-        out['depth'] = ncfile[axes['z']][:].data[rng_z[0]:rng_z[1]]
+    if 'z' in coords.keys() and 'v' in axes.keys(): 
+        slices['z'] = axis_slice(coords['z'], kwargs['top'], kwargs['bottom'])
+        out['depth'] = coords['z'][slices['z']]
     elif 'z' in axes.keys() and not 'v' in axes.keys() and len(axes.keys()) == 3:
         # when loading bathymetry, z-axis are the intended first column values
-        out = dict(val=ncfile[axes['z']][:].data[rng_lat[0]:rng_lat[1], rng_lon[0]:rng_lon[1]], lat=out['lat'].copy(), lon=out['lon'].copy())
-        if axes['z'] == 'elevation': out['val'] *= -1
+        axes['v'] = axes['z']
     else: assert 'v' in axes.keys(), 'something may have gone wrong here...'
+
+    # read the hyperslab of the values within the index ranges
+    values = ncfile[axes['v']]
+    hyperslab = tuple(slices.get(varmap.get(dim), slice(None)) 
+                      for dim in values.dimensions)
+    out = dict(val=np.ma.getdata(values[hyperslab]), **out)
+    if axes['v'] == 'elevation': out['val'] *= -1
+    ncfile.close()
     
     # assert 'f' not in axes.keys(), 'functions axis not yet supported'
 
     # plot the data
     if plot and len(out.keys()) == 3:
-        x1, y1 = np.meshgrid(out['lon'][rng_lon[0]:rng_lon[1]], out['lat'][rng_lat[0]:rng_lat[1]], indexing='ij')
+        plt = plotting()
+        x1, y1 = np.meshgrid(out['lon'], out['lat'], indexing='ij')
         fig = plt.figure()
-        if (rng_lon[1]-rng_lon[0]) * (rng_lat[1]-rng_lat[0]) >= 100000:
+        if x1.size >= 100000:
             ax = fig.add_subplot(1,1,1, projection='scatter_density')
             plt.axis('scaled')
-            raster = ax.scatter_density(x1, y1, c=val, cmap=cmap)
+            raster = ax.scatter_density(x1, y1, c=out['val'].T, cmap=cmap)
             plt.tight_layout()
         else:
             ax = fig.add_subplot(1,1,1)
-            ax.scatter(x1, y1, c=val, cmap=cmap)
+            ax.scatter(x1, y1, c=out['val'].T, cmap=cmap)
         plt.show()
 
     return list(out.values())
-
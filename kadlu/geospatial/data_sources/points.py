@@ -0,0 +1,283 @@
+"""
+    Kadlu API for point time series
+
+    loads the time series of a variable at a list of sites, e.g.
+    hydrophone stations, over long time periods. each site is mapped once
+    to the grid node nearest to it (method='nearest'), or to the four
+    nodes bracketing it (method='bilinear'), and only the rows of those
+    nodes are read from the database across the time range. the rows are
+    found with a location index on each table, leading with lat, lon
+    rather than time, so that the cost of a query grows with the number
+    of sites and timestamps instead of the area around the sites. the
+    location indexes are created on first use
+
+    example:
+        val, epoch = kadlu.load_points('era5', 'waveheight',
+                lat=[44.5, 47.1], lon=[-63.3, -61.0],
+                start=datetime(2015, 1, 1), end=datetime(2020, 1, 1))
+
+        # val has one row per site and one column per timestamp
+        assert val.shape == (2, len(epoch))
+"""
+
+import logging
+
+import numpy as np
+
+import kadlu.geospatial.data_sources.fetch_handler
+from kadlu.geospatial.data_sources.source_map import load_map
+from kadlu.geospatial.data_sources.data_util        import          \
+        database_cfg,                                               \
+        dt_2_epoch,                                                 \
+        query_rows
+
+
+# database table of each variable, and whether the table has a depth column
+point_tables = dict(
+        temp_hycom          = ('hycom_water_temp', True),
+        salinity_hycom      = ('hycom_salinity', True),
+        water_uv_hycom      = ('hycom_water_uv', True),
+        water_u_hycom       = ('hycom_water_u', True),
+        water_v_hycom       = ('hycom_water_v', True),
+        wavedir_era5        = ('mean_wave_direction', False),
+        waveheight_era5     = ('significant_height_of_combined_wind_waves_and_swell', False),
+        waveperiod_era5     = ('mean_wave_period', False),
+        wind_uv_era5        = ('wind_speed', False),
+        wind_u_era5         = ('u_component_of_wind', False),
+        wind_v_era5         = ('v_component_of_wind', False),
+        wavedir_wwiii       = ('dp', False),
+        waveheight_wwiii    = ('hs', False),
+        waveperiod_wwiii    = ('tp', False),
+        wind_uv_wwiii       = ('windUV', False),
+        wind_u_wwiii        = ('windU', False),
+        wind_v_wwiii        = ('windV', False),
+    )
+
+# coarsest grid spacing of each source in degrees. data is fetched within
+# one grid spacing of each site, and grid nodes are searched for within
+# up to four grid spacings, in case the nearest nodes are masked (e.g. land)
+grid_spacing = dict(hycom=0.08, era5=0.25, wwiii=0.5)
+
+
+def location_index(db, table, depth):
+    """ create the index used to read the rows of a grid node """
+    cols = 'lat, lon, depth, time' if depth else 'lat, lon, time'
+    db.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_loc on {table}({cols})')
+    db.connection.commit()
+
+
+def node_weights(y, x, lat, lon, method='nearest'):
+    """ grid nodes and weights used to estimate the value at a site
+
+        args:
+            y, x: float
+                latitude and longitude of the site
+            lat, lon: arrays
+                coordinates of the grid nodes around the site
+            method: string
+                'nearest' or 'bilinear'. nodes missing from a bilinear
+                cell (e.g. masked as land) are left out and the weights
+                of the others are normalized
+
+        return:
+            idx: array
+                indices of the selected nodes
+            w: array
+                weight of each node
+    """
+    if len(lat) == 0: return np.array([], dtype=int), np.array([])
+    nearest = lambda: (np.array([np.argmin((lat - y)**2 +
+            ((lon - x) * np.cos(np.radians(y)))**2)]), np.ones(1))
+    if method == 'nearest': return nearest()
+
+    def bracket(axis, v):
+        lo, hi = axis[axis <= v], axis[axis >= v]
+        a = lo.max() if len(lo) > 0 else hi.min()
+        b = hi.min() if len(hi) > 0 else lo.max()
+        return a, b, (0 if a == b else (v - a) / (b - a))
+
+    y0, y1, wy = bracket(np.unique(lat), y)
+    x0, x1, wx = bracket(np.unique(lon), x)
+    idx, w = [], []
+    for yy, wyy in ((y0, 1 - wy), (y1, wy)):
+        for xx, wxx in ((x0, 1 - wx), (x1, wx)):
+            match = np.flatnonzero((lat == yy) & (lon == xx))
+            if len(match) > 0 and wyy * wxx > 0:
+                idx.append(match[0])
+                w.append(wyy * wxx)
+    if len(idx) == 0: return nearest()
+    return np.array(idx), np.array(w) / np.sum(w)
+
+
+def bracketed(y, x, lat, lon, method):
+    """ check if the nodes found around a site are sufficient for method """
+    if method == 'nearest': return len(lat) > 0
+    return (np.any(lat <= y) and np.any(lat >= y)
+            and np.any(lon <= x) and np.any(lon >= x))
+
+
+def grid_nodes(db, table, y, x, t0, t1, method, spacing):
+    """ distinct grid nodes stored near a site within the time range. the
+        search is widened up to four grid spacings until the site is
+        bracketed. nodes are found by seeking the location index from one
+        node to the next, rather than scanning the rows of each node
+    """
+    seek = lambda sql, args: db.execute(sql, args).fetchone()[0]
+    radius = spacing
+    while True:
+        lat, lon = [], []
+        south, north, west, east = y - radius, y + radius, x - radius, x + radius
+        ylat = seek(f'SELECT MIN(lat) FROM {table} WHERE lat >= ? AND lat <= ?', (south, north))
+        while ylat is not None:
+            xlon = seek(f'SELECT MIN(lon) FROM {table} WHERE lat == ? '
+                         'AND lon >= ? AND lon <= ?', (ylat, west, east))
+            while xlon is not None:
+                if db.execute(f'SELECT 1 FROM {table} WHERE lat == ? AND lon == ? '
+                               'AND time >= ? AND time <= ? LIMIT 1',
+                               (ylat, xlon, t0, t1)).fetchone() is not None:
+                    lat.append(ylat)
+                    lon.append(xlon)
+                xlon = seek(f'SELECT MIN(lon) FROM {table} WHERE lat == ? '
+                             'AND lon > ? AND lon <= ?', (ylat, xlon, east))
+            ylat = seek(f'SELECT MIN(lat) FROM {table} WHERE lat > ? AND lat <= ?', (ylat, north))
+        lat, lon = np.array(lat, dtype=float), np.array(lon, dtype=float)
+        if bracketed(y, x, lat, lon, method) or radius >= 4 * spacing:
+            return lat, lon
+        radius *= 2
+
+
+def node_series(db, table, lat, lon, t0, t1, depth=None):
+    """ read the time series of a single grid node. if depth is given,
+        the depth level nearest to it at the node is read
+
+        return:
+            epoch, val: arrays
+    """
+    if depth is None:
+        return query_rows(db, ' AND '.join([
+                f'SELECT time, val FROM {table} WHERE lat == ?',
+                'lon == ?',
+                'time >= ?',
+                'time <= ? ']) + 'ORDER BY time',
+                (lat, lon, t0, t1), table=table)
+
+    levels = [db.execute(' AND '.join([
+            f'SELECT depth FROM {table} WHERE lat == ?',
+            'lon == ?',
+            f'depth {op} ? ']) + f'ORDER BY depth {order} LIMIT 1',
+            (lat, lon, depth)).fetchone()
+            for op, order in (('<=', 'DESC'), ('>=', 'ASC'))]
+    levels = [row[0] for row in levels if row is not None]
+    if len(levels) == 0: return np.empty((2, 0))
+    level = min(levels, key=lambda d: abs(d - depth))
+    return query_rows(db, ' AND '.join([
+            f'SELECT time, val FROM {table} WHERE lat == ?',
+            'lon == ?',
+            'depth == ?',
+            'time >= ?',
+            'time <= ? ']) + 'ORDER BY time',
+            (lat, lon, level, t0, t1), table=table)
+
+
+def load_points(source, var, lat, lon, start, end, depth=0,
+        method='nearest', fetch=True):
+    """ load the time series of a variable at a list of sites
+
+        args:
+            source, var: strings
+                to view the complete list of sources and variables:
+                print(kadlu.source_map)
+            lat, lon: arrays
+                coordinates of the sites
+            start, end: datetime
+                time range, inclusive
+            depth: float
+                depth in metres, for variables with a depth axis. the
+                nearest depth level available at each grid node is read
+            method: string
+                'nearest' to read the grid node nearest to each site, or
+                'bilinear' to interpolate between the four nodes
+                bracketing each site
+            fetch: boolean
+                fetch missing data around each site before loading
+
+        return:
+            val: array
+                values with one row per site and one column per timestamp.
+                NaN where no data was found for a site at a timestamp
+            epoch: array
+                timestamps in epoch hours since jan 1 2000
+    """
+    source, var = source.lower(), var.lower()
+    key = f'{var}_{source}'
+    lat, lon = np.atleast_1d(lat).astype(float), np.atleast_1d(lon).astype(float)
+    assert len(lat) == len(lon), 'lat and lon must have the same length'
+    assert method in ('nearest', 'bilinear'), f'unknown interpolation {method=}'
+    assert key in point_tables.keys() or key in load_map.keys() \
+            and not var.startswith('bathy'), f'error: invalid source or variable '\
+            f'for point time series. valid options include: \n\n'\
+            f'{list(f.rsplit("_", 1)[::-1] for f in point_tables.keys())}'
+    t0, t1 = dt_2_epoch(start), dt_2_epoch(end)
+
+    # map each site to grid nodes, each distinct node is read once
+    nodes, sites, series = {}, [], []
+    if key in point_tables.keys():
+        table, has_depth = point_tables[key]
+        spacing = grid_spacing[source]
+        conn, db = database_cfg()
+        location_index(db, table, has_depth)
+        for y, x in zip(lat, lon):
+            if fetch:
+                qry = dict(south=y - spacing, north=y + spacing,
+                           west=x - spacing, east=x + spacing, start=start, end=end)
+                if has_depth: qry.update(top=depth, bottom=depth)
+                kadlu.geospatial.data_sources.fetch_handler.fetch_handler(var, source, **qry)
+            nlat, nlon = grid_nodes(db, table, y, x, t0, t1, method, spacing)
+            idx, w = node_weights(y, x, nlat, nlon, method)
+            ids = []
+            for i in idx:
+                node = (nlat[i], nlon[i])
+                if node not in nodes:
+                    nodes[node] = len(series)
+                    series.append(node_series(db, table, *node, t0, t1,
+                            depth if has_depth else None))
+                ids.append(nodes[node])
+            sites.append((np.array(ids, dtype=int), w))
+
+    # sources not stored in the database are loaded around each site
+    else:
+        for y, x in zip(lat, lon):
+            rows = load_map[key](south=y, north=y, west=x, east=x,
+                    start=start, end=end, top=depth, bottom=depth)
+            nlat, nlon = np.unique(rows[1:3], axis=1)
+            idx, w = node_weights(y, x, nlat, nlon, method)
+            ids = []
+            for i in idx:
+                node = (nlat[i], nlon[i])
+                if node not in nodes:
+                    nodes[node] = len(series)
+                    mask = (rows[1] == node[0]) & (rows[2] == node[1])
+                    series.append(rows[[3, 0]][:, mask])
+                ids.append(nodes[node])
+            sites.append((np.array(ids, dtype=int), w))
+
+    # align the node series on a common time axis
+    epoch = np.unique(np.concatenate([s[0] for s in series] + [np.empty(0)]))
+    nodeval = np.full((len(series), len(epoch)), np.nan)
+    for i, (t, v) in enumerate(series):
+        nodeval[i, np.searchsorted(epoch, t)] = v
+
+    val = np.full((len(lat), len(epoch)), np.nan)
+    for s, (ids, w) in enumerate(sites):
+        if len(ids) == 0:
+            logging.warning(f'{key}: no data found near site {lat[s]}, {lon[s]}')
+            continue
+        v = nodeval[ids]
+        ok = np.isfinite(v)
+        wsum = (ok * w[:, None]).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            val[s] = np.where(ok, v * w[:, None], 0).sum(axis=0) / wsum
+
+    logging.info(f'{key}: loaded {len(epoch)} timestamps at {len(lat)} sites '
+                 f'from {len(series)} grid nodes')
+    return val, epoch
@@ -2,60 +2,90 @@
     some data fetching utils, function maps, and constant variables
 """
 
+import importlib
+from functools import lru_cache
 from datetime import datetime, timedelta
 
-import kadlu.geospatial.data_sources.chs as chs
-import kadlu.geospatial.data_sources.era5 as era5
-import kadlu.geospatial.data_sources.gebco as gebco
-import kadlu.geospatial.data_sources.hycom as hycom
-import kadlu.geospatial.data_sources.wwiii as wwiii
+
+@lru_cache(maxsize=None)
+def source_instance(module, cls):
+    """ import a data source module and return a shared instance of its class """
+    return getattr(importlib.import_module(f'kadlu.geospatial.data_sources.{module}'), cls)()
+
+
+def source_fcn(module, cls, method):
+    """ defer importing a data source module until one of its functions is 
+        called. the module dependencies (pygrib, cdsapi, PIL, netCDF4) are
+        only imported for the sources that are used
+    """
+    def fcn(*args, **kwargs):
+        return getattr(source_instance(module, cls), method)(*args, **kwargs)
+    fcn.__name__ = fcn.__qualname__ = f'{cls}.{method}'
+    return fcn
 
 
 # dicts for mapping strings to callback functions
 # helpful for passing source strings to the ocean module,
 # and having the module determine which function to use for loading
 fetch_map = dict(
-        bathy_chs           = chs  .Chs()  .fetch_bathymetry,
-        temp_hycom          = hycom.Hycom().fetch_temp,
-        salinity_hycom      = hycom.Hycom().fetch_salinity,
-        water_uv_hycom      = hycom.Hycom().fetch_water_v,
-        water_u_hycom       = hycom.Hycom().fetch_water_u,
-        water_v_hycom       = hycom.Hycom().fetch_water_v,
-        wavedir_era5        = era5 .Era5() .fetch_wavedirection,
-        waveheight_era5     = era5 .Era5() .fetch_windwaveswellheight,
-        waveperiod_era5     = era5 .Era5() .fetch_waveperiod,
-        wind_uv_era5        = era5 .Era5() .fetch_wind_uv,
-        wind_u_era5         = era5 .Era5() .fetch_wind_u,
-        wind_v_era5         = era5 .Era5() .fetch_wind_v,
-        wavedir_wwiii       = wwiii.Wwiii().fetch_wavedirection,
-        waveheight_wwiii    = wwiii.Wwiii().fetch_windwaveheight,
-        waveperiod_wwiii    = wwiii.Wwiii().fetch_waveperiod,
-        wind_uv_wwiii       = wwiii.Wwiii().fetch_wind_uv,
-        wind_u_wwiii        = wwiii.Wwiii().fetch_wind_u,
-        wind_v_wwiii        = wwiii.Wwiii().fetch_wind_v,
-        bathy_gebco         = gebco.Gebco().fetch_bathymetry,
+        bathy_chs           = source_fcn('chs', 'Chs', 'fetch_bathymetry'),
+        temp_hycom          = source_fcn('hycom', 'Hycom', 'fetch_temp'),
+        salinity_hycom      = source_fcn('hycom', 'Hycom', 'fetch_salinity'),
+        water_uv_hycom      = source_fcn('hycom', 'Hycom', 'fetch_water_uv'),
+        water_u_hycom       = source_fcn('hycom', 'Hycom', 'fetch_water_u'),
+        water_v_hycom       = source_fcn('hycom', 'Hycom', 'fetch_water_v'),
+        wavedir_era5        = source_fcn('era5', 'Era5', 'fetch_wavedirection'),
+        waveheight_era5     = source_fcn('era5', 'Era5', 'fetch_windwaveswellheight'),
+        waveperiod_era5     = source_fcn('era5', 'Era5', 'fetch_waveperiod'),
+        wind_uv_era5        = source_fcn('era5', 'Era5', 'fetch_wind_uv'),
+        wind_u_era5         = source_fcn('era5', 'Era5', 'fetch_wind_u'),
+        wind_v_era5         = source_fcn('era5', 'Era5', 'fetch_wind_v'),
+        wavedir_wwiii       = source_fcn('wwiii', 'Wwiii', 'fetch_wavedirection'),
+        waveheight_wwiii    = source_fcn('wwiii', 'Wwiii', 'fetch_windwaveheight'),
+        waveperiod_wwiii    = source_fcn('wwiii', 'Wwiii', 'fetch_waveperiod'),
+        wind_uv_wwiii       = source_fcn('wwiii', 'Wwiii', 'fetch_wind_uv'),
+        wind_u_wwiii        = source_fcn('wwiii', 'Wwiii', 'fetch_wind_u'),
+        wind_v_wwiii        = source_fcn('wwiii', 'Wwiii', 'fetch_wind_v'),
+        bathy_gebco         = source_fcn('gebco', 'Gebco', 'fetch_bathymetry'),
+    )
+
+# sources able to fetch several variables in a single request
+batch_fetch_map = dict(
+        hycom               = source_fcn('hycom', 'Hycom', 'fetch_batch'),
     )
 
 load_map = dict(
-        bathy_chs           = chs  .Chs()  .load_bathymetry,
-        temp_hycom          = hycom.Hycom().load_temp,
-        salinity_hycom      = hycom.Hycom().load_salinity,
-        water_uv_hycom      = hycom.Hycom().load_water_uv,
-        water_u_hycom       = hycom.Hycom().load_water_u,
-        water_v_hycom       = hycom.Hycom().load_water_v,
-        wavedir_era5        = era5 .Era5() .load_wavedirection,
-        waveheight_era5     = era5 .Era5() .load_windwaveswellheight,
-        waveperiod_era5     = era5 .Era5() .load_waveperiod,
-        wind_uv_era5        = era5 .Era5() .load_wind_uv,
-        wind_u_era5         = era5 .Era5() .load_wind_u,
-        wind_v_era5         = era5 .Era5() .load_wind_v,
-        wavedir_wwiii       = wwiii.Wwiii().load_wavedirection,
-        waveheight_wwiii    = wwiii.Wwiii().load_windwaveheight,
-        waveperiod_wwiii    = wwiii.Wwiii().load_waveperiod,
-        wind_uv_wwiii       = wwiii.Wwiii().load_wind_uv,
-        wind_u_wwiii        = wwiii.Wwiii().load_wind_u,
-        wind_v_wwiii        = wwiii.Wwiii().load_wind_v,
-        bathy_gebco         = gebco.Gebco().load_bathymetry,
+        bathy_chs           = source_fcn('chs', 'Chs', 'load_bathymetry'),
+        temp_hycom          = source_fcn('hycom', 'Hycom', 'load_temp'),
+        salinity_hycom      = source_fcn('hycom', 'Hycom', 'load_salinity'),
+        water_uv_hycom      = source_fcn('hycom', 'Hycom', 'load_water_uv'),
+        water_u_hycom       = source_fcn('hycom', 'Hycom', 'load_water_u'),
+        water_v_hycom       = source_fcn('hycom', 'Hycom', 'load_water_v'),
+        wavedir_era5        = source_fcn('era5', 'Era5', 'load_wavedirection'),
+        waveheight_era5     = source_fcn('era5', 'Era5', 'load_windwaveswellheight'),
+        waveperiod_era5     = source_fcn('era5', 'Era5', 'load_waveperiod'),
+        wind_uv_era5        = source_fcn('era5', 'Era5', 'load_wind_uv'),
+        wind_u_era5         = source_fcn('era5', 'Era5', 'load_wind_u'),
+        wind_v_era5         = source_fcn('era5', 'Era5', 'load_wind_v'),
+        wavedir_wwiii       = source_fcn('wwiii', 'Wwiii', 'load_wavedirection'),
+        waveheight_wwiii    = source_fcn('wwiii', 'Wwiii', 'load_windwaveheight'),
+        waveperiod_wwiii    = source_fcn('wwiii', 'Wwiii', 'load_waveperiod'),
+        wind_uv_wwiii       = source_fcn('wwiii', 'Wwiii', 'load_wind_uv'),
+        wind_u_wwiii        = source_fcn('wwiii', 'Wwiii', 'load_wind_u'),
+        wind_v_wwiii        = source_fcn('wwiii', 'Wwiii', 'load_wind_v'),
+        bathy_gebco         = source_fcn('gebco', 'Gebco', 'load_bathymetry'),
+        bathy_synthetic     = source_fcn('synthetic', 'Synthetic', 'load_bathymetry'),
+        temp_synthetic      = source_fcn('synthetic', 'Synthetic', 'load_temp'),
+        salinity_synthetic  = source_fcn('synthetic', 'Synthetic', 'load_salinity'),
+        water_uv_synthetic  = source_fcn('synthetic', 'Synthetic', 'load_water_uv'),
+        water_u_synthetic   = source_fcn('synthetic', 'Synthetic', 'load_water_u'),
+        water_v_synthetic   = source_fcn('synthetic', 'Synthetic', 'load_water_v'),
+        wavedir_synthetic   = source_fcn('synthetic', 'Synthetic', 'load_wavedirection'),
+        waveheight_synthetic= source_fcn('synthetic', 'Synthetic', 'load_waveheight'),
+        waveperiod_synthetic= source_fcn('synthetic', 'Synthetic', 'load_waveperiod'),
+        wind_uv_synthetic   = source_fcn('synthetic', 'Synthetic', 'load_wind_uv'),
+        wind_u_synthetic    = source_fcn('synthetic', 'Synthetic', 'load_wind_u'),
+        wind_v_synthetic    = source_fcn('synthetic', 'Synthetic', 'load_wind_v'),
     )
 
 # some reasonable default kwargs
@@ -76,7 +106,7 @@ source_map = (
           wavedir:          mean wave direction, degrees
           waveheight:       combined height of wind, waves, and swell. metres
           waveperiod:       mean wave period, seconds
-          wind_uv:          wind speed computed as sqrt(u^2 + v^2) / 2, where u, v are direction vectors
+          wind_uv:          wind speed computed as sqrt(u^2 + v^2), where u, v are direction vectors
           wind_u:           wind speed coordinate U-vector, m/s
           wind_v:           wind speed coordinate V-vector, m/s \n
     GEBCO (General Bathymetric Chart of the Oceans)
@@ -84,15 +114,18 @@ source_map = (
     HYCOM (Hybrid Coordinate Ocean Model)
           salinity:         g/kg salt in water
           temp:             degrees celsius
-          water_uv:         ocean current computed as sqrt(u^2 + v^2) / 2, where u, v are direction vectors
+          water_uv:         ocean current computed as sqrt(u^2 + v^2), where u, v are direction vectors
           water_u:          ocean current coordinate U-vector, m/s
           water_v:          ocean current coordinate V-vector, m/s \n
     WWIII (WaveWatch Ocean Model Gen 3)
           wavedir:          primary wave direction, degrees
           waveheight:       combined height of wind and waves, metres
           waveperiod:       primary mean wave period, seconds
-          wind_uv:          wind speed computed as sqrt(u^2 + v^2) / 2, where u, v are direction vectors
+          wind_uv:          wind speed computed as sqrt(u^2 + v^2), where u, v are direction vectors
           wind_u:           wind speed coordinate U-vector, m/s
-          wind_v:           wind speed coordinate V-vector, m/s
+          wind_v:           wind speed coordinate V-vector, m/s \n
+    SYNTHETIC (seeded analytic fields for testing, computed without fetching)
+          bathymetry, temp, salinity, water_uv, water_u, water_v,
+          wavedir, waveheight, waveperiod, wind_uv, wind_u, wind_v
     """)
 
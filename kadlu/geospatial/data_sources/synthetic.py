@@ -0,0 +1,217 @@
+"""
+    Kadlu API for synthetic ocean data
+
+    fields are analytic functions of latitude, longitude, time and depth,
+    built from a sum of sinusoidal modes with seeded wavenumbers and
+    phases. values are computed on request at any resolution, region and
+    time range, and returned in the same shapes as the other loaders.
+    nothing is fetched or stored, so the source can be used to test the
+    ocean and sound modules at production grid sizes without network
+    access
+
+    the fields depend on the coordinates and the seed only, not on the
+    query boundaries: overlapping queries return the same values at the
+    same grid points
+
+    the default resolution, time step and seed can be set in config.ini:
+
+        [synthetic]
+        resolution = 0.08
+        timestep = 3
+        seed = 0
+"""
+
+import zlib
+from datetime import timedelta
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.data_util        import          \
+        dt_2_epoch,                                                 \
+        str_def,                                                    \
+        cfg
+
+
+# standard depth levels of the HYCOM GLBv0.08 dataset, in metres
+synthetic_depths = np.array([0.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 15.0,
+        20.0, 25.0, 30.0, 35.0, 40.0, 45.0, 50.0, 60.0, 70.0, 80.0, 90.0,
+        100.0, 125.0, 150.0, 200.0, 250.0, 300.0, 350.0, 400.0, 500.0, 600.0,
+        700.0, 800.0, 900.0, 1000.0, 1250.0, 1500.0, 2000.0, 2500.0, 3000.0,
+        4000.0, 5000.0])
+
+
+def modes(name, seed, n=8, scale=(0.2, 3), period=(24, 240)):
+    """ sum of n sinusoidal modes, normalized to the range [-1, 1]
+
+        args:
+            name: string
+                field name. fields with different names are independent
+            seed: int
+                random seed of the wavenumbers, frequencies and phases
+            n: int
+                number of modes
+            scale: tuple
+                range of the mode wavelengths in degrees
+            period: tuple
+                range of the mode periods in hours
+
+        return:
+            function f(lat, lon, epoch) of broadcastable arrays
+    """
+    rng = np.random.default_rng([seed, zlib.crc32(name.encode())])
+    wavelength = rng.uniform(*scale, n)
+    angle = rng.uniform(0, 2 * np.pi, n)
+    ky, kx = 2 * np.pi / wavelength * np.sin(angle), 2 * np.pi / wavelength * np.cos(angle)
+    omega = 2 * np.pi / rng.uniform(*period, n)
+    phase = rng.uniform(0, 2 * np.pi, n)
+    amp = rng.uniform(0.5, 1, n) / np.arange(1, n + 1)
+    amp /= amp.sum()
+
+    def f(lat, lon, epoch=0):
+        val = 0
+        for i in range(n):
+            val = val + amp[i] * np.sin(ky[i] * lat + kx[i] * lon + omega[i] * epoch + phase[i])
+        return val
+    return f
+
+
+def lattice(lo, hi, step, bracket=True):
+    """ points of the global lattice with spacing step in the range [lo, hi].
+        if bracket is True and the range contains less than two points, 
+        the points bracketing the range are returned instead
+    """
+    a, b = np.ceil(lo / step - 1e-9), np.floor(hi / step + 1e-9)
+    if bracket and b - a < 1: a, b = np.floor(lo / step + 1e-9), np.ceil(hi / step - 1e-9)
+    if bracket and b - a < 1: b = a + 1
+    return np.arange(a, b + 1) * step
+
+
+class Synthetic():
+    """ seeded analytic ocean fields, computed on request
+
+        args:
+            resolution: float
+                horizontal grid spacing in degrees
+            timestep: float
+                time step in hours
+            seed: int
+                seed of the random field modes
+            depths: array
+                depth levels in metres. defaults to the HYCOM depth levels
+    """
+
+    def __init__(self, resolution=None, timestep=None, seed=None, depths=None):
+        self.resolution = resolution or cfg.getfloat('synthetic', 'resolution', fallback=0.08)
+        self.timestep = timestep or cfg.getfloat('synthetic', 'timestep', fallback=3)
+        self.seed = seed if seed is not None else cfg.getint('synthetic', 'seed', fallback=0)
+        self.depths = synthetic_depths if depths is None else np.asarray(depths, dtype=float)
+
+    def field(self, name):
+        return modes(name, self.seed)
+
+    def grid(self, south, north, west, east, start=None, end=None,
+            top=None, bottom=None, resolution=None, **kwargs):
+        """ grid coordinates of a query, ordered by time, depth, lat, lon
+
+            return:
+                lat, lon, epoch, depth: arrays
+                    flattened coordinate grid. epoch and depth are None if
+                    the query has no time range or depth range
+        """
+        res = resolution or self.resolution
+        axes = [lattice(south, north, res), lattice(west, east, res)]
+        epoch, depth = None, None
+        if start is not None:
+            t0, t1 = dt_2_epoch(start), dt_2_epoch(end or start + timedelta(hours=self.timestep))
+            epoch = lattice(t0, t1, self.timestep, bracket=False)
+        if top is not None:
+            depth = self.depths[(self.depths >= top) & (self.depths <= bottom)]
+            if len(depth) == 0: depth = self.depths[[np.argmin(np.abs(self.depths - top))]]
+        axes = [a for a in (epoch, depth) if a is not None] + axes
+        grid = [a.ravel() for a in np.meshgrid(*axes, indexing='ij')]
+        lat, lon = grid[-2:]
+        if epoch is not None: epoch = grid[0]
+        if depth is not None: depth = grid[-3]
+        return lat, lon, epoch, depth
+
+    def bathymetry(self, lat, lon):
+        """ depth of the seafloor in metres: a slope from 200m to 4800m,
+            with ridges and canyons
+        """
+        slope = 2500 + 2300 * self.field('bathy_slope')(lat / 4, lon / 4)
+        relief = 400 * self.field('bathy_relief')(lat * 4, lon * 4)
+        return np.maximum(slope + relief, 10)
+
+    def temp(self, lat, lon, epoch, depth):
+        """ temperature in degrees celsius, decaying with depth from the
+            sea surface temperature to 2 degrees
+        """
+        sst = 28 - 0.3 * np.abs(lat) + 2 * self.field('temp')(lat, lon, epoch)
+        return 2 + (sst - 2) * np.exp(-depth / 400)
+
+    def salinity(self, lat, lon, epoch, depth):
+        """ salinity in g/kg, increasing with depth """
+        surface = 34 + 0.5 * self.field('salinity')(lat, lon, epoch)
+        return surface + 0.8 * (1 - np.exp(-depth / 300))
+
+    def current(self, component, lat, lon, epoch, depth):
+        """ current velocity component in m/s, decaying with depth """
+        return 0.5 * self.field(f'water_{component}')(lat, lon, epoch) * np.exp(-depth / 200)
+
+    def wind(self, component, lat, lon, epoch):
+        """ wind velocity component in m/s """
+        return 12 * self.field(f'wind_{component}')(lat, lon, epoch)
+
+    def waves(self, var, lat, lon, epoch):
+        """ wave height (m), period (s) and direction (degrees),
+            following the wind
+        """
+        u, v = self.wind('u', lat, lon, epoch), self.wind('v', lat, lon, epoch)
+        height = 0.3 + 0.025 * (u**2 + v**2)
+        if var == 'waveheight': return height
+        if var == 'waveperiod': return 3 + 2.5 * np.sqrt(height)
+        return np.degrees(np.arctan2(u, v)) % 360
+
+    def load_2D(self, fcn, kwargs, **fields):
+        """ evaluate fcn on the query grid, return val, lat, lon, epoch """
+        assert kwargs.get('start') is not None, 'malformed query: start is required'
+        lat, lon, epoch, _ = self.grid(**{**kwargs, 'top': None})
+        return np.array((fcn(lat=lat, lon=lon, epoch=epoch, **fields), lat, lon, epoch))
+
+    def load_3D(self, fcn, kwargs, **fields):
+        """ evaluate fcn on the query grid, return val, lat, lon, epoch, depth """
+        assert kwargs.get('start') is not None, 'malformed query: start is required'
+        kwargs = dict(dict(top=0, bottom=5000), **kwargs)
+        lat, lon, epoch, depth = self.grid(**kwargs)
+        return np.array((fcn(lat=lat, lon=lon, epoch=epoch, depth=depth, **fields),
+                lat, lon, epoch, depth))
+
+    def load_bathymetry(self, **kwargs):
+        kwargs = dict(kwargs, start=None, top=None)
+        lat, lon, _, _ = self.grid(**kwargs)
+        return np.array((self.bathymetry(lat, lon), lat, lon))
+
+    def load_temp(self, **kwargs):          return self.load_3D(self.temp, kwargs)
+    def load_salinity(self, **kwargs):      return self.load_3D(self.salinity, kwargs)
+    def load_water_u(self, **kwargs):       return self.load_3D(self.current, kwargs, component='u')
+    def load_water_v(self, **kwargs):       return self.load_3D(self.current, kwargs, component='v')
+    def load_wind_u(self, **kwargs):        return self.load_2D(self.wind, kwargs, component='u')
+    def load_wind_v(self, **kwargs):        return self.load_2D(self.wind, kwargs, component='v')
+    def load_wavedirection(self, **kwargs): return self.load_2D(self.waves, kwargs, var='wavedir')
+    def load_waveheight(self, **kwargs):    return self.load_2D(self.waves, kwargs, var='waveheight')
+    def load_waveperiod(self, **kwargs):    return self.load_2D(self.waves, kwargs, var='waveperiod')
+
+    def load_water_uv(self, **kwargs):
+        u, v = self.load_water_u(**kwargs), self.load_water_v(**kwargs)
+        return np.array((np.hypot(u[0], v[0]), *u[1:]))
+
+    def load_wind_uv(self, **kwargs):
+        u, v = self.load_wind_u(**kwargs), self.load_wind_v(**kwargs)
+        return np.array((np.hypot(u[0], v[0]), *u[1:]))
+
+    def __str__(self):
+        info = '\n'.join(['Synthetic ocean data computed from seeded analytic fields',
+            f'\tresolution: {self.resolution} degrees, timestep: {self.timestep} hours, '
+            f'seed: {self.seed}'])
+        args = '(south, north, west, east, start, end, top, bottom, resolution)'
+        return str_def(self, info, args)
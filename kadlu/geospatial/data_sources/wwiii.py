@@ -16,29 +16,40 @@ from os.path import isfile
 from datetime import datetime, timedelta
 
 import numpy as np
-import pygrib
 
 import kadlu.geospatial.data_sources.fetch_handler
+from kadlu import instrument
+from kadlu.geospatial.data_sources.grib_index import iter_fields
 from kadlu.geospatial.data_sources.data_util import                 \
         ll_2_regionstr,                                             \
         database_cfg,                                               \
+        bulk_insert,                                                \
+        query_rows,                                                 \
+        derive_uv,                                                  \
+        uv_tables,                                                  \
         storage_cfg,                                                \
         insert_hash,                                                \
         serialized,                                                 \
         dt_2_epoch,                                                 \
         fmt_coords,                                                 \
         Boundary,                                                   \
-        str_def
+        str_def,                                                    \
+        cfg
 
 
-conn, db = database_cfg()
-wwiii_src = "https://data.nodc.noaa.gov/thredds/fileServer/ncep/nww3/"
+# base URL of the file server. can be changed in config.ini with 'url' in section [wwiii]
+wwiii_src = cfg.get('wwiii', 'url',
+        fallback="https://data.nodc.noaa.gov/thredds/fileServer/ncep/nww3/")
+
+# cache decoded grib fields as memory-mapped arrays next to the downloaded
+# files. enable in config.ini with 'cache_fields = true' in section [wwiii]
+cache_fields = cfg.getboolean('wwiii', 'cache_fields', fallback=False)
 
 # region boundaries as defined in WWIII docs:
 #    https://polar.ncep.noaa.gov/waves/implementations.php
 wwiii_varmap = dict(zip(
-        ('hs','dp','tp', 'windU', 'windV', 'wind'),
-        ('waveheight','wavedir','waveperiod', 'wind_u', 'wind_v', 'wind_uv')))
+        ('hs','dp','tp', 'windU', 'windV', 'wind', 'windUV'),
+        ('waveheight','wavedir','waveperiod', 'wind_u', 'wind_v', 'wind_uv', 'wind_uv')))
 
 wwiii_global = Boundary(-90, 90, -180, 180, 'glo_30m')  # global
 wwiii_regions = [
@@ -73,11 +84,12 @@ def fetch_wwiii(var, kwargs):
         return:
             True if new data was fetched, else False
     """
+    conn, db = database_cfg()
     assert 6 == sum(map(lambda kw: kw in kwargs.keys(),
         ['south', 'north', 'west', 'east', 'start', 'end'])), 'malformed query'
     t = datetime(kwargs['start'].year, kwargs['start'].month, 1)
-    assert kwargs['end'] - kwargs['start'] <= timedelta(days=1), \
-            'use fetch_handler for this'
+    assert kwargs['end'] <= datetime(t.year + t.month // 12, t.month % 12 + 1, 1), \
+            'query must be contained within one month, use fetch_handler for this'
 
     if serialized(kwargs, f'fetch_wwiii_{wwiii_varmap[var]}'): return False
     #print("WWIII NOTICE: resolution selection not implemented yet. defaulting to 0.5°")
@@ -97,53 +109,47 @@ def fetch_wwiii(var, kwargs):
             fetchurl = f"{wwiii_src}{t.strftime('%Y/%m')}/gribs/{fname}"
         else:
             fetchurl = f"{wwiii_src}{t.strftime('%Y/%m')}/{reg}/{fname}"
-        with requests.get(fetchurl, stream=True) as payload:
+        with instrument.timer('download', source='wwiii', var=var), \
+                requests.get(fetchurl, stream=True) as payload:
             assert payload.status_code == 200, 'couldn\'t retrieve file'
             with open(fetchfile, 'wb') as f:
                 shutil.copyfileobj(payload.raw, f)
+        instrument.gauge('download.bytes', os.path.getsize(fetchfile), 'B', source='wwiii')
         if 'lock' in kwargs.keys(): kwargs['lock'].release()
 
     # function to insert the parsed data to local database
     def insert(table, agg, null, kwargs):
         if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
-        n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-        db.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?,?,?,CAST(? AS INT),?)", agg.T)
-        n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-        db.execute("COMMIT")
-        conn.commit()
+        n, dups = bulk_insert(conn, table, agg, 'wwiii')
         insert_hash(kwargs, f'fetch_wwiii_{wwiii_varmap[var]}')
         if 'lock' in kwargs.keys(): kwargs['lock'].release()
         logging.info(f"WWIII {kwargs['start'].date().isoformat()} {table}: "
-                f"processed and inserted {n2-n1} rows for region {fmt_coords(kwargs)}. "
+                f"processed and inserted {n} rows for region {fmt_coords(kwargs)}. "
                 f"{null} null values removed, "
-                f"{len(agg[0]) - (n2-n1)} duplicates ignored")
-
-    # open the file, parse data, insert values
-    grib = pygrib.open(fetchfile)
-    assert grib.messages > 0, f'problem opening {fetchfile}'
-    null = 0
-    agg = np.array([[],[],[],[],[]])
-    grbvar = grib[1]['name']
-    table = f'{var}{grbvar[0]}' if var == 'wind' else var
-    for msg, num in zip(grib, range(1, grib.messages)):
-        if msg['name'] != grbvar:
-            insert(table, agg, null, kwargs)
-            table = f'{var}{msg["name"][0]}' if var == 'wind' else var
-            agg = np.array([[],[],[],[],[]])
-            grbvar = msg['name']
-            null = 0
-        if msg.validDate < kwargs['start']: continue
-        if msg.validDate > kwargs['end']:   continue
-        z, y, x = msg.data()
-        src = np.array(['wwiii' for each in z[~z.mask].data])
-        grid = np.vstack((z[~z.mask].data, 
-                          y[~z.mask], 
-                          ((x[~z.mask] + 180) % 360 ) - 180, 
-                          dt_2_epoch([msg.validDate for each in z[~z.mask].data]), 
-                          src)).astype(object)
-        agg = np.hstack((agg, grid))
-        null += sum(sum(z.mask))
-    insert(table, agg, null, kwargs)
+                f"{dups} duplicates ignored")
+
+    # read the messages within the query from the file index, insert values
+    grids, nulls = {}, {}
+    with instrument.timer('parse', source='wwiii', var=var):
+        for name, epoch, z, y, x in iter_fields(fetchfile, 
+                kwargs['south'], kwargs['north'], kwargs['west'], kwargs['east'],
+                kwargs['start'], kwargs['end'], cache=cache_fields):
+            table = f'{var}{name[0]}' if var == 'wind' else var
+            lat, lon = np.meshgrid(y, x, indexing='ij')
+            mask = np.ma.getmaskarray(z)
+            grid = (z.data[~mask], lat[~mask], lon[~mask], np.full(z.count(), epoch, dtype=np.int64))
+            grids.setdefault(table, []).append(grid)
+            nulls[table] = nulls.get(table, 0) + np.ma.count_masked(z)
+
+    for table in grids.keys():
+        insert(table, list(map(np.concatenate, zip(*grids[table]))), nulls[table], kwargs)
+
+    # materialize wind speed from the wind components
+    if var == 'wind':
+        if 'lock' in kwargs.keys(): kwargs['lock'].acquire()
+        derive_uv(conn, 'windUV', *uv_tables['windUV'], kwargs)
+        if 'lock' in kwargs.keys(): kwargs['lock'].release()
+    if len(grids) == 0: insert_hash(kwargs, f'fetch_wwiii_{wwiii_varmap[var]}')
 
     return True
 
@@ -168,6 +174,7 @@ def load_wwiii(var, kwargs):
     return:
         val, lat, lon, epoch as np arrays of floats
     """
+    conn, db = database_cfg()
     if 'time' in kwargs.keys() and not 'start' in kwargs.keys():
         kwargs['start'] = kwargs['time']
         del kwargs['time']
@@ -180,8 +187,8 @@ def load_wwiii(var, kwargs):
     kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
             wwiii_varmap[var], 'wwiii', parallel=1, **kwargs)
 
-    db.execute(' AND '.join([
-           f'SELECT * FROM {var} WHERE lat >= ?',
+    slices = query_rows(db, ' AND '.join([
+           f'SELECT val, lat, lon, time FROM {var} WHERE lat >= ?',
             'lat <= ?',
             'lon >= ?',
             'lon <= ?',
@@ -190,17 +197,13 @@ def load_wwiii(var, kwargs):
            tuple(map(str, [
                kwargs['south'], kwargs['north'],
                kwargs['west'],  kwargs['east'], 
-               dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end'])]))
-       )
-
-    slices = np.array(db.fetchall(), dtype=object).T
+               dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end'])])),
+           table=var)
     #assert len(slices) == 5, "no data found, try adjusting query bounds or fetching some"
-    if len(slices) == 0:
+    if slices.shape[1] == 0:
         logging.warning(f'WWIII {var}: no data found in region {fmt_coords(kwargs)}, returning empty arrays')
-        return np.array([[],[],[],[]])
 
-    val, lat, lon, epoch, source = slices
-    return np.array((val, lat, lon, epoch), dtype=np.float)
+    return slices
 
 
 class Wwiii():
@@ -218,39 +221,7 @@ class Wwiii():
     def load_windwaveheight(self,   **kwargs):  return load_wwiii('hs',     kwargs)
     def load_wind_u(self,           **kwargs):  return load_wwiii('windU',  kwargs)
     def load_wind_v(self,           **kwargs):  return load_wwiii('windV',  kwargs)
-    def load_wind_uv(self,          **kwargs):
-
-        kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
-                wwiii_varmap['windU'], 'wwiii', parallel=1, **kwargs)
-        kadlu.geospatial.data_sources.fetch_handler.fetch_handler(
-                wwiii_varmap['windV'], 'wwiii', parallel=1, **kwargs)
-
-        sql = ' AND '.join(['SELECT windU.val, windU.lat, windU.lon, windU.time, windV.val FROM windU '\
-            'INNER JOIN windV '\
-            'ON windU.lat == windV.lat',
-            'windU.lon == windV.lon',
-            'windU.time == windV.time '\
-            'WHERE windU.lat >= ?',
-            'windU.lat <= ?',
-            'windU.lon >= ?',
-            'windU.lon <= ?',
-            'windU.time >= ?',
-            'windU.time <= ?']) + ' ORDER BY windU.time, windU.lat, windU.lon ASC'
-
-        db.execute(sql, tuple(map(str, [
-                kwargs['south'],                kwargs['north'], 
-                kwargs['west'],                 kwargs['east'], 
-                dt_2_epoch(kwargs['start']),    dt_2_epoch(kwargs['end'])
-            ])))
-        qry = np.array(db.fetchall()).T
-        #assert len(qry) > 0, \
-        #        f'no windspeed data found in region {fmt_coords(kwargs)}. consider expanding the region'
-        if len(qry) == 0:
-            logging.warning(f'ERA5 wind_uv: no data found in region {fmt_coords(kwargs)}, returning empty arrays')
-            return np.array([[],[],[],[],[]])
-        wind_u, lat, lon, epoch, wind_v = qry
-        val = np.sqrt(np.square(wind_u.astype(float)), np.square(wind_v.astype(float)))
-        return np.array((val, lat, lon, epoch)).astype(float)
+    def load_wind_uv(self,          **kwargs):  return load_wwiii('windUV', kwargs)
 
     def __str__(self):
         info = '\n'.join(["WAVEWATCH III: a third generation wave height,",
@@ -17,8 +17,11 @@
         Uniform2D class:
         Uniform3D class:
         DepthInterpolator3D class
+        TimeInterpolator class
 """
 
+from functools import lru_cache
+
 import numpy as np
 from scipy.interpolate import RectBivariateSpline, RectSphereBivariateSpline, RegularGridInterpolator, interp1d, interp2d, griddata, NearestNDInterpolator
 from kadlu.utils import deg2rad, XYtoLL, LLtoXY, torad, DLDL_over_DXDY, center_point
@@ -925,3 +928,57 @@ class DepthInterpolator3D():
 
         return v
 
+
+class TimeInterpolator():
+    """ Interpolation of time-varying data, fitted one time slice at a time.
+
+        The interpolator of a time slice is fitted on first use and kept in a 
+        least-recently-used cache. Values between two slices are interpolated 
+        linearly in time. Times before the first slice or after the last 
+        slice take the value of the nearest slice.
+
+        Args:
+            fit: callable
+                Receives the index of a time slice and returns its 
+                interpolator, e.g. an Interpolator2D or Interpolator3D
+            times: 1d numpy array
+                Times of the slices in hours, increasing
+            cache_size: int
+                Maximum number of fitted slices kept in memory
+            clock: callable
+                Returns the time in hours at which to interpolate when no 
+                time is given. Defaults to the time of the first slice
+
+        Attributes: 
+            origin: tuple(float, float)
+                Origin of the planar x-y coordinate system, passed on to the 
+                interpolator of each slice
+    """
+    def __init__(self, fit, times, cache_size=8, clock=None):
+        self.times = np.asarray(times, dtype=float)
+        self.clock = clock or (lambda: self.times[0])
+        self.origin = None
+        self._fit = fit
+        self.slice = lru_cache(maxsize=cache_size)(self.fit_slice)
+
+    def fit_slice(self, i):
+        obj = self._fit(i)
+        if self.origin is not None: obj.origin = self.origin
+        return obj
+
+    def weights(self, time=None):
+        """ Indices and weights of the slices bracketing a time in hours """
+        if time is None: time = self.clock()
+        i = int(np.clip(np.searchsorted(self.times, time, side='right') - 1, 0, len(self.times) - 1))
+        if i == len(self.times) - 1 or time <= self.times[i]: return ((i, 1), )
+        w = (time - self.times[i]) / (self.times[i + 1] - self.times[i])
+        return ((i, 1 - w), (i + 1, w))
+
+    def get_nodes(self, time=None):
+        return self.slice(self.weights(time)[0][0]).get_nodes()
+
+    def interp_xy(self, *args, time=None, **kwargs):
+        return sum(w * self.slice(i).interp_xy(*args, **kwargs) for i, w in self.weights(time))
+
+    def interp(self, *args, time=None, **kwargs):
+        return sum(w * self.slice(i).interp(*args, **kwargs) for i, w in self.weights(time))
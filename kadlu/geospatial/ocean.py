@@ -2,31 +2,39 @@
     and interpolating ocean variables.
 """
 import os
+import time
 import logging
+from hashlib import md5
+from functools import partial
 from datetime import timedelta
 from multiprocessing import Process, Queue
 
 import numpy as np
 
+from kadlu import instrument
 from kadlu.geospatial.interpolation             import      \
         Interpolator2D,                                     \
         Interpolator3D,                                     \
         Uniform2D,                                          \
-        Uniform3D
+        Uniform3D,                                          \
+        TimeInterpolator
 from kadlu.geospatial.data_sources.data_util    import      \
         reshape_2D,                                         \
         reshape_3D,                                         \
         dt_2_epoch,                                         \
+        floor_hour,                                         \
+        ceil_hour,                                          \
         fmt_coords
 from kadlu.geospatial.data_sources.source_map   import      \
         default_val,                                        \
+        fetch_map,                                          \
         load_map,                                           \
         var3d
-from kadlu.geospatial.data_sources.chs          import Chs
-from kadlu.geospatial.data_sources.hycom        import Hycom
-from kadlu.geospatial.data_sources.era5         import Era5
-from kadlu.geospatial.data_sources.wwiii        import Wwiii
 from kadlu.geospatial.data_sources.fetch_handler import fetch_handler
+from kadlu.geospatial.data_sources.bathy_pyramid import    \
+        base_res,                                           \
+        pyramid_level,                                      \
+        load_pyramid
 from kadlu.utils import center_point
 
 
@@ -43,13 +51,59 @@ def worker(interpfcn, reshapefcn, cols, var, q):
         var:
             variable type. used as key in Ocean().interps dictionary
         q:
-            shared queue object to pass interpolation back to parent
+            shared queue object to pass interpolation back to parent,
+            along with the reshape and fit times in seconds. the times
+            are reported by the parent, as events emitted in a worker
+            process would not reach an in-memory sink
     """
-    obj = interpfcn(**reshapefcn(cols))
-    q.put((var, obj))
+    t0 = time.perf_counter()
+    gridded = reshapefcn(cols)
+    t1 = time.perf_counter()
+    obj = interpfcn(**gridded)
+    q.put((var, obj, (t1 - t0, time.perf_counter() - t1)))
     return
 
 
+def fit_slice(loadfcn, v, kwargs, times, timestep, i):
+    """ load and interpolate a variable in the i-th time slice of a
+        time-resolved ocean. the slice contains the data within half a 
+        time step of its time, averaged as in a static ocean
+
+        data is stored in whole epoch hours, and the loaders truncate the
+        query times to the hour. the slice bounds are rounded to whole 
+        hours, so that the slice contains the hours h with
+        times[i] - timestep/2 <= h < times[i] + timestep/2, and adjacent 
+        slices don't share data. as in a static ocean, the hour of the 
+        start time is included
+    """
+    start = max(floor_hour(kwargs['start']), ceil_hour(times[i] - timestep / 2))
+    end = min(kwargs['end'], ceil_hour(times[i] + timestep / 2) - timedelta(hours=1))
+    qry = dict(kwargs, start=start, end=end)
+    cols = loadfcn(v=v, data={}, **qry)
+    assert len(cols[0]) > 0, (
+            f'no data found for {v} in time slice {times[i]}, region '
+            f'{fmt_coords(qry)}. consider a longer timestep')
+    t0 = time.perf_counter()
+    gridded = (reshape_3D if v in var3d else reshape_2D)(cols)
+    t1 = time.perf_counter()
+    obj = (Interpolator3D if v in var3d else Interpolator2D)(**gridded)
+    instrument.elapsed('reshape', t1 - t0, var=v)
+    instrument.elapsed('interp.fit', time.perf_counter() - t1, var=v)
+    return obj
+
+
+def source_key(load_arg):
+    """ reproducible description of a load argument, used for caching
+
+        returns None if the load argument can't be described (callables)
+    """
+    if callable(load_arg): return None
+    if isinstance(load_arg, str): return load_arg.lower()
+    if isinstance(load_arg, (int, float)): return float(load_arg)
+    arrs = [np.ascontiguousarray(arr, dtype=float) for arr in load_arg]
+    return md5(b''.join(arr.tobytes() for arr in arrs)).hexdigest()
+
+
 def load_callback(*, v, data, **kwargs):
     """ bootstrap data into callable to prepare for parallelization """
     return [data[key] for key in 
@@ -65,7 +119,18 @@ class Ocean():
         parallel
 
         data will be averaged over time frames for interpolation. for finer
-        temporal resolution, define smaller time boundaries
+        temporal resolution, define smaller time boundaries, or give a 
+        timestep to create a time-resolved ocean
+
+        in a time-resolved ocean, the time range is split into slices one 
+        timestep apart. static layers, i.e. bathymetry and variables given 
+        as values or arrays, are interpolated once. time-varying layers are
+        loaded and interpolated one slice at a time when first queried, and
+        the most recently used slices are kept in memory. values between 
+        slices are interpolated linearly in time. variables are queried at 
+        the time argument of each method, or by default at Ocean.time, so 
+        that e.g. a SoundSpeed can be computed at each step by setting 
+        Ocean.time
 
         any of the below load_args may also accept a callback function instead
         of a string or array value if you wish to write your own data loading
@@ -75,6 +140,9 @@ class Ocean():
         callables or array arguments must be ordered by [val, lat, lon] for 2D 
         data, or [val, lat, lon, depth] for 3D data
 
+        any of the load_args may also be 'synthetic', to compute seeded 
+        analytic fields without fetching data (see data_sources/synthetic.py)
+
         args:
             load_bathymetry: 
                 source of bathymetry data. can be 'chs' to load previously 
@@ -108,6 +176,17 @@ class Ocean():
                 time range for data load query (datetime)
                 if multiple times exist within range, they will be averaged
                 before computing interpolation
+            bathy_spacing:
+                horizontal resolution in metres required of the bathymetry
+                (float). if given, bathymetry from 'gebco' or 'chs' is 
+                loaded from the coarsest level of the bathymetry pyramid 
+                that resolves this spacing
+            timestep:
+                time between slices of a time-resolved ocean (timedelta).
+                if None, data is averaged over the time range
+            cache_size:
+                number of interpolated time slices kept in memory for each
+                time-varying variable of a time-resolved ocean (int)
 
         attrs:
             interps: dict
@@ -118,6 +197,17 @@ class Ocean():
                 planar x-y coordinate system.
             boundaries: dict
                 Bounding box for the ocean volume in space and time
+            sources: dict
+                Description of the data source for each variable. 
+                None if the variable was loaded from a callable. 
+                Bathymetry loaded from the pyramid includes the pyramid 
+                level, e.g. 'gebco@3'
+            times: list
+                Times of the slices of a time-resolved ocean (datetime).
+                None if the ocean is not time-resolved
+            time: datetime
+                Time at which time-varying variables are queried by 
+                default in a time-resolved ocean. Initially the start time
     """
 
     def __init__(self,
@@ -125,7 +215,7 @@ class Ocean():
             load_wavedir=0,     load_waveheight=0,  load_waveperiod=0, 
             load_wind_uv=0,     load_wind_u=0,      load_wind_v=0,
             load_water_uv=0,    load_water_u=0,     load_water_v=0,
-            fetch=4, **kwargs):
+            fetch=4, bathy_spacing=None, timestep=None, cache_size=8, **kwargs):
 
 
         for kw in [k for k in ('south', 'west', 'north', 'east', 'top', 'bottom', 
@@ -134,6 +224,7 @@ class Ocean():
 
         data = {}
         callbacks = []
+        fetches = {}
         vartypes = ['bathy',            'temp',             'salinity', 
                     'wavedir',          'waveheight',       'waveperiod', 
                     'wind_uv',          'wind_u',           'wind_v', 
@@ -144,15 +235,22 @@ class Ocean():
                      load_water_uv,     load_water_u,       load_water_v,]
 
         # if load_args are not callable, convert it to a callable function
+        sources = dict(zip(vartypes, map(source_key, load_args)))
         for v, load_arg, ix in zip(vartypes, load_args, range(len(vartypes))):
             if callable(load_arg): callbacks.append(load_arg)
 
             elif isinstance(load_arg, str):
                 key = f'{v}_{load_arg.lower()}'
                 assert key in load_map.keys(), f'no map for {key} in\n{load_map=}'
-                callbacks.append(load_map[key])
-                if fetch is not False:
-                    fetch_handler(v, load_arg.lower(), parallel=fetch, **kwargs)
+                if v == 'bathy' and bathy_spacing is not None \
+                        and load_arg.lower() in base_res.keys():
+                    level = pyramid_level(load_arg.lower(), bathy_spacing)
+                    callbacks.append(partial(load_pyramid, load_arg.lower(), level))
+                    sources[v] = f'{load_arg.lower()}@{level}'
+                else: 
+                    callbacks.append(load_map[key])
+                if fetch is not False and key in fetch_map.keys():
+                    fetches.setdefault(load_arg.lower(), []).append(v)
 
             elif isinstance(load_arg, (int, float)):
                 data[f'{v}_val'] = load_arg
@@ -176,13 +274,27 @@ class Ocean():
             else: raise TypeError(f'invalid type for load_{v}. '
                   'valid types include string, float, array, and callable')
 
+        # variables from the same source are fetched together where possible
+        for src, variables in fetches.items():
+            fetch_handler(variables, src, parallel=fetch, **kwargs)
+
+        # in a time-resolved ocean, layers loaded from a source or callable
+        # are time-varying, and are interpolated later one slice at a time
+        series = []
+        if timestep is not None:
+            assert timestep > timedelta(0), 'timestep must be a positive timedelta'
+            series = [v for v, arg in zip(vartypes, load_args) 
+                      if v != 'bathy' and (callable(arg) or isinstance(arg, str))]
+
         q = Queue()
 
         # prepare data pipeline
-        pipe = zip(callbacks, vartypes)
-        is_3D = [v in var3d for v in vartypes]
-        is_arr = [not isinstance(arg, (int, float)) for arg in load_args]
-        columns = [fcn(v=v, data=data, **kwargs) for fcn, v in pipe]
+        pipe = [(fcn, v, arg) for fcn, v, arg in zip(callbacks, vartypes, load_args) 
+                if v not in series]
+        static = [v for _, v, _ in pipe]
+        is_3D = [v in var3d for v in static]
+        is_arr = [not isinstance(arg, (int, float)) for _, _, arg in pipe]
+        columns = [fcn(v=v, data=data, **kwargs) for fcn, v, _ in pipe]
         intrpmap = [(Uniform2D, Uniform3D), (Interpolator2D, Interpolator3D)]
         reshapers = [reshape_3D if v else reshape_2D for v in is_3D]
         # map interpolations to dictionary
@@ -190,11 +302,11 @@ class Ocean():
         interpolators = map(lambda x, y: intrpmap[x][y], is_arr, is_3D)
         interpolations = map(
             lambda i,r,c,v,q=q: Process(target=worker, args=(i,r,c,v,q)),
-            interpolators, reshapers, columns, vartypes
+            interpolators, reshapers, columns, static
         )
 
         # assert that no empty arrays were returned by load function
-        for col, var in zip(columns, vartypes):
+        for col, var in zip(columns, static):
             if isinstance(col, dict) or isinstance(col[0], (int, float)): continue
             assert len(col[0]) > 0, (
                     f'no data found for {var} in region {fmt_coords(kwargs)}. '
@@ -203,35 +315,60 @@ class Ocean():
         # compute interpolations in parallel and store in dict attribute
         if not os.environ.get('LOGLEVEL') == 'DEBUG':
             for i in interpolations: i.start()
-            while len(self.interps.keys()) < len(vartypes):
+            while len(self.interps.keys()) < len(static):
                 obj = q.get()
                 self.interps[obj[0]] = obj[1]
+                instrument.elapsed('reshape', obj[2][0], var=obj[0])
+                instrument.elapsed('interp.fit', obj[2][1], var=obj[0])
             for i in interpolations: i.join()
 
         # debug mode: disable parallelization for nicer stack traces
         elif os.environ.get('LOGLEVEL') == 'DEBUG':
             logging.debug('OCEAN DEBUG MSG: parallelization disabled')
-            for i,r,c,v in zip(interpolators, reshapers, columns, vartypes):
+            for i,r,c,v in zip(interpolators, reshapers, columns, static):
                 logging.debug(f'interpolating {v}')
                 logging.debug(f'{i = }\n{r = }\n{c = }\n{v = }')
-                obj = i(**r(c))
-                q.put((v, obj))
+                worker(i, r, c, v, q)
 
-            while len(self.interps.keys()) < len(vartypes):
+            while len(self.interps.keys()) < len(static):
                 obj = q.get()
                 self.interps[obj[0]] = obj[1]
-                logging.debug(f'done {obj[0]}... {len(self.interps.keys())}/{len(vartypes)}')
+                instrument.elapsed('reshape', obj[2][0], var=obj[0])
+                instrument.elapsed('interp.fit', obj[2][1], var=obj[0])
+                logging.debug(f'done {obj[0]}... {len(self.interps.keys())}/{len(static)}')
 
         q.close()
 
+        # time-varying layers are interpolated when each slice is queried
+        self.timestep, self.times, self.time = timestep, None, kwargs['start']
+        if timestep is not None:
+            n = int((kwargs['end'] - kwargs['start']) / timestep)
+            self.times = [kwargs['start'] + k * timestep for k in range(n + 1)]
+            hours = [k * timestep / timedelta(hours=1) for k in range(n + 1)]
+            for fcn, v in zip(callbacks, vartypes):
+                if v not in series: continue
+                fit = partial(fit_slice, fcn, v, kwargs.copy(), self.times, timestep)
+                self.interps[v] = TimeInterpolator(fit, hours, cache_size, clock=self.hours)
+
         # set ocean boundaries and interpolator origins
         self.boundaries = kwargs.copy()  
+        self.sources = sources
         self.origin = center_point(lat=[kwargs['south'], kwargs['north']], 
                                    lon=[kwargs['west'],  kwargs['east']])
         for v in vartypes: self.interps[v].origin = self.origin
 
         return
 
+    @classmethod
+    async def acreate(cls, **kwargs):
+        """ create an Ocean without blocking the asyncio event loop.
+            data is fetched and interpolated on a thread pool, see kadlu.aio. 
+            takes the same arguments as Ocean(). concurrent requests with 
+            the same data sources and boundaries share the same Ocean
+        """
+        from kadlu.aio import ocean
+        return await ocean(cls, **kwargs)
+
     def bathy(self, lat, lon, grid=False):
         return self.interps['bathy'].interp(lat, lon, grid)
 
@@ -248,69 +385,84 @@ class Ocean():
         return self.interps['bathy'].interp_xy(x, y, grid,
                 x_deriv_order=(axis=='x'), y_deriv_order=(axis=='y'))
 
-    def salinity(self,lat, lon, depth, grid=False):
-        return self.interps['salinity'].interp(lat, lon, depth, grid)
+    def interp(self, var, *args, time=None, xy=False, **kwargs):
+        """ interpolate a variable in geographic or planar (xy) coordinates.
+            in a time-resolved ocean, time-varying variables are interpolated
+            at the given time (datetime), or by default at Ocean.time
+        """
+        obj = self.interps[var]
+        fcn = obj.interp_xy if xy else obj.interp
+        if isinstance(obj, TimeInterpolator): kwargs['time'] = self.hours(time)
+        return fcn(*args, **kwargs)
+
+    def hours(self, time=None):
+        """ hours from the start of the time range to the given time, 
+            or by default to Ocean.time
+        """
+        return ((self.time if time is None else time) - self.boundaries['start']) / timedelta(hours=1)
 
-    def salinity_xy(self, x, y, z, grid=False):
-        return self.interps['salinity'].interp_xy(x, y, z, grid)
+    def salinity(self, lat, lon, depth, grid=False, time=None):
+        return self.interp('salinity', lat, lon, depth, grid, time=time)
 
-    def temp(self, lat, lon, depth, grid=False):
-        return self.interps['temp'].interp(lat, lon, depth, grid)
+    def salinity_xy(self, x, y, z, grid=False, time=None):
+        return self.interp('salinity', x, y, z, grid, time=time, xy=True)
 
-    def temp_xy(self, x, y, z, grid=False):
-        return self.interps['temp'].interp_xy(x, y, z, grid)
+    def temp(self, lat, lon, depth, grid=False, time=None):
+        return self.interp('temp', lat, lon, depth, grid, time=time)
 
-    def wavedir(self, lat, lon, grid=False):
-        return self.interps['wavedir'].interp(lat, lon, grid)
+    def temp_xy(self, x, y, z, grid=False, time=None):
+        return self.interp('temp', x, y, z, grid, time=time, xy=True)
 
-    def wavedir_xy(self, x, y, grid=False):
-        return self.interps['wavedir'].interp_xy(x, y, grid)
+    def wavedir(self, lat, lon, grid=False, time=None):
+        return self.interp('wavedir', lat, lon, grid, time=time)
 
-    def waveheight(self, lat, lon, grid=False):
-        return self.interps['waveheight'].interp(lat, lon, grid)
+    def wavedir_xy(self, x, y, grid=False, time=None):
+        return self.interp('wavedir', x, y, grid, time=time, xy=True)
 
-    def waveheight_xy(self, x, y, grid=False):
-        return self.interps['waveheight'].interp_xy(x, y, grid)
+    def waveheight(self, lat, lon, grid=False, time=None):
+        return self.interp('waveheight', lat, lon, grid, time=time)
 
-    def waveperiod(self, lat, lon, grid=False):
-        return self.interps['waveperiod'].interp(lat, lon, grid)
+    def waveheight_xy(self, x, y, grid=False, time=None):
+        return self.interp('waveheight', x, y, grid, time=time, xy=True)
 
-    def waveperiod_xy(self, x, y, grid=False):
-        return self.interps['waveperiod'].interp_xy(x, y, grid)
+    def waveperiod(self, lat, lon, grid=False, time=None):
+        return self.interp('waveperiod', lat, lon, grid, time=time)
 
-    def wind_uv(self, lat, lon, grid=False):
-        return self.interps['wind_uv'].interp(lat, lon, grid)
+    def waveperiod_xy(self, x, y, grid=False, time=None):
+        return self.interp('waveperiod', x, y, grid, time=time, xy=True)
 
-    def wind_uv_xy(self, x, y, grid=False):
-        return self.interps['wind_uv'].interp_xy(x, y, grid)
+    def wind_uv(self, lat, lon, grid=False, time=None):
+        return self.interp('wind_uv', lat, lon, grid, time=time)
 
-    def wind_u(self, lat, lon, grid=False):
-        return self.interps['wind_u'].interp(lat, lon, grid)
+    def wind_uv_xy(self, x, y, grid=False, time=None):
+        return self.interp('wind_uv', x, y, grid, time=time, xy=True)
 
-    def wind_u_xy(self, x, y, grid=False):
-        return self.interps['wind_u'].interp_xy(x, y, grid)
+    def wind_u(self, lat, lon, grid=False, time=None):
+        return self.interp('wind_u', lat, lon, grid, time=time)
 
-    def wind_v(self, lat, lon, grid=False):
-        return self.interps['wind_v'].interp(lat, lon, grid)
+    def wind_u_xy(self, x, y, grid=False, time=None):
+        return self.interp('wind_u', x, y, grid, time=time, xy=True)
 
-    def wind_v_xy(self, x, y, grid=False):
-        return self.interps['wind_v'].interp_xy(x, y, grid)
+    def wind_v(self, lat, lon, grid=False, time=None):
+        return self.interp('wind_v', lat, lon, grid, time=time)
 
-    def water_uv(self, lat, lon, grid=False):
-        return self.interps['water_uv'].interp(lat, lon, grid)
+    def wind_v_xy(self, x, y, grid=False, time=None):
+        return self.interp('wind_v', x, y, grid, time=time, xy=True)
 
-    def water_uv_xy(self, x, y, grid=False):
-        return self.interps['water_uv'].interp_xy(x, y, grid)
+    def water_uv(self, lat, lon, grid=False, time=None):
+        return self.interp('water_uv', lat, lon, grid, time=time)
 
-    def water_u(self, lat, lon, grid=False):
-        return self.interps['water_u'].interp(lat, lon, grid)
+    def water_uv_xy(self, x, y, grid=False, time=None):
+        return self.interp('water_uv', x, y, grid, time=time, xy=True)
 
-    def water_u_xy(self, x, y, grid=False):
-        return self.interps['water_u'].interp_xy(x, y, grid)
+    def water_u(self, lat, lon, grid=False, time=None):
+        return self.interp('water_u', lat, lon, grid, time=time)
 
-    def water_v(self, lat, lon, grid=False):
-        return self.interps['water_v'].interp(lat, lon, grid)
+    def water_u_xy(self, x, y, grid=False, time=None):
+        return self.interp('water_u', x, y, grid, time=time, xy=True)
 
-    def water_v_xy(self, x, y, grid=False):
-        return self.interps['water_v'].interp_xy(x, y, grid)
+    def water_v(self, lat, lon, grid=False, time=None):
+        return self.interp('water_v', lat, lon, grid, time=time)
 
+    def water_v_xy(self, x, y, grid=False, time=None):
+        return self.interp('water_v', x, y, grid, time=time, xy=True)
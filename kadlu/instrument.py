@@ -0,0 +1,237 @@
+"""
+    Stage-level timers, counters and gauges.
+
+    Processing stages report timings and sizes through the functions in
+    this module. Each measurement is a dictionary event with the keys
+    kind ('timer', 'count' or 'gauge'), name, value, unit, time, and any
+    tags given by the caller (e.g. source, table, var). Events are passed
+    to the active sink, a callable that receives one event at a time.
+
+    No sink is active by default, in which case the functions return
+    immediately and timers are a shared no-op context manager, so that
+    instrumentation can be left in place at negligible cost. A sink can
+    be set with set_sink(), or with the environment variable
+    KADLU_INSTRUMENT, which may be 'log', 'memory', or the path of a
+    JSON lines file:
+
+        KADLU_INSTRUMENT=/tmp/kadlu_events.jsonl python script.py
+
+    Example:
+
+        from kadlu import instrument
+        sink = instrument.MemorySink()
+        instrument.set_sink(sink)
+        ocean = kadlu.Ocean(load_bathymetry='chs', **bounds)
+        print(sink.totals())
+
+    Stage names used throughout kadlu:
+
+        download            bytes received from a data source
+        parse               decoding a response or file into arrays
+        db.insert           bulk insertion of rows (gauges db.rows, db.duplicates)
+        db.query            range queries of the loaders (gauge db.rows)
+        reshape             gridding of loaded rows
+        interp.fit          construction of an interpolator
+        sound_speed.build   computation of the sound speed field
+        pe.env, pe.fft,     environment update, split-step FFT, and output
+        pe.save             of the parabolic equation solver (totals per solve)
+        geophony.point      transmission loss and source level at one point
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+
+
+sink = None
+
+
+def set_sink(new):
+    """ set the active sink, or disable instrumentation with None
+
+        Args:
+            new: callable, string, or None
+                called with each event. the strings 'log' and 'memory'
+                create a LogSink or MemorySink, any other string is the
+                path of a JSON lines file
+
+        Returns:
+            the previous sink
+    """
+    global sink
+    if isinstance(new, str):
+        new = LogSink() if new == 'log' else MemorySink() if new == 'memory' else JsonSink(new)
+    previous, sink = sink, new
+    return previous
+
+
+def enabled():
+    """ True if events are being recorded """
+    return sink is not None
+
+
+def emit(kind, name, value, unit='', **tags):
+    """ pass an event to the active sink """
+    if sink is None: return
+    sink(dict(kind=kind, name=name, value=value, unit=unit, time=time.time(), **tags))
+
+
+def count(name, n=1, **tags):
+    """ increment a counter by n """
+    if sink is None: return
+    emit('count', name, n, **tags)
+
+
+def gauge(name, value, unit='', **tags):
+    """ record a size, e.g. a number of rows or bytes """
+    if sink is None: return
+    emit('gauge', name, value, unit, **tags)
+
+
+def elapsed(name, seconds, **tags):
+    """ record a duration measured by the caller """
+    if sink is None: return
+    emit('timer', name, seconds, 's', **tags)
+
+
+class _Noop():
+    """ stands in for timers and laps while no sink is active """
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *args): return False
+    def __call__(self, *args, **kwargs): return self
+    def emit(self): pass
+
+_noop = _Noop()
+
+
+class _Timer():
+    __slots__ = ('name', 'tags', 't0')
+
+    def __init__(self, name, tags):
+        self.name, self.tags = name, tags
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        elapsed(self.name, time.perf_counter() - self.t0, **self.tags)
+        return False
+
+
+def timer(name, **tags):
+    """ context manager timing the enclosed block
+
+        Args:
+            name: string
+                stage name
+            tags:
+                additional keys of the event
+
+        Example:
+            with instrument.timer('download', source='hycom'):
+                payload = requests.get(url)
+    """
+    if sink is None: return _noop
+    return _Timer(name, tags)
+
+
+class _Laps():
+    """ accumulates the time of stages that repeat within a loop """
+
+    def __init__(self, name, tags):
+        self.name, self.tags = name, tags
+        self.totals, self.calls = defaultdict(float), defaultdict(int)
+        self.stage, self.t0 = None, None
+
+    def __call__(self, stage):
+        self.stage = stage
+        return self
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.totals[self.stage] += time.perf_counter() - self.t0
+        self.calls[self.stage] += 1
+        return False
+
+    def emit(self):
+        for stage, total in self.totals.items():
+            elapsed(f'{self.name}.{stage}', total, calls=self.calls[stage], **self.tags)
+
+
+def laps(name, **tags):
+    """ timers for the stages of a loop, reported as one total per stage
+
+        per-iteration timing of a tight loop would flood the sink, so
+        the time of each stage is summed, and emitted along with the number
+        of iterations when emit() is called
+
+        Example:
+            lap = instrument.laps('pe')
+            for step in range(n):
+                with lap('fft'): ...
+                with lap('save'): ...
+            lap.emit()   # events 'pe.fft' and 'pe.save'
+    """
+    if sink is None: return _noop
+    return _Laps(name, tags)
+
+
+class LogSink():
+    """ write events to the log """
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def __call__(self, event):
+        tags = ' '.join(f'{k}={v}' for k, v in event.items()
+                        if k not in ('kind', 'name', 'value', 'unit', 'time'))
+        value = f"{event['value']:.4f}" if isinstance(event['value'], float) else event['value']
+        logging.log(self.level, f"{event['kind']} {event['name']}: {value}{event['unit']} {tags}")
+
+
+class JsonSink():
+    """ append events to a JSON lines file. events from several threads
+        or processes can be written to the same file
+    """
+
+    def __init__(self, path):
+        self.path, self.lock = path, threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(dict(event, pid=os.getpid()), default=str) + '\n'
+        with self.lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+class MemorySink():
+    """ keep events in a list, for inspection within the same process """
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def totals(self):
+        """ sum of event values by kind and name
+
+            Returns:
+                dictionary mapping (kind, name) to the total value
+        """
+        totals = defaultdict(float)
+        for e in self.events: totals[(e['kind'], e['name'])] += e['value']
+        return dict(totals)
+
+    def clear(self):
+        self.events.clear()
+
+
+if os.environ.get('KADLU_INSTRUMENT'): set_sink(os.environ['KADLU_INSTRUMENT'])
@@ -1,7 +1,10 @@
 import os
 import logging
+from hashlib import md5
+from collections import deque
 from datetime import datetime, timedelta
 from multiprocessing import Process, Queue
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import imageio
@@ -9,10 +12,12 @@ import matplotlib
 #matplotlib.use('TkAgg')
 #matplotlib.use('Qt5Agg')
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import cartopy
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
-from scipy.interpolate import griddata
+from scipy.spatial import Delaunay
+from scipy.interpolate import LinearNDInterpolator
 
 from kadlu.geospatial.data_sources.chs import Chs
 from kadlu.geospatial.data_sources.era5 import Era5
@@ -110,51 +115,7 @@ def plot2D(var, source, plot_wind=False, save=False, **kwargs):
     data = loadfcn(**kwargs)
     val, lat, lon = data[:3]
 
-    # project data onto coordinate space
-    extent = proj.transform_points(
-            ccrs.Geodetic(),
-            np.array([kwargs['west'], kwargs['east']]), 
-            np.array([kwargs['south'], kwargs['north']])
-        )[:,:-1]
-    projected_lonlat = proj.transform_points(
-            ccrs.Geodetic(),
-            lon,
-            lat
-        )
-    plon = projected_lonlat[:,0]
-    plat = projected_lonlat[:,1]
-    num_lats = 1000
-    num_lons = 1000
-    lons = np.linspace(start=min(plon), stop=max(plon), num=num_lons)
-    lats = np.linspace(start=min(plat), stop=max(plat), num=num_lats)
-    data = griddata(points=(plon, plat), values=val, xi=(lons[None,:],lats[:,None]), method='linear')
-    coast = cfeature.NaturalEarthFeature('physical', 'coastline', '10m')
-    fg = (.92, .92, .92, 1)
-    fname = f'{var}_{kwargs["start"].date().isoformat()}.png'
-    fig = plt.figure()
-
-    ax = fig.add_subplot(1, 1, 1, 
-            title=config[var]['title']+f'\n{kwargs["start"].date().isoformat()}',
-            projection=proj, 
-            facecolor=config[var]['cm'](256), 
-            frameon=True
-        )
-    ax.contourf(lons, lats, data,
-                transform=proj,
-                levels=config[var]['levels'](val),
-                cmap=config[var]['cm'], 
-                alpha=config[var]['alpha'],
-                zorder=8
-            )
-    ax.contour(lons, lats, data,
-                transform=proj,
-                levels=config[var]['levels'](val),
-                cmap=config[var]['cm'],
-                alpha=1,
-                linewidths=2,
-                zorder=9
-            )
-
+    wind = None
     if plot_wind is not False:
         if plot_wind.lower() == 'era5': 
             windfcnU, windfcnV = (Era5().load_wind_u, Era5().load_wind_v)
@@ -166,11 +127,55 @@ def plot2D(var, source, plot_wind=False, save=False, **kwargs):
         uval, ulat, ulon, utime = windfcnU(**kwargs)
         vval, vlat, vlon, vtime = windfcnV(**kwargs)
         assert(len(vval) == len(uval))  # this can be fixed with an SQL JOIN in load module
-        if len(np.unique(ulat)) == 1 or len(np.unique(ulon)) == 1:
-            raise RuntimeError(f'Not enough datapoints to plot windspeeds in region {fmt_coords(kwargs)}')
+        wind = (uval, vval, ulat, ulon)
+
+    fname = f'{var}_{kwargs["start"].date().isoformat()}.png'
+    fig = plt.figure()
+    ax = basemap(fig, var, kwargs, val)
+    ax.set_title(config[var]['title']+f'\n{kwargs["start"].date().isoformat()}')
+    draw(ax, var, val, lat, lon, wind)
+
+    if save is not False:
+        if not os.path.isdir(f'{storage_cfg()}figures'): 
+            os.mkdir(f'{storage_cfg()}figures')
+        logging.info(f'saving figure to {storage_cfg()}figures/{fname if save is True else save}')
+        plt.savefig(f'{storage_cfg()}figures/{fname if save is True else save}', 
+                bbox_inches='tight', dpi=200, figsize=(12,8), optimize=True)
+        plt.close()
+    else: 
+        plt.show()
+
+    return
+
 
-        ax.quiver(ulon, ulat, uval, vval, transform=ccrs.PlateCarree(), 
-                regrid_shape=20, zorder=10)
+def basemap(fig, var, kwargs, val=None):
+    """ add map axes to a figure, with the coastline, grid lines and 
+        colour bar of a variable. the map is drawn once and reused by 
+        each frame of an animation
+
+        args:
+            fig: matplotlib.figure.Figure
+                figure to draw on
+            var: string
+                variable name, used as key in config
+            kwargs: dict
+                boundaries of the map: south, north, west, east
+            val: array
+                values of the variable, used to normalize the colour bar
+                of the bathymetry
+
+        return:
+            ax: cartopy.mpl.geoaxes.GeoAxes
+    """
+    coast = cfeature.NaturalEarthFeature('physical', 'coastline', '10m')
+    fg = (.92, .92, .92, 1)
+    ax = fig.add_subplot(1, 1, 1, 
+            projection=proj, 
+            facecolor=config[var]['cm'](256), 
+            frameon=True
+        )
+    ax.set_extent([kwargs['west'], kwargs['east'], kwargs['south'], kwargs['north']],
+            crs=ccrs.PlateCarree())
 
     ax.add_feature(coast, facecolor=fg, edgecolor=(0,0,0,1), zorder=11)
     gl = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True, linestyle='--',
@@ -187,24 +192,193 @@ def plot2D(var, source, plot_wind=False, save=False, **kwargs):
     gl.yformatter = cartopy.mpl.gridliner.LATITUDE_FORMATTER
     ax.tick_params(axis='x', rotation=45)
     vnorm = val if var == 'bathy' else None
-    plt.colorbar(matplotlib.cm.ScalarMappable(norm=config[var]['norm'](vnorm),
-                cmap=config[var]['cm']))
+    fig.colorbar(matplotlib.cm.ScalarMappable(norm=config[var]['norm'](vnorm),
+                cmap=config[var]['cm']), ax=ax)
+    return ax
+
+
+def draw(ax, var, val, lat, lon, wind=None, triangulations=None):
+    """ draw the contours of a variable, and optionally wind vectors, on 
+        a map created by basemap
+
+        args:
+            ax: cartopy.mpl.geoaxes.GeoAxes
+                map axes
+            var: string
+                variable name, used as key in config
+            val, lat, lon: arrays
+                values and coordinates of the data points
+            wind: tuple
+                wind vectors (u, v, lat, lon), or None
+            triangulations: dict
+                triangulations of the projected data points, mapped by a 
+                hash of the points. frames sharing the data points reuse 
+                the triangulation instead of computing it again
+
+        return:
+            list of the drawn artists
+    """
+    # project data onto coordinate space
+    projected_lonlat = proj.transform_points(
+            ccrs.Geodetic(),
+            lon,
+            lat
+        )
+    points = np.ascontiguousarray(projected_lonlat[:,:2])
+    num_lats = 1000
+    num_lons = 1000
+    lons = np.linspace(start=min(points[:,0]), stop=max(points[:,0]), num=num_lons)
+    lats = np.linspace(start=min(points[:,1]), stop=max(points[:,1]), num=num_lats)
+    if triangulations is None: triangulations = {}
+    key = md5(points.tobytes()).hexdigest()
+    if key not in triangulations: 
+        if len(triangulations) >= 8: triangulations.clear()
+        triangulations[key] = Delaunay(points)
+    data = LinearNDInterpolator(triangulations[key], val)(lons[None,:], lats[:,None])
+
+    artists = [
+        ax.contourf(lons, lats, data,
+                transform=proj,
+                levels=config[var]['levels'](val),
+                cmap=config[var]['cm'], 
+                alpha=config[var]['alpha'],
+                zorder=8
+            ),
+        ax.contour(lons, lats, data,
+                transform=proj,
+                levels=config[var]['levels'](val),
+                cmap=config[var]['cm'],
+                alpha=1,
+                linewidths=2,
+                zorder=9
+            )]
 
-    if save is not False:
-        if not os.path.isdir(f'{storage_cfg()}figures'): 
-            os.mkdir(f'{storage_cfg()}figures')
-        logging.info(f'saving figure to {storage_cfg()}figures/{fname if save is True else save}')
-        plt.savefig(f'{storage_cfg()}figures/{fname if save is True else save}', 
-                bbox_inches='tight', dpi=200, figsize=(12,8), optimize=True)
-        plt.close()
-    else: 
-        plt.show()
+    if wind is not None:
+        uval, vval, ulat, ulon = wind
+        if len(np.unique(ulat)) == 1 or len(np.unique(ulon)) == 1:
+            raise RuntimeError(f'Not enough datapoints to plot windspeeds in region '
+                    f'{fmt_coords(dict(south=min(lat), north=max(lat), west=min(lon), east=max(lon)))}')
+        artists.append(ax.quiver(ulon, ulat, uval, vval, transform=ccrs.PlateCarree(), 
+                regrid_shape=20, zorder=10))
 
-    return
+    return artists
+
+
+def average(val, lat, lon):
+    """ average the values sharing the same coordinates, e.g. the time 
+        steps within an animation frame
+    """
+    coords, inverse = np.unique(np.array((lat, lon)), axis=1, return_inverse=True)
+    inverse = np.ravel(inverse)
+    return np.bincount(inverse, val) / np.bincount(inverse), coords[0], coords[1]
+
+
+def frames(var, source, kwargs, step, plot_wind=False):
+    """ stream the data of each animation frame, in one pass over the time
+        range. frames begin at midnight of the start date and are one step
+        long. values are averaged over the time steps within each frame
+
+        yields:
+            time: datetime
+                start of the frame
+            data: tuple
+                values and coordinates (val, lat, lon)
+            wind: tuple
+                wind vectors (u, v, lat, lon), or None
+    """
+    import kadlu
+    qry = dict(kwargs, start=datetime(kwargs['start'].year, kwargs['start'].month, 
+                                      kwargs['start'].day))
+    loads = [kadlu.iter_load(source, var, chunk=step, **qry)]
+    if plot_wind is not False:
+        loads += [kadlu.iter_load(plot_wind, v, chunk=step, **qry) for v in ('wind_u', 'wind_v')]
+
+    t = qry['start']
+    for data in zip(*loads):
+        if len(data[0][0]) == 0:
+            logging.warning(f'no {var} data for frame {t.isoformat()}, skipping')
+            t += step
+            continue
+        wind = None
+        if plot_wind is not False:
+            (uval, ulat, ulon), (vval, _, _) = average(*data[1][:3]), average(*data[2][:3])
+            assert(len(vval) == len(uval))
+            wind = (uval, vval, ulat, ulon)
+        yield t, average(*data[0][:3]), wind
+        t += step
+
+
+# figure of the process rendering animation frames, see init_renderer
+renderer = None
+
+
+def init_renderer(var, kwargs, dpi=100):
+    """ create the figure and map background reused by each frame rendered 
+        in this process
+    """
+    global renderer
+    fig = matplotlib.figure.Figure(figsize=(12, 8), dpi=dpi)
+    FigureCanvasAgg(fig)
+    renderer = dict(fig=fig, ax=basemap(fig, var, kwargs), var=var, 
+                    artists=[], triangulations={})
 
 
-def animate(var, source, kwargs, step=timedelta(hours=12), fps=30, plot_wind=False, debug=False):
+def render(frame):
+    """ draw a frame on the figure of this process, replacing the previous 
+        frame, and return the image as an RGB array
+    """
+    t, (val, lat, lon), wind = frame
+    fig, ax, var = renderer['fig'], renderer['ax'], renderer['var']
+    for artist in renderer['artists']:
+        # contour sets are not artists before matplotlib 3.8
+        for a in getattr(artist, 'collections', [artist]) \
+                if not isinstance(artist, matplotlib.artist.Artist) else [artist]:
+            a.remove()
+    ax.set_title(config[var]['title']+f'\n{t.isoformat(sep=" ", timespec="minutes")}')
+    renderer['artists'] = draw(ax, var, val, lat, lon, wind, renderer['triangulations'])
+    fig.canvas.draw()
+    return np.array(fig.canvas.buffer_rgba())[:, :, :3]
+
+
+def ordered(pool, fcn, items, backlog):
+    """ map a function over an iterable on a process pool, yielding the 
+        results in order. at most backlog items are pending at a time, so 
+        that items are only read from the iterable as results are consumed
     """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fcn, item))
+        if len(pending) >= backlog: yield pending.popleft().result()
+    while len(pending) > 0: yield pending.popleft().result()
+
+
+def animate(var, source, kwargs, step=timedelta(hours=12), fps=30, plot_wind=False, 
+        debug=False, processes=None, dpi=100):
+    """ render an animation of a variable over a time range to an mp4 file
+
+        the data is loaded in one pass over the time range, one frame at a
+        time. frames are rendered on a pool of processes, each drawing on
+        a figure and map background created once, and the images are 
+        passed directly to the video encoder in order
+
+        args:
+            var, source: strings
+                variable and data source, as for plot2D
+            kwargs: dict
+                boundaries of the animation: south, north, west, east, 
+                top, bottom, start, end
+            step: timedelta
+                time covered by each frame
+            fps: int
+                frames per second of the video
+            plot_wind: string
+                'era5' or 'wwiii' to draw wind vectors, or False
+            debug: boolean
+                render the frames in this process, for nicer stack traces
+            processes: int
+                number of rendering processes. defaults to the number of CPUs
+            dpi: int
+                resolution of the frames. frames are 12x8 inches
 
     var='temp'
     kwargs = dict(
@@ -220,40 +394,26 @@ def animate(var, source, kwargs, step=timedelta(hours=12), fps=30, plot_wind=Fal
     # download all the data first
     fetch_handler(var, source, **kwargs)
 
-    # prepare folder and check for existing frames
-    dirname = storage_cfg() + 'figures/'
-    if not os.path.isdir(dirname): os.mkdir(dirname)
-    png = lambda f: f if '.png' in f else None
-    old = map(png, list(os.walk(dirname))[0][2])
-    _rm = [os.remove(f'{dirname}{x}') for x in old if debug and x is not None]
-
-    # generate image frames
-    qry = kwargs.copy()
-    cur = datetime(kwargs['start'].year, kwargs['start'].month, kwargs['start'].day)
-    while cur <= kwargs['end']:
-        qry['start'] = cur
-        qry['end'] = cur + step
-        fname = f'{var}_{cur.isoformat()}.png'
-        if not os.path.isfile(f'{dirname}/{fname}'): 
-            plot2D(var, source, plot_wind=plot_wind, save=fname, **qry)
-        cur += step
-
     # filename and path for output
     fname = (f'{var}_{kwargs["start"].date().isoformat()}'
              f'_{kwargs["end"].date().isoformat()}.mp4')
     savedir = f'{storage_cfg()}animated{os.path.sep}'
     if not os.path.isdir(savedir): os.mkdir(savedir)
 
-    # aggregate frames within query range and append to mp4 file
+    # render frames in order and append them to the mp4 file
     logging.info(f'animating {fname}...')
-    fmt = f'{var}_%Y-%m-%dT%H:%M:%S.png'
-    frames = sorted([f'{dirname}{i}' for i in 
-            map(png, list(os.walk(f'{dirname}'))[0][2]) if i is not None
-            and datetime.strptime(i, fmt) >= kwargs['start']
-            and datetime.strptime(i, fmt) <= kwargs['end']])
+    stream = frames(var, source, kwargs, step, plot_wind)
     with imageio.get_writer(f'{savedir}{fname}', mode='I', macro_block_size=4,
             format='FFMPEG', fps=fps) as w:
-        list(map(w.append_data, map(imageio.imread, frames)))
+        if debug:
+            init_renderer(var, kwargs, dpi)
+            for frame in stream: w.append_data(render(frame))
+        else:
+            processes = processes or os.cpu_count()
+            with ProcessPoolExecutor(processes, initializer=init_renderer, 
+                    initargs=(var, kwargs, dpi)) as pool:
+                for image in ordered(pool, render, stream, backlog=2 * processes):
+                    w.append_data(image)
 
     logging.info(f'saved animation to {savedir}{fname}')
     return 
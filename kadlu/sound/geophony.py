@@ -3,6 +3,7 @@
 import copy
 import numpy as np
 from tqdm import tqdm
+from kadlu import instrument
 from scipy.interpolate import interp2d
 from kadlu.geospatial.ocean import Ocean
 from kadlu.sound.sound_speed import SoundSpeed
@@ -76,7 +77,7 @@ def source_level(freq, x, y, area, ocean, sl_func):
 
 def transmission_loss(freq, propagation_range, lat=None, lon=None, data_range=None,
                         seafloor={'sound_speed':1700,'density':1.5,'attenuation':0.5},
-                        return_ocean=False, **kwargs):
+                        return_ocean=False, sound_speed_cache=False, bathy_pyramid=False, **kwargs):
     """ Initialize transmission loss calculator.
 
         Use the keyword arguments from :class:`kadlu.geospatial.ocean.Ocean`, 
@@ -101,6 +102,13 @@ def transmission_loss(freq, propagation_range, lat=None, lon=None, data_range=No
                 Bottom acoustic properties.
             return_ocean: bool
                 Return ocean object. Default is False.
+            sound_speed_cache: bool
+                Re-use sound speed fields previously computed for the same 
+                ocean boundaries and data sources. Default is False.
+            bathy_pyramid: bool
+                Load bathymetry at the coarsest resolution that resolves the 
+                radial step of the computational grid, see the bathy_spacing 
+                argument of :class:`kadlu.geospatial.ocean.Ocean`. Default is False.
 
         Returns:
             transm_loss: instance of :class:`kadlu.sound.parabolic_equation.TransmissionLoss`
@@ -120,8 +128,11 @@ def transmission_loss(freq, propagation_range, lat=None, lon=None, data_range=No
         k['west']  = lon - dlon
         k['east']  = lon + dlon
 
+    if bathy_pyramid and 'bathy_spacing' not in k.keys():
+        k['bathy_spacing'] = k['dr'] if 'dr' in k.keys() else k.get('c0', 1500) / freq
+
     ocean = Ocean(**k) # ocean
-    ss = SoundSpeed(ssp=k['ssp']) if 'ssp' in k.keys() else SoundSpeed(ocean=ocean) # sound speed
+    ss = SoundSpeed(ssp=k['ssp']) if 'ssp' in k.keys() else SoundSpeed(ocean=ocean, cache=sound_speed_cache) # sound speed
 
     # transmission loss calculator
     if 'bottom' in k.keys(): k.pop('bottom') 
@@ -240,49 +251,51 @@ def geophony(freq, depth, sl_func=kewley_sl_func,
         lat = lats[i]
         lon = lons[i]
 
-        # initialize transmission loss calculator
-        kwargs['lat'] = lat
-        kwargs['lon'] = lon
-        transm_loss, ocean = transmission_loss(freq=freq, seafloor=seafloor, 
-            return_ocean=True, **kwargs)
-
-        # interpolate bathymetry
-        b = ocean.bathy(lat=lat, lon=lon)
-        bathy.append(b)
-
-        if below_seafloor: z = depth
-        else: z = depth[depth <= b] 
-
-        if len(z) == 0:
-            dB = np.empty((1,len(depth)), dtype=float)
-            dB[:,:] = np.nan
-
-        else:
-            # transmission loss
-            rec_depth = 0.25 * kwargs['c0'] / freq # set receiver depth to 1/4 of the characteristic wave length
-            tl, ax = transm_loss.calc(source_depth=z, rec_depth=rec_depth, progress_bar=progress_bar_transm)
-            tl = tl[:,0,:,:] 
-
-            # source level
-            sl = _source_level_polar_grid(freq=freq, 
-                                          radial_axis=ax['radial_axis'], 
-                                          azimuthal_axis=ax['azimuthal_axis'], 
-                                          ocean=ocean, sl_func=sl_func)
-
-            # integrate SL-TL to obtain sound pressure level
-            p = np.power(10, (sl - tl) / 10)
-            p = np.squeeze(np.apply_over_axes(np.sum, p, range(1, p.ndim))) # sum over all but the first axis
-            dB = 10 * np.log10(p)
-            if np.ndim(dB) == 0: dB = np.array([dB])
-
-            # pad, if necessary
-            n = len(depth) - len(dB)
-            if n > 0:
-                pad = np.empty(n)
-                pad[:] = np.nan
-                dB = np.concatenate((dB, pad))
-
-            dB = dB[np.newaxis, :]
+        with instrument.timer('geophony.point', lat=float(lat), lon=float(lon)):
+
+            # initialize transmission loss calculator
+            kwargs['lat'] = lat
+            kwargs['lon'] = lon
+            transm_loss, ocean = transmission_loss(freq=freq, seafloor=seafloor, 
+                return_ocean=True, **kwargs)
+
+            # interpolate bathymetry
+            b = ocean.bathy(lat=lat, lon=lon)
+            bathy.append(b)
+
+            if below_seafloor: z = depth
+            else: z = depth[depth <= b] 
+
+            if len(z) == 0:
+                dB = np.empty((1,len(depth)), dtype=float)
+                dB[:,:] = np.nan
+
+            else:
+                # transmission loss
+                rec_depth = 0.25 * kwargs['c0'] / freq # set receiver depth to 1/4 of the characteristic wave length
+                tl, ax = transm_loss.calc(source_depth=z, rec_depth=rec_depth, progress_bar=progress_bar_transm)
+                tl = tl[:,0,:,:] 
+
+                # source level
+                sl = _source_level_polar_grid(freq=freq, 
+                                              radial_axis=ax['radial_axis'], 
+                                              azimuthal_axis=ax['azimuthal_axis'], 
+                                              ocean=ocean, sl_func=sl_func)
+
+                # integrate SL-TL to obtain sound pressure level
+                p = np.power(10, (sl - tl) / 10)
+                p = np.squeeze(np.apply_over_axes(np.sum, p, range(1, p.ndim))) # sum over all but the first axis
+                dB = 10 * np.log10(p)
+                if np.ndim(dB) == 0: dB = np.array([dB])
+
+                # pad, if necessary
+                n = len(depth) - len(dB)
+                if n > 0:
+                    pad = np.empty(n)
+                    pad[:] = np.nan
+                    dB = np.concatenate((dB, pad))
+
+                dB = dB[np.newaxis, :]
 
         if spl is None: spl = dB
         else: spl = np.concatenate((spl, dB), axis=0)
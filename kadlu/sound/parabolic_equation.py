@@ -3,6 +3,7 @@
 """
 import numpy as np
 from numpy.lib import scimath
+from kadlu import instrument
 from kadlu.utils import toarray, deg2rad
 from tqdm import tqdm
 from kadlu.plot_util import plot_transm_loss_horiz, plot_transm_loss_vert
@@ -677,14 +678,20 @@ class TransmissionLoss():
         self._save_output(step_no=0, r=0, psi=psi, sqrt_rho=0, rec_depth=rec_depth) #save output 
 
         r = 0
+        lap = instrument.laps('pe') # stage timers, reported as totals
         for i in tqdm(range(nr-1), disable = not progress_bar):# PE marching
-            psi = UD * psi  # diffractive propagation, half-step 
-            n, sqrt_rho = self._update_env(r + dr/2)  # update acoustic environment
-            UR = prop_refr(x=dr, k0=k0, n=n) # refractive propagation
-            psi = np.fft.fft(UR * np.fft.ifft(psi, axis=1), axis=1)  # refractive propagation, full step
-            psi = UD * psi # diffractive propagation, half-step
+            with lap('fft'):
+                psi = UD * psi  # diffractive propagation, half-step 
+            with lap('env'):
+                n, sqrt_rho = self._update_env(r + dr/2)  # update acoustic environment
+            with lap('fft'):
+                UR = prop_refr(x=dr, k0=k0, n=n) # refractive propagation
+                psi = np.fft.fft(UR * np.fft.ifft(psi, axis=1), axis=1)  # refractive propagation, full step
+                psi = UD * psi # diffractive propagation, half-step
             r += dr # increment distance
-            self._save_output(step_no=i+1, r=r, psi=psi, sqrt_rho=sqrt_rho, rec_depth=rec_depth) # collect output
+            with lap('save'):
+                self._save_output(step_no=i+1, r=r, psi=psi, sqrt_rho=sqrt_rho, rec_depth=rec_depth) # collect output
+        lap.emit()
 
         if return_field: return psi
 
@@ -1,9 +1,19 @@
 """ Sound speed module within the kadlu package
 """
+import os
 import gsw
 import numpy as np
+from collections import OrderedDict
+from kadlu import instrument
 from kadlu.utils import interp_grid_1d, deg2rad
 from kadlu.geospatial.interpolation import Interpolator2D, Interpolator3D, Uniform3D, DepthInterpolator3D
+from kadlu.geospatial.data_sources.data_util import hash_key, storage_cfg
+
+
+# sound speed fields used in this process, shared by all SoundSpeed instances.
+# the least recently used fields are discarded beyond field_cache_size
+_field_cache = OrderedDict()
+field_cache_size = 8
 
 
 def sound_speed_teos10(lats, lons, z, t, SP):
@@ -35,6 +45,96 @@ def sound_speed_teos10(lats, lons, z, t, SP):
     c = gsw.density.sound_speed(SA=SA, CT=CT, p=p)
     return c
 
+def field_key(ocean, num_depths, rel_err):
+    """ Compute the key used to store the sound speed field of an ocean.
+
+        The key depends on the geographic and temporal boundaries of the ocean, 
+        the sources of the bathymetry, temperature and salinity data, and the 
+        depth grid parameters. For a time-resolved ocean, it also depends on 
+        the time at which the ocean is queried.
+
+        The key does not depend on the data itself. If data within the 
+        boundaries is fetched again or changes, e.g. after the database 
+        is refreshed, fields stored under the key are out of date and 
+        must be removed from the sound_speed folder of the storage 
+        directory.
+
+        Args:
+            ocean: instance of :class:`kadlu.geospatial.ocean.Ocean`
+                Ocean variables
+            num_depths: int
+                Number of depth values for the interpolation grid.
+            rel_err: float
+                Maximum deviation of the interpolation.
+
+        Returns:
+            key: int
+                Field key. None if the sound speed field can't be cached, 
+                i.e., if any of the data were loaded from a callable.
+    """
+    sources = getattr(ocean, 'sources', {})
+    sources = [sources.get(v) for v in ('bathy', 'temp', 'salinity')]
+    if None in sources: return None
+    seed = f'sound_speed_{sources}_{num_depths}_{rel_err}'
+    if getattr(ocean, 'timestep', None) is not None: seed += f'_{ocean.time}'
+    return hash_key(ocean.boundaries, seed)
+
+def load_field(key):
+    """ Load a sound speed field from the field store.
+
+        Fields are first looked up in memory, and then on disk. Fields 
+        on disk are memory-mapped.
+
+        Args:
+            key: int
+                Field key, as returned by :func:`field_key`
+
+        Returns:
+            field: tuple
+                Sound speed, latitudes, longitudes, and depths. 
+                None if the field has not been stored.
+    """
+    if key in _field_cache:
+        _field_cache.move_to_end(key)
+        return _field_cache[key]
+    fpath = f'{storage_cfg()}sound_speed{os.path.sep}{key}'
+    if not os.path.isfile(f'{fpath}_axes.npz'): return None
+    axes = np.load(f'{fpath}_axes.npz', allow_pickle=False)
+    c = np.load(f'{fpath}.npy', mmap_mode='r', allow_pickle=False)
+    return _remember(key, (c, axes['lats'], axes['lons'], axes['depths']))
+
+def _remember(key, field):
+    """ Keep a field in memory, discarding the least recently used fields. """
+    _field_cache[key] = field
+    _field_cache.move_to_end(key)
+    while len(_field_cache) > field_cache_size: _field_cache.popitem(last=False)
+    return field
+
+def store_field(key, c, lats, lons, depths):
+    """ Save a sound speed field to the field store.
+
+        Args:
+            key: int
+                Field key, as returned by :func:`field_key`
+            c: numpy.array
+                Sound speed values with shape (nlats, nlons, ndepths)
+            lats, lons, depths: numpy.array
+                Grid coordinates
+    """
+    _remember(key, (c, lats, lons, depths))
+    dirname = f'{storage_cfg()}sound_speed{os.path.sep}'
+    os.makedirs(dirname, exist_ok=True)
+    # files are written to temporary files and moved into place, so that 
+    # a crash or a concurrent write never leaves a truncated field. axes 
+    # are moved last, marking the field as complete
+    part = f'.{os.getpid()}.part'
+    with open(f'{dirname}{key}.npy{part}', 'wb') as f:
+        np.save(f, c, allow_pickle=False)
+    with open(f'{dirname}{key}_axes.npz{part}', 'wb') as f:
+        np.savez(f, lats=lats, lons=lons, depths=depths)
+    os.replace(f'{dirname}{key}.npy{part}', f'{dirname}{key}.npy')
+    os.replace(f'{dirname}{key}_axes.npz{part}', f'{dirname}{key}_axes.npz')
+
 class SoundSpeed():
     """ Class for handling computation and interpolation of sound speed. 
 
@@ -61,8 +161,14 @@ class SoundSpeed():
             rel_err: float
                 Maximum deviation of the interpolation, expressed as a ratio of the 
                 range of sound-speed values. The default value is 0.001.
+            cache: bool
+                Store the computed sound speed field, and re-use previously 
+                stored fields for oceans with the same boundaries and data 
+                sources. Fields are kept in memory and saved to the storage 
+                directory. Stored fields are not updated when the data 
+                changes, see :func:`field_key`. The default value is False.
     """
-    def __init__(self, ocean=None, ssp=None, num_depths=50, rel_err=1E-3):
+    def __init__(self, ocean=None, ssp=None, num_depths=50, rel_err=1E-3, cache=False):
 
         assert ocean is not None or ssp is not None, "ocean or ssp must be specified"
 
@@ -71,38 +177,68 @@ class SoundSpeed():
             else: self._interp = Uniform3D(values=ssp)
 
         else:
-            lat_res, lon_res = self._lat_lon_res(ocean, default_res=1.0) #default resolution is 1 degree, approx 100 km
-
-            # geographic boundaries
-            S,N,W,E = ocean.boundaries['south'], ocean.boundaries['north'], ocean.boundaries['west'], ocean.boundaries['east']
-
-            # lat and lon coordinates
-            num_lats = max(3, int(np.ceil((N - S) / lat_res)) + 1)
-            lats = np.linspace(S, N, num=num_lats)
-            num_lons = max(3, int(np.ceil((E - W) / lon_res)) + 1)
-            lons = np.linspace(W, E, num=num_lons)
-
-            # compute depth coordinates
-            depths = self._depth_coordinates(ocean, lats, lons, num_depths=num_depths, rel_err=rel_err)
-
-            # interpolate temperature and salinity on lat,lon,depth grid
-            t = ocean.temp(lat=lats, lon=lons, depth=depths, grid=True)
-            s = ocean.salinity(lat=lats, lon=lons, depth=depths, grid=True)
-
-            # compute sound speed
-            grid_shape = t.shape
-            la, lo, de = np.meshgrid(lats, lons, depths)
-            la = la.flatten()
-            lo = lo.flatten()
-            de = de.flatten()
-            t = t.flatten()
-            s = s.flatten()
-            c = sound_speed_teos10(lats=la, lons=lo, z=de, t=t, SP=s)
-            c = np.reshape(c, newshape=grid_shape)
+            key = field_key(ocean, num_depths, rel_err) if cache else None
+            field = load_field(key) if key is not None else None
+            if field is None:
+                with instrument.timer('sound_speed.build', num_depths=num_depths):
+                    field = self._compute_field(ocean, num_depths, rel_err)
+                if key is not None: store_field(key, *field)
+            else: instrument.count('sound_speed.cached')
 
             # create interpolator
-            self._interp = Interpolator3D(values=c, lats=lats, lons=lons,\
-                    depths=depths, origin=ocean.origin, method='linear')
+            c, lats, lons, depths = field
+            with instrument.timer('interp.fit', var='sound_speed'):
+                self._interp = Interpolator3D(values=c, lats=lats, lons=lons,\
+                        depths=depths, origin=ocean.origin, method='linear')
+
+    def _compute_field(self, ocean, num_depths, rel_err):
+        """ Compute the sound speed on a lat,lon,depth grid from the 
+            temperature and salinity of the ocean.
+
+            Args:
+                ocean: instance of :class:`kadlu.geospatial.ocean.Ocean`
+                    Ocean variables
+                num_depths: int
+                    Number of depth values for the interpolation grid.
+                rel_err: float
+                    Maximum deviation of the interpolation.
+
+            Returns:
+                c: numpy.array
+                    Sound speed values with shape (nlats, nlons, ndepths)
+                lats, lons, depths: numpy.array
+                    Grid coordinates
+        """
+        lat_res, lon_res = self._lat_lon_res(ocean, default_res=1.0) #default resolution is 1 degree, approx 100 km
+
+        # geographic boundaries
+        S,N,W,E = ocean.boundaries['south'], ocean.boundaries['north'], ocean.boundaries['west'], ocean.boundaries['east']
+
+        # lat and lon coordinates
+        num_lats = max(3, int(np.ceil((N - S) / lat_res)) + 1)
+        lats = np.linspace(S, N, num=num_lats)
+        num_lons = max(3, int(np.ceil((E - W) / lon_res)) + 1)
+        lons = np.linspace(W, E, num=num_lons)
+
+        # compute depth coordinates
+        depths = self._depth_coordinates(ocean, lats, lons, num_depths=num_depths, rel_err=rel_err)
+
+        # interpolate temperature and salinity on lat,lon,depth grid
+        t = ocean.temp(lat=lats, lon=lons, depth=depths, grid=True)
+        s = ocean.salinity(lat=lats, lon=lons, depth=depths, grid=True)
+
+        # compute sound speed
+        grid_shape = t.shape
+        la, lo, de = np.meshgrid(lats, lons, depths)
+        la = la.flatten()
+        lo = lo.flatten()
+        de = de.flatten()
+        t = t.flatten()
+        s = s.flatten()
+        c = sound_speed_teos10(lats=la, lons=lo, z=de, t=t, SP=s)
+        c = np.reshape(c, newshape=grid_shape)
+
+        return c, lats, lons, depths
 
     def _lat_lon_res(self, ocean, default_res):
         """ Determine lat,lon resolutions for interpolation grid
@@ -0,0 +1,60 @@
+""" benchmark of the fetch pipeline against the local stand-in services
+
+    the stand-in server adds a fixed latency to each response, so that
+    the effect of concurrent requests can be measured offline. timings are
+    appended to the history file described in conftest.py. benchmarks are
+    not collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_fetch.py
+"""
+
+from datetime import datetime
+
+import pytest
+
+import kadlu
+from kadlu.geospatial.data_sources import chs, hycom, wwiii
+from kadlu.tests.standin import serve
+from kadlu.tests.standin import wwiii as standin_wwiii
+
+
+@pytest.mark.parametrize('delay', [0, 0.05])
+@pytest.mark.parametrize('workers', [1, 8])
+def test_bench_hycom_metadata(bench, standin_storage, monkeypatch, workers, delay):
+    """ grid metadata for every year is requested in parallel """
+    monkeypatch.setattr(hycom, 'hycom_workers', workers)
+    with serve(delay=delay) as server:
+        bench(hycom.fetch_grid, rounds=1)
+    assert len(server.requests) == len(hycom.hycom_years) + 1
+
+
+@pytest.mark.parametrize('delay', [0, 0.05])
+def test_bench_hycom_fetch(bench, standin_storage, delay):
+    """ fetch, parse and insert temperature and salinity for two days """
+    qry = dict(south=44, north=46, west=-64, east=-62, top=0, bottom=5000,
+               start=datetime(2013, 6, 1), end=datetime(2013, 6, 3))
+    with serve(delay=delay) as server:
+        hycom.load_grid(), hycom.load_times()  # metadata is not timed
+        bench(kadlu.geospatial.data_sources.fetch_handler.fetch_handler,
+              ['temp', 'salinity'], 'hycom', rounds=1, **qry)
+    assert sum('.ascii?water_temp' in p for _, p, _ in server.requests) == 2
+
+
+@pytest.mark.parametrize('delay', [0, 0.05])
+@pytest.mark.parametrize('workers', [1, 4])
+def test_bench_chs_fetch(bench, standin_storage, monkeypatch, workers, delay):
+    """ geotiff tiles are downloaded concurrently and inserted as they arrive """
+    monkeypatch.setattr(chs, 'chs_workers', workers)
+    with serve(delay=delay) as server:
+        bench(chs.fetch_chs, south=43, north=45, west=-60, east=-59, rounds=1)
+    assert sum('/file?' in p for _, p, _ in server.requests) > 0
+
+
+@pytest.mark.parametrize('res', [2.0, 1.0])
+def test_bench_wwiii_fetch(bench, standin_storage, res):
+    """ download, index and insert one month file of wave heights """
+    qry = dict(south=40, north=50, west=-70, east=-50,
+               start=datetime(2014, 2, 3), end=datetime(2014, 2, 4))
+    standin_wwiii.handle('multi_1.glo_30m.hs.201402.grb2', res)  # encoding is not timed
+    with serve(wwiii_res=res) as server:
+        assert bench(wwiii.fetch_wwiii, 'hs', qry, rounds=1)
@@ -0,0 +1,33 @@
+""" benchmark of the time taken to import kadlu in a new process
+
+    benchmarks are not collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_import.py
+"""
+
+import sys
+import time
+import subprocess
+
+
+def import_time(code, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, capture_output=True)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def test_bench_import():
+    baseline = import_time('pass')
+    for label, code in (
+            ('import kadlu',            'import kadlu'),
+            ('kadlu.dt_2_epoch',        'import kadlu; kadlu.dt_2_epoch'),
+            ('kadlu.load_map',          'import kadlu; kadlu.load_map'),
+            ('kadlu.hycom',             'import kadlu; kadlu.hycom'),
+            ('kadlu.era5',              'import kadlu; kadlu.era5'),
+            ('kadlu.geospatial.ocean',  'import kadlu.geospatial.ocean'),
+            ('kadlu.plot2D',            'import kadlu; kadlu.plot2D'),
+        ):
+        print(f'{label:<24s} {import_time(code) - baseline:.3f}s')
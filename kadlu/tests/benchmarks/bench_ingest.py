@@ -0,0 +1,47 @@
+""" benchmark of database ingestion into tables of increasing size
+
+    compares bulk_insert against row inserts bracketed by COUNT(*) queries.
+    benchmarks are not collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_ingest.py
+"""
+
+import time
+import sqlite3
+from itertools import repeat
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.data_util import bulk_insert
+
+
+def insert_counted(conn, table, columns, source):
+    """ reference insertion, counting rows before and after """
+    db = conn.cursor()
+    n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+    db.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?,?,?,?,?)",
+            zip(*(col.tolist() for col in columns), repeat(source)))
+    n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+    conn.commit()
+    return n2 - n1, len(columns[0]) - (n2 - n1)
+
+
+def test_bench_ingest():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE hs (val REAL NOT NULL, lat REAL NOT NULL, '
+                 'lon REAL NOT NULL, time INT NOT NULL, source TEXT NOT NULL)')
+    conn.execute('CREATE UNIQUE INDEX idx_hs on hs(time, lon, lat, val, source)')
+
+    n = 50000
+    for step in range(6):
+        history = conn.execute('SELECT COUNT(*) FROM hs').fetchone()[0]
+        timings = []
+        for fcn in (insert_counted, bulk_insert):
+            val, lat, lon = np.random.rand(3, n)
+            epoch = np.full(n, step, dtype=np.int64)
+            t0 = time.perf_counter()
+            inserted, duplicates = fcn(conn, 'hs', [val, lat, lon, epoch], 'wwiii')
+            timings.append(time.perf_counter() - t0)
+            assert inserted == n and duplicates == 0
+        print(f'{history:>8d} rows in table: COUNT(*) {timings[0]:.3f}s, '
+              f'bulk_insert {timings[1]:.3f}s')
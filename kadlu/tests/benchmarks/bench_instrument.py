@@ -0,0 +1,36 @@
+""" benchmark of the cost of instrumentation, with and without a sink
+
+    benchmarks are not collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_instrument.py
+"""
+
+import pytest
+
+from kadlu import instrument
+from kadlu.sound.geophony import transmission_loss
+
+
+@pytest.fixture(params=[None, 'memory'])
+def sink(request):
+    previous = instrument.set_sink(request.param)
+    yield request.param
+    instrument.set_sink(previous)
+
+
+def test_bench_timer_overhead(bench, sink):
+    """ one million timed blocks """
+    def run(n=1000000):
+        lap = instrument.laps('pe')
+        for _ in range(n):
+            with lap('fft'): pass
+        lap.emit()
+    bench(run, rounds=1)
+
+
+def test_bench_transmission_loss_instrumented(bench, sink):
+    seafloor = {'sound_speed': 1700, 'density': 1.5, 'attenuation': 0.5}
+    tl = transmission_loss(freq=50, propagation_range=10, lat=45, lon=-59,
+            load_bathymetry=10000, ssp=1480, seafloor=seafloor, angular_bin=15,
+            source_depth=[10])
+    bench(tl.calc, rec_depth=[10], progress_bar=False)
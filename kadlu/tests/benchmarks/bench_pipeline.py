@@ -0,0 +1,173 @@
+""" end-to-end benchmarks of the main processing stages on synthetic data
+
+    no network access is required: data is generated in memory, inserted
+    into a temporary database, and loaded back with fetching disabled.
+    timings are appended to the history file described in conftest.py.
+    benchmarks are not collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_pipeline.py
+
+    a single stage can be selected with -k, e.g. -k interpolator
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import kadlu
+from kadlu.geospatial.data_sources.data_util import      \
+        bulk_insert,                                        \
+        reshape_3D,                                         \
+        dt_2_epoch,                                         \
+        chs_table
+from kadlu.geospatial.data_sources import chs, era5, hycom, wwiii
+from kadlu.geospatial.interpolation import Interpolator2D, Interpolator3D
+from kadlu.geospatial.ocean import Ocean
+from kadlu.sound.sound_speed import SoundSpeed
+from kadlu.sound.geophony import geophony, transmission_loss
+
+
+bounds = dict(south=44, north=46, west=-60, east=-58, top=0, bottom=1000,
+              start=datetime(2015, 1, 1), end=datetime(2015, 1, 2))
+seafloor = {'sound_speed': 1700, 'density': 1.5, 'attenuation': 0.5}
+
+
+def grid_columns(n, times=1, depths=None, seed=0):
+    """ synthetic rows on an n x n grid within the benchmark bounds
+
+        return:
+            columns val, lat, lon, time (and depth if depths is given)
+    """
+    rng = np.random.default_rng(seed)
+    lat = np.linspace(bounds['south'], bounds['north'], n)
+    lon = np.linspace(bounds['west'],  bounds['east'],  n)
+    epoch = dt_2_epoch(bounds['start']) + np.arange(times)
+    axes = [epoch, lat, lon] if depths is None else [epoch, depths, lat, lon]
+    grid = [a.ravel() for a in np.meshgrid(*axes, indexing='ij')]
+    if depths is None: t, y, x = grid; cols = [y, x, t]
+    else: t, z, y, x = grid; cols = [y, x, t, z]
+    return [rng.random(len(grid[0])) * 10] + cols
+
+
+def bathy_columns(n):
+    """ synthetic canyon bathymetry in metres, as val, lat, lon """
+    lat = np.linspace(bounds['south'] - 1, bounds['north'] + 1, n)
+    lon = np.linspace(bounds['west']  - 1, bounds['east']  + 1, n)
+    y, x = np.meshgrid(lat, lon, indexing='ij')
+    val = 200 + 1800 * np.exp(-(y - 45)**2 / 0.5)
+    return val.ravel(), y.ravel(), x.ravel()
+
+
+def synthetic_ocean(n, depths):
+    """ ocean with canyon bathymetry and depth-dependent temperature and
+        salinity on an n x n horizontal grid, loaded from callables
+    """
+    def profile(surface, gradient):
+        def load(**kwargs):
+            val, lat, lon, epoch, depth = grid_columns(n, depths=depths)
+            return np.array((surface + gradient * depth + val / 10, lat, lon, epoch, depth))
+        return load
+    bathy = bathy_columns(n)
+    return Ocean(load_bathymetry=lambda **kw: np.array(bathy),
+                 load_temp=profile(12, -0.008), load_salinity=profile(31, 0.003),
+                 **bounds)
+
+
+@pytest.mark.parametrize('n', [10, 20, 40])
+def test_bench_reshape_3D(bench, n):
+    depths = np.linspace(0, 1000, 10)
+    val, lat, lon, epoch, depth = grid_columns(n, times=2, depths=depths)
+    cols = np.array((val, lat, lon, epoch, depth))
+    gridded = bench(reshape_3D, cols)
+    assert gridded['values'].shape == (n, n, len(depths))
+
+
+@pytest.mark.parametrize('n', [50, 200])
+@pytest.mark.parametrize('source', ['chs', 'era5', 'hycom', 'wwiii'])
+def test_bench_ingest_load(bench, storage, source, n):
+    """ insert rows into the source table, then load them by range query """
+    conn, db = storage
+    depths = np.array([0, 10, 50, 100, 500])
+    if source == 'chs':
+        cols, table = list(bathy_columns(n)), chs_table
+        load = lambda: chs.load_chs(**{k: bounds[k] for k in ('south', 'north', 'west', 'east')})
+    elif source == 'era5':
+        cols, table = grid_columns(n, times=4), 'mean_wave_period'
+        load = lambda: era5.load_era5('mean_wave_period', bounds.copy())
+    elif source == 'hycom':
+        cols, table = grid_columns(n // 4, times=4, depths=depths), 'hycom_water_temp'
+        h = hycom.Hycom()
+        h.grids = [None]  # grid metadata is only needed for fetching
+        load = lambda: hycom.load_hycom(h, 'water_temp', bounds.copy())
+    else:
+        cols, table = grid_columns(n, times=4), 'tp'
+        load = lambda: wwiii.load_wwiii('tp', bounds.copy())
+
+    inserted, dups = bench(bulk_insert, conn, table, cols, source, rounds=1)
+    assert inserted == len(cols[0])
+    data = bench(load, label='load')
+    inside = ((cols[1] >= bounds['south']) & (cols[1] <= bounds['north']) &
+              (cols[2] >= bounds['west'])  & (cols[2] <= bounds['east']))
+    assert data.shape[1] == np.count_nonzero(inside)
+
+
+@pytest.mark.parametrize('chunk', [3, 24])
+def test_bench_iter_load(bench, storage, chunk):
+    """ stream 4 days of hourly rows in time slices of the given hours """
+    conn, db = storage
+    cols = grid_columns(100, times=96)
+    bulk_insert(conn, 'mean_wave_period', cols, 'era5')
+    qry = dict(bounds, end=bounds['start'] + timedelta(hours=95))
+    stream = lambda: sum(s.shape[1] for s in kadlu.iter_load('era5', 'waveperiod', 
+            chunk=timedelta(hours=chunk), **qry))
+    assert bench(stream, label='iter_load') == len(cols[0])
+
+
+@pytest.mark.parametrize('n', [50, 200])
+def test_bench_interpolator2D(bench, n):
+    val, lat, lon = (a.reshape(n, n) for a in bathy_columns(n))
+    interp = bench(Interpolator2D, val, lat[:, 0], lon[0])
+    y, x = np.random.default_rng(1).uniform((44, -60), (46, -58), (10000, 2)).T
+    bench(interp.interp, y, x, label='interp points')
+    bench(interp.interp, np.linspace(44, 46, 100), np.linspace(-60, -58, 100), grid=True,
+          label='interp grid')
+
+
+@pytest.mark.parametrize('n', [10, 25])
+def test_bench_interpolator3D(bench, n):
+    depths = np.linspace(0, 1000, 20)
+    val = np.random.default_rng(2).random((n, n, len(depths)))
+    lat = np.linspace(bounds['south'], bounds['north'], n)
+    lon = np.linspace(bounds['west'],  bounds['east'],  n)
+    interp = bench(Interpolator3D, val, lat, lon, depths)
+    y, x, z = np.random.default_rng(3).uniform((44, -60, 0), (46, -58, 1000), (10000, 3)).T
+    bench(interp.interp, y, x, z, label='interp points')
+
+
+@pytest.mark.parametrize('num_depths', [20, 50])
+@pytest.mark.parametrize('n', [10, 20])
+def test_bench_sound_speed(bench, n, num_depths):
+    ocean = synthetic_ocean(n, np.linspace(0, 2000, 10))
+    ss = bench(SoundSpeed, ocean, num_depths=num_depths, rel_err=None)
+    assert np.all(ss.interp(lat=45, lon=-59, z=[0, 100, 1000], grid=True) > 1400)
+
+
+@pytest.mark.parametrize('angular_bin', [90, 45, 15])
+@pytest.mark.parametrize('freq', [20, 50, 100])
+def test_bench_transmission_loss(bench, freq, angular_bin):
+    bathy = bathy_columns(50)
+    tl = transmission_loss(freq=freq, propagation_range=10, lat=45, lon=-59,
+            load_bathymetry=np.array(bathy), ssp=1480, seafloor=seafloor,
+            angular_bin=angular_bin, source_depth=[10])
+    tl_h, ax_h = bench(tl.calc, rec_depth=[10], progress_bar=False, rounds=1)
+    assert tl_h.shape[2] == len(ax_h['azimuthal_axis'])
+
+
+@pytest.mark.parametrize('xy_res', [71, 40])
+def test_bench_geophony(bench, xy_res):
+    kwargs = dict(load_bathymetry=10000, load_wind_uv=1.0, ssp=1480,
+                  angular_bin=90, dr=1000, dz=1000)
+    geo = bench(geophony, freq=100, depth=[100, 2000], xy_res=xy_res, rounds=1,
+                **{k: bounds[k] for k in ('south', 'north', 'west', 'east')}, **kwargs)
+    assert geo['spl'].shape[2] == 2
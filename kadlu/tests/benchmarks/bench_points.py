@@ -0,0 +1,64 @@
+""" benchmark of point time series extraction over long time periods
+
+    compares load_points, reading the grid nodes of each site through the
+    location index, against loading the bounding box of the sites and
+    selecting the nearest nodes in memory. benchmarks are not collected
+    by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_points.py
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import kadlu
+from kadlu.geospatial.data_sources.data_util import dt_2_epoch, bulk_insert
+from kadlu.geospatial.data_sources.points import load_points
+
+
+start = datetime(2015, 1, 1)
+region = dict(south=44, north=48, west=-64, east=-60)
+
+
+def populate(conn, days):
+    """ hourly wave heights on a 0.25 degree grid, as stored by ERA5 """
+    epoch = np.arange(dt_2_epoch(start), dt_2_epoch(start + timedelta(days=days)) + 1)
+    t, lat, lon = [a.ravel() for a in np.meshgrid(epoch,
+            np.arange(region['south'], region['north'] + 0.01, 0.25),
+            np.arange(region['west'], region['east'] + 0.01, 0.25), indexing='ij')]
+    bulk_insert(conn, 'significant_height_of_combined_wind_waves_and_swell',
+            [np.random.rand(len(t)), lat, lon, t.astype(int)], 'era5')
+
+
+def load_bbox(lat, lon, **kwargs):
+    """ reference extraction: load the bounding box and select the nearest nodes """
+    val, glat, glon, epoch = kadlu.load('era5', 'waveheight', south=min(lat) - 0.25,
+            north=max(lat) + 0.25, west=min(lon) - 0.25, east=max(lon) + 0.25, **kwargs)
+    times = np.unique(epoch)
+    out = np.full((len(lat), len(times)), np.nan)
+    for s, (y, x) in enumerate(zip(lat, lon)):
+        d = (glat - y)**2 + ((glon - x) * np.cos(np.radians(y)))**2
+        node = (glat == glat[np.argmin(d)]) & (glon == glon[np.argmin(d)])
+        out[s, np.searchsorted(times, epoch[node])] = val[node]
+    return out, times
+
+
+@pytest.mark.parametrize('days', [30, 120])
+def test_bench_load_points(bench, storage, days):
+    conn, db = storage
+    populate(conn, days)
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(44.5, 47.5, 20), rng.uniform(-63.5, -60.5, 20)
+    qry = dict(start=start, end=start + timedelta(days=days))
+
+    # the location index is created on first use, outside of the timings
+    load_points('era5', 'waveheight', lat=lat[:1], lon=lon[:1], **qry, fetch=False)
+
+    a = bench(load_points, 'era5', 'waveheight', lat=lat, lon=lon, **qry,
+            fetch=False, rounds=1, label='nearest')
+    bench(load_points, 'era5', 'waveheight', lat=lat, lon=lon, **qry,
+            method='bilinear', fetch=False, rounds=1, label='bilinear')
+    b = bench(load_bbox, lat, lon, **qry, rounds=1, label='bbox')
+    np.testing.assert_array_equal(a[0], b[0])
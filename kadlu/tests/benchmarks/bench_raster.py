@@ -0,0 +1,47 @@
+""" benchmark of geotiff decoding on the test assets
+
+    compares the vectorized raster reader against decoding one pixel at a
+    time. benchmarks are not collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_raster.py
+"""
+
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from kadlu.geospatial.data_sources.load_from_file import read_raster
+
+
+path_to_tifs = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "tif")
+
+
+def decode_per_pixel(im):
+    """ reference decoder, reading one pixel at a time """
+    grid = np.ndarray((im.size[0], im.size[1]))
+    for xi in range(im.size[0]):
+        grid[xi] = np.array(list(map(im.getpixel, zip(
+            [xi for _ in range(im.size[1])], range(im.size[1])))))
+    return grid.T
+
+
+def test_bench_raster_decode():
+    for fname in sorted(os.listdir(path_to_tifs)):
+        im = Image.open(os.path.join(path_to_tifs, fname))
+        im.load()
+
+        t0 = time.perf_counter()
+        reference = decode_per_pixel(im)
+        t1 = time.perf_counter()
+        val = read_raster(im)
+        t2 = time.perf_counter()
+
+        assert np.array_equal(val.data, reference)
+        print(f'\n{fname} {im.size[0]}x{im.size[1]}: '
+              f'per pixel {t1-t0:.3f}s, vectorized {t2-t1:.4f}s, '
+              f'speedup {(t1-t0)/(t2-t1):.0f}x')
+
+
+if __name__ == '__main__': test_bench_raster_decode()
@@ -0,0 +1,85 @@
+""" scaling benchmarks of the ocean and sound modules on synthetic data
+
+    the synthetic source computes seeded analytic fields at any grid
+    resolution, so that the cost of each stage can be measured at
+    production grid sizes without fetching data. benchmarks are not
+    collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_synthetic.py
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from kadlu.geospatial.data_sources.synthetic import Synthetic
+from kadlu.geospatial.ocean import Ocean
+from kadlu.sound.sound_speed import SoundSpeed
+from kadlu.sound.geophony import geophony, transmission_loss
+
+
+bounds = dict(south=44, north=46, west=-60, east=-58, top=0, bottom=5000,
+              start=datetime(2015, 1, 1), end=datetime(2015, 1, 1, 6))
+seafloor = {'sound_speed': 1700, 'density': 1.5, 'attenuation': 0.5}
+
+
+def synthetic(resolution, *variables):
+    """ load arguments of the given variables from a synthetic source """
+    s = Synthetic(resolution=resolution)
+    return {f'load_{v}': getattr(s, f'load_{v}') for v in variables}
+
+
+@pytest.mark.parametrize('resolution', [0.1, 0.02, 0.005])
+def test_bench_ocean_bathymetry(bench, resolution):
+    bench(Ocean, **synthetic(resolution, 'bathymetry'), **bounds, rounds=1)
+
+
+@pytest.mark.parametrize('resolution', [0.25, 0.08])
+def test_bench_ocean_temp_salinity(bench, resolution):
+    bench(Ocean, **synthetic(resolution, 'temp', 'salinity'), **bounds, rounds=1)
+
+
+@pytest.mark.parametrize('resolution', [0.25, 0.08])
+def test_bench_sound_speed_synthetic(bench, resolution):
+    ocean = Ocean(**synthetic(resolution, 'bathymetry', 'temp', 'salinity'), **bounds)
+    bench(SoundSpeed, ocean, rounds=1)
+
+
+@pytest.mark.parametrize('resolution', [0.02, 0.005])
+def test_bench_transmission_loss_synthetic(bench, resolution):
+    load = synthetic(resolution, 'bathymetry', 'temp', 'salinity')
+    tl = transmission_loss(freq=50, propagation_range=20, lat=45, lon=-59,
+            seafloor=seafloor, angular_bin=15, source_depth=[10],
+            start=bounds['start'], end=bounds['end'], **load)
+    bench(tl.calc, rec_depth=[10], progress_bar=False, rounds=1)
+
+
+@pytest.mark.parametrize('xy_res', [71, 40])
+def test_bench_geophony_synthetic(bench, xy_res):
+    load = synthetic(0.02, 'bathymetry', 'wind_uv')
+    bench(geophony, freq=100, depth=[100, 2000], xy_res=xy_res, ssp=1480,
+          angular_bin=90, dr=1000, dz=1000, progress_bar=False, rounds=1,
+          **{k: bounds[k] for k in ('south', 'north', 'west', 'east', 'start', 'end')},
+          **load)
+
+
+def step_rebuild(load, times):
+    """ reference: a static ocean and sound speed field for each time step """
+    for t in times:
+        ocean = Ocean(**load, **dict(bounds, start=t, end=t))
+        SoundSpeed(ocean, num_depths=20, rel_err=None)
+
+
+def step_time_resolved(load, times):
+    """ a time-resolved ocean, with the sound speed field computed at each step """
+    ocean = Ocean(**load, timestep=timedelta(hours=3), **bounds)
+    for t in times:
+        ocean.time = t
+        SoundSpeed(ocean, num_depths=20, rel_err=None)
+
+
+def test_bench_time_resolved_ocean(bench):
+    load = synthetic(0.08, 'bathymetry', 'temp', 'salinity')
+    times = [bounds['start'] + timedelta(hours=h) for h in range(0, 7, 3)]
+    bench(step_rebuild, load, times, rounds=1)
+    bench(step_time_resolved, load, times, rounds=1)
@@ -0,0 +1,53 @@
+""" microbenchmarks of the datetime and epoch hour conversions
+
+    compares the vectorized conversions against converting one element
+    at a time. benchmarks are not collected by default, run them explicitly:
+
+        python -m pytest -s kadlu/tests/benchmarks/bench_time.py
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.data_util import dt_2_epoch, epoch_2_dt
+
+
+t0 = datetime(2000, 1, 1)
+
+
+def dt_2_epoch_per_element(dt_arr):
+    """ reference conversion, one datetime at a time """
+    return list(map(int, map(lambda dt: (dt - t0).total_seconds()/60/60, dt_arr)))
+
+
+def epoch_2_dt_per_element(ep_arr):
+    """ reference conversion, one epoch hour at a time """
+    return list(map(lambda ep: t0 + timedelta(hours=ep), ep_arr))
+
+
+def timed(fcn, arg, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fcn(arg)
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def test_bench_time_conversion():
+    for n in (1000, 100000, 1000000):
+        epoch = np.random.randint(-50000, 200000, n)
+        dt64 = np.datetime64(t0, 'h') + epoch.astype('timedelta64[h]')
+        dts = dt64.astype(datetime)
+
+        ref_t, ref = timed(dt_2_epoch_per_element, dts)
+        vec_t, vec = timed(dt_2_epoch, dt64)
+        assert np.array_equal(ref, vec)
+        print(f'dt_2_epoch {n:>8d} values: per element {ref_t:.4f}s, vectorized {vec_t:.4f}s')
+
+        ref_t, ref = timed(epoch_2_dt_per_element, epoch.tolist())
+        vec_t, vec = timed(epoch_2_dt, epoch)
+        assert list(vec) == ref
+        print(f'epoch_2_dt {n:>8d} values: per element {ref_t:.4f}s, vectorized {vec_t:.4f}s')
@@ -0,0 +1,101 @@
+""" fixtures shared by the benchmarks
+
+    timings are appended to a JSON lines history file, one record per
+    benchmark and parameter set, so that results can be compared across
+    commits and dependency upgrades. the history file can be set with the
+    environment variable KADLU_BENCH_HISTORY. each timing is compared to
+    the fastest previous record of the same benchmark, and flagged when it
+    is slower by more than the factor KADLU_BENCH_TOLERANCE (default 1.5)
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from kadlu.geospatial.data_sources import data_util
+import kadlu.geospatial.data_sources.fetch_handler
+
+
+history_file = os.environ.get('KADLU_BENCH_HISTORY',
+        os.path.join(os.path.dirname(__file__), 'history.jsonl'))
+tolerance = float(os.environ.get('KADLU_BENCH_TOLERANCE', 1.5))
+
+
+def git_commit():
+    """ current commit of the working tree, if available """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=os.path.dirname(__file__), capture_output=True,
+                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_best(name):
+    """ fastest recorded timing of a benchmark in the history file """
+    if not os.path.isfile(history_file): return None
+    with open(history_file) as f:
+        times = [rec['best'] for rec in map(json.loads, filter(str.strip, f))
+                 if rec['name'] == name]
+    return min(times) if times else None
+
+
+@pytest.fixture(scope='session')
+def environment():
+    return dict(commit=git_commit(), python=platform.python_version(),
+                numpy=np.__version__, machine=platform.machine())
+
+
+@pytest.fixture
+def bench(request, environment):
+    """ time a function call and record the result in the history file
+
+        returns a function bench(fcn, *args, rounds=3, label=None, **kwargs),
+        which calls fcn rounds times and returns the result of the last
+        call. timings are recorded by test name and label, which defaults
+        to the name of fcn
+    """
+    def run(fcn, *args, rounds=3, label=None, **kwargs):
+        timings = []
+        for _ in range(rounds):
+            t = time.perf_counter()
+            result = fcn(*args, **kwargs)
+            timings.append(time.perf_counter() - t)
+
+        name = f"{request.node.nodeid.split('::', 1)[-1]} {label or fcn.__name__}"
+        best = previous_best(name)
+        record = dict(name=name, best=min(timings), mean=float(np.mean(timings)),
+                      rounds=rounds, date=datetime.now().isoformat(timespec='seconds'),
+                      **environment)
+        os.makedirs(os.path.dirname(os.path.abspath(history_file)), exist_ok=True)
+        with open(history_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        flag = ''
+        if best is not None and record['best'] > tolerance * best:
+            flag = f'  REGRESSION: {record["best"] / best:.1f}x slower than {best:.4f}s'
+        print(f'\n{name:<60s} {record["best"]:.4f}s{flag}', file=sys.stderr)
+        return result
+
+    return run
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """ empty storage directory and database. fetching is disabled, so
+        that the loaders only read what the benchmark has inserted
+    """
+    monkeypatch.setattr(data_util, 'storage_cfg', lambda: f'{tmp_path}{os.sep}')
+    monkeypatch.setattr(kadlu.geospatial.data_sources.fetch_handler,
+            'fetch_handler', lambda *args, **kwargs: None)
+    yield data_util.database_cfg()
+    conn, db = data_util.connections.open.pop((f'{tmp_path}{os.sep}geospatial.db',
+            os.getpid()))
+    conn.close()
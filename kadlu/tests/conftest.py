@@ -21,3 +21,22 @@ def bathy_canyon():
     xv, yv = np.meshgrid(x, y)
     bathy = depth * np.exp(-(yv - canyon_axis(xv))**2 / (2 * sigma**2))
     return (bathy, y, x)
+
+@pytest.fixture
+def standin_storage(tmp_path, monkeypatch):
+    """ data sources storing data in an empty directory """
+    from kadlu.geospatial.data_sources import data_util, source_map, chs, era5, hycom, wwiii
+    for module in (data_util, chs, era5, hycom, wwiii):
+        monkeypatch.setattr(module, 'storage_cfg', lambda: f'{tmp_path}{os.sep}')
+    source_map.source_instance.cache_clear()  # discard cached grid metadata
+    yield tmp_path
+    source_map.source_instance.cache_clear()
+
+@pytest.fixture
+def standin(standin_storage):
+    """ local stand-in services, with the data sources pointed at them and
+        storing data in an empty directory. yields the StandinServer
+    """
+    from kadlu.tests.standin import serve
+    with serve() as server:
+        yield server
@@ -0,0 +1,125 @@
+import numpy as np
+
+from kadlu.geospatial.data_sources import bathy_pyramid
+from kadlu.geospatial.data_sources.bathy_pyramid import      \
+        build_pyramid,                                      \
+        downsample,                                         \
+        load_pyramid,                                       \
+        pyramid_level,                                      \
+        rasterize
+
+
+def synthetic_gebco(south, north, west, east, **kwargs):
+    """ 15 arc-second grid with depth increasing eastwards """
+    res = bathy_pyramid.base_res['gebco']
+    lat = np.arange(np.floor(south / res) + 0.5, north / res) * res
+    lon = np.arange(np.floor(west / res) + 0.5, east / res) * res
+    return np.tile(-lon * 10, (len(lat), 1)), lat, lon
+
+
+def test_rasterize_downsample():
+    grid = rasterize(np.array([1., 3., 5.]), np.array([0.1, 0.1, 0.6]), 
+                     np.array([0.1, 0.2, 0.6]), 0, 0, 0.5)
+    assert np.array_equal(grid, [[2, np.nan], [np.nan, 5]], equal_nan=True)
+    assert downsample(grid)[0, 0] == 3.5
+
+
+def test_pyramid_level():
+    assert pyramid_level('gebco', 100) == 0
+    assert pyramid_level('gebco', 1000) == 1
+    assert pyramid_level('gebco', 1e6) == bathy_pyramid.num_levels['gebco'] - 1
+
+
+def test_load_pyramid(tmp_path, monkeypatch):
+    monkeypatch.setattr(bathy_pyramid, 'storage_cfg', lambda: f'{tmp_path}/')
+    monkeypatch.setitem(bathy_pyramid.load_map, 'bathy_gebco', synthetic_gebco)
+    qry = dict(south=44.2, north=45.3, west=-64.5, east=-63.8)
+    build_pyramid('gebco', **qry)
+    assert len(list(tmp_path.glob('bathy_pyramid/gebco/*/*.npy'))) == 4 * bathy_pyramid.num_levels['gebco']
+
+    val, lat, lon = load_pyramid('gebco', level=0, **qry)
+    ref, rlat, rlon = synthetic_gebco(**qry)
+    keep = (rlat >= qry['south']) & (rlat <= qry['north'])
+    assert np.allclose(lat, rlat[keep]) and np.allclose(lon, rlon)
+    assert np.allclose(val, ref[keep], rtol=1e-6)
+
+    cval, clat, clon = load_pyramid('gebco', level=3, **qry)
+    assert cval.shape == (len(clat), len(clon))
+    assert np.allclose(np.diff(clon), 8 * bathy_pyramid.base_res['gebco'])
+    assert np.allclose(cval, -clon[None, :] * 10, rtol=1e-5)
+
+
+def test_empty_tiles_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(bathy_pyramid, 'storage_cfg', lambda: f'{tmp_path}/')
+    qry = dict(south=44.2, north=44.8, west=-64.5, east=-63.8)
+
+    # no data fetched yet
+    empty = lambda **kwargs: (np.array([]), np.array([]), np.array([]))
+    monkeypatch.setitem(bathy_pyramid.load_map, 'bathy_gebco', empty)
+    val, lat, lon = load_pyramid('gebco', level=2, **qry)
+    assert len(val) == 0
+    assert len(list(tmp_path.glob('bathy_pyramid/gebco/*/*.npy'))) == 0
+
+    # data fetched later reaches the pyramid
+    monkeypatch.setitem(bathy_pyramid.load_map, 'bathy_gebco', synthetic_gebco)
+    val, lat, lon = load_pyramid('gebco', level=2, **qry)
+    assert val.shape == (len(lat), len(lon)) and lon.max() > -64
+    assert len(list(tmp_path.glob('bathy_pyramid/gebco/*/*.npy'))) == 2 * bathy_pyramid.num_levels['gebco']
+
+
+def test_tiles_with_empty_cells_are_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(bathy_pyramid, 'storage_cfg', lambda: f'{tmp_path}/')
+    qry = dict(south=44.2, north=44.8, west=-64.5, east=-64.1)
+    def coastal(south, north, west, east, **kwargs):
+        val, lat, lon = synthetic_gebco(south, north, west, east)
+        val[:, lon > -64.3] = np.nan  # land
+        return val, lat, lon
+    monkeypatch.setitem(bathy_pyramid.load_map, 'bathy_gebco', coastal)
+    val, lat, lon = load_pyramid('gebco', level=0, **qry)
+    assert len(list(tmp_path.glob('bathy_pyramid/gebco/*/*.npy'))) == bathy_pyramid.num_levels['gebco']
+
+    # the stored tile is read without loading the source data again
+    monkeypatch.setitem(bathy_pyramid.load_map, 'bathy_gebco', None)
+    stored = load_pyramid('gebco', level=0, **qry)
+    assert val.ndim == 1 and np.all(lon <= -64.3) and len(val) > 0
+    assert all(np.array_equal(a, b) for a, b in zip((val, lat, lon), stored))
+
+
+def test_chs_pyramid(standin, tmp_path, monkeypatch):
+    from kadlu.geospatial.data_sources.chs import load_chs
+    monkeypatch.setattr(bathy_pyramid, 'storage_cfg', lambda: f'{tmp_path}/')
+    qry = dict(south=43, north=43.999, west=-60, east=-59.001)
+    val, lat, lon = load_pyramid('chs', level=0, **qry)
+    assert len(list(tmp_path.glob('bathy_pyramid/chs/*/*.npy'))) == bathy_pyramid.num_levels['chs']
+
+    # each NONNA-100 pixel has a cell of its own at the base resolution
+    ref, rlat, rlon = load_chs(**qry)
+    assert len(val) == len(ref) > 0
+    cells = lambda lat, lon: set(zip(np.floor(np.round((lat - 43) * 1000, 6)),
+                                     np.floor(np.round((lon + 60) * 1000, 6))))
+    assert cells(lat, lon) == cells(rlat, rlon)
+    assert np.allclose(np.sort(val), np.sort(ref), rtol=1e-6)
+
+    # coarser levels are read from disk
+    monkeypatch.setitem(bathy_pyramid.load_map, 'bathy_chs', None)
+    cval, clat, clon = load_pyramid('chs', level=3, **qry)
+    assert 0 < len(cval) < len(val)
+    steps = np.diff(np.unique(clat)) / (8 / 1000)
+    assert np.allclose(steps, np.round(steps))
+
+
+def test_ocean_bathy_spacing(tmp_path, monkeypatch):
+    from kadlu.geospatial.ocean import Ocean
+    monkeypatch.setattr(bathy_pyramid, 'storage_cfg', lambda: f'{tmp_path}/')
+    monkeypatch.setitem(bathy_pyramid.load_map, 'bathy_gebco', synthetic_gebco)
+    o = Ocean(load_bathymetry='gebco', bathy_spacing=2000, fetch=False,
+              south=44.2, north=44.8, west=-64.5, east=-63.8)
+    assert np.isclose(o.bathy(lat=44.5, lon=-64.2), 642, rtol=1e-2)
+
+    # the pyramid level is part of the key of the sound speed field
+    from kadlu.sound.sound_speed import field_key
+    level = pyramid_level('gebco', 2000)
+    full = Ocean(load_bathymetry='gebco', fetch=False,
+                 south=44.2, north=44.8, west=-64.5, east=-63.8)
+    assert o.sources['bathy'] == f'gebco@{level}' and full.sources['bathy'] == 'gebco'
+    assert field_key(o, 50, 0.001) != field_key(full, 50, 0.001)
@@ -10,10 +10,19 @@
     License:
 
 """
+import os
 import pytest
+import requests
+import threading
+from kadlu import instrument
+from kadlu.geospatial.data_sources import chs
 from kadlu.geospatial.data_sources.chs import Chs
+from kadlu.tests.standin import StandinServer
+from kadlu.tests.standin.arcgis import tifs
 import numpy as np
 
+path_to_assets = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),"assets")
+
 source = Chs()
 
 # gulf st lawrence - northumberland strait
@@ -46,3 +55,74 @@ def test_load_bathy():
     assert np.all(np.logical_and(lon >= -59.8, lon <= -59.2))
     assert np.all(bathy >= -15000)
     assert np.all(bathy <= 10000)
+
+
+@pytest.fixture
+def image_server(tmp_path, monkeypatch):
+    server = StandinServer()
+    monkeypatch.setattr(chs, 'chs_src', server.urls()['chs'])
+    monkeypatch.setattr(chs, 'storage_cfg', lambda: f'{tmp_path}{os.sep}')
+    yield server, tmp_path
+    server.shutdown()
+
+
+def test_fetch_chs_concurrent_resume(image_server):
+    # a partially downloaded file is resumed from where it stopped
+    server, storage = image_server
+    fname = tifs[0]
+    with open(os.path.join(path_to_assets, 'tif', fname), 'rb') as f: head = f.read(1000)
+    with open(storage / f'{fname}.part', 'wb') as f: f.write(head)
+
+    assert chs.fetch_chs(south=43, north=45, west=-60, east=-59)
+    ranges = [r for _, path, r in server.requests if '/file?' in path]
+    assert set(ranges) == {'bytes=1000-', None}
+    assert len(ranges) == 2
+    for fname in tifs:
+        with open(os.path.join(path_to_assets, 'tif', fname), 'rb') as f:
+            assert (storage / fname).read_bytes() == f.read()
+        assert not (storage / f'{fname}.part').exists()
+
+    bathy, lat, lon = chs.load_chs(south=43.5, north=43.6, west=-59.6, east=-59.5)
+    assert len(bathy) > 0
+
+
+def test_fetch_chs_session_per_thread(image_server, monkeypatch):
+    # each download thread uses its own http session
+    used = []
+    download_tile = chs.download_tile
+    def recorded(session, url, fpath):
+        used.append((id(session), threading.get_ident()))
+        return download_tile(session, url, fpath)
+    monkeypatch.setattr(chs, 'download_tile', recorded)
+    monkeypatch.setattr(chs, 'chs_workers', 2)
+
+    assert chs.fetch_chs(south=43, north=45, west=-60, east=-59)
+    assert len(used) == len(tifs)
+    sessions = dict(used)
+    assert all(sessions[s] == t for s, t in used)
+    assert len(set(sessions.values())) == len(sessions)
+
+
+class RangeIgnored(requests.Session):
+    """ session for a server that ignores the Range header """
+    def get(self, url, headers=None, **kwargs):
+        return super().get(url, **kwargs)
+
+
+def test_download_tile_bytes_restarted(image_server):
+    # a resume answered with the whole file counts every byte received
+    server, storage = image_server
+    fname = tifs[0]
+    with open(os.path.join(path_to_assets, 'tif', fname), 'rb') as f: data = f.read()
+    with open(storage / f'{fname}.part', 'wb') as f: f.write(data[:1000])
+
+    sink = instrument.MemorySink()
+    previous = instrument.set_sink(sink)
+    try:
+        url = f"{chs.chs_src}ImageServer/file?id={fname}&rasterId=0"
+        with RangeIgnored() as session: 
+            chs.download_tile(session, url, str(storage / fname))
+    finally:
+        instrument.set_sink(previous)
+    assert (storage / fname).read_bytes() == data
+    assert sink.totals()[('gauge', 'download.bytes')] == len(data)
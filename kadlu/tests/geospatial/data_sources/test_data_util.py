@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+import numpy as np
+
+from kadlu.geospatial.data_sources import data_util
+from kadlu.geospatial.data_sources.data_util import bulk_insert, derive_uv, dt_2_epoch, epoch_2_dt, query_rows
+
+
+def wave_table(conn=None, table='hs'):
+    conn = conn or sqlite3.connect(':memory:')
+    conn.execute(f'CREATE TABLE {table} (val REAL NOT NULL, lat REAL NOT NULL, '
+                 'lon REAL NOT NULL, time INT NOT NULL, source TEXT NOT NULL)')
+    conn.execute(f'CREATE UNIQUE INDEX idx_{table} on {table}(time, lon, lat, val, source)')
+    return conn
+
+def test_bulk_insert_counts_duplicates():
+    conn = wave_table()
+    val, lat, lon = np.random.rand(3, 1000)
+    time = np.arange(1000, dtype=np.int64) // 10
+
+    assert bulk_insert(conn, 'hs', [val, lat, lon, time], 'wwiii', batch=128) == (1000, 0)
+    assert bulk_insert(conn, 'hs', [val[:300], lat[:300], lon[:300], time[:300]], 'wwiii') == (0, 300)
+    assert bulk_insert(conn, 'hs', [val[:300], lat[:300], lon[:300], time[:300]], 'era5') == (300, 0)
+    assert bulk_insert(conn, 'hs', [[], [], [], []], 'wwiii') == (0, 0)
+
+    rows = conn.execute('SELECT val, lat, lon, time, typeof(time), source FROM hs '
+                        'WHERE source = "wwiii" ORDER BY rowid').fetchall()
+    assert len(rows) == 1000
+    assert np.allclose(np.array([r[:4] for r in rows], dtype=float), 
+                       np.column_stack((val, lat, lon, time)))
+    assert set(r[4] for r in rows) == {'integer'}
+    assert conn.execute('SELECT COUNT(*) FROM temp.stage_hs').fetchone()[0] == 0
+    assert not conn.in_transaction
+
+def test_query_rows():
+    conn = wave_table()
+    val, lat, lon = np.random.rand(3, 1000)
+    time = np.arange(1000, dtype=np.int64) // 10
+    bulk_insert(conn, 'hs', [val, lat, lon, time], 'wwiii')
+
+    db = conn.cursor()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    rows = query_rows(db, 'SELECT val, lat, lon, time FROM hs WHERE time >= ? ORDER BY rowid', 
+                      (50, ), batch=64)
+    conn.set_trace_callback(None)
+    assert len(statements) == 1  # the query runs once
+    assert rows.dtype == float and rows.shape == (4, 500)
+    assert np.allclose(rows, np.vstack((val, lat, lon, time))[:, 500:])
+    assert query_rows(db, 'SELECT val, lat FROM hs WHERE time > ?', ('1000', )).shape == (2, 0)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='requires /proc')
+def test_database_cfg_threads(standin_storage):
+    dbpath = str(standin_storage / 'geospatial.db')
+    open_files = lambda: sum(os.path.realpath(f'/proc/self/fd/{fd}') == dbpath
+                             for fd in os.listdir('/proc/self/fd'))
+    conn, db = data_util.database_cfg()
+    assert data_util.database_cfg()[0] is conn
+
+    # each thread has its own connection, closed when the thread exits
+    found = []
+    def worker():
+        found.append(data_util.database_cfg()[0] is data_util.database_cfg()[0] is not conn)
+    for _ in range(20):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    assert found == [True] * 20
+    assert open_files() == 1
+    assert data_util.database_cfg()[0] is conn
+
+
+def test_epoch_conversion():
+    t0 = datetime(2000, 1, 1)
+    times = [datetime(1995, 3, 4, 5, 59, 59), datetime(2000, 1, 1), 
+             datetime(1999, 12, 31, 23, 0, 1), datetime(2015, 6, 1, 12, 30)]
+    expected = [int((t - t0).total_seconds() / 3600) for t in times]
+
+    assert dt_2_epoch(times[0]) == expected[0]
+    assert isinstance(dt_2_epoch(times[0]), int)
+    assert dt_2_epoch(np.datetime64('2000-01-02')) == 24
+    assert list(dt_2_epoch(times)) == expected
+    assert list(dt_2_epoch(np.array(times, dtype='datetime64[s]'))) == expected
+    assert dt_2_epoch(times, t0=datetime(1990, 1, 1))[1] == 87648
+
+    assert epoch_2_dt(24) == datetime(2000, 1, 2)
+    assert epoch_2_dt(np.int64(-3)) == datetime(1999, 12, 31, 21)
+    assert list(epoch_2_dt([1.5, 135132])) == [datetime(2000, 1, 1, 1, 30), datetime(2015, 6, 1, 12)]
+    assert list(epoch_2_dt(dt_2_epoch(times[1:2]))) == times[1:2]
+    with pytest.raises(ValueError): dt_2_epoch('2000-01-01')
+    with pytest.raises(ValueError): epoch_2_dt('24')
+
+def test_derive_uv():
+    conn = wave_table(table='windU')
+    for table in ('windV', 'windUV'): wave_table(conn, table)
+    lat, lon = map(np.ravel, np.meshgrid(np.arange(10.), np.arange(20., 30.)))
+    time = np.zeros(100, dtype=np.int64)
+    bulk_insert(conn, 'windU', [np.full(100, 3.), lat, lon, time], 'wwiii')
+    bulk_insert(conn, 'windV', [np.full(50, -4.), lat[:50], lon[:50], time[:50]], 'wwiii')
+
+    # only pairs within the boundaries are derived
+    qry = dict(south=0, north=4.5, west=20, east=30, start=datetime(2000, 1, 1), end=datetime(2000, 1, 1))
+    assert derive_uv(conn, 'windUV', 'windU', 'windV', qry) == 25
+    assert derive_uv(conn, 'windUV', 'windU', 'windV') == 25
+    assert derive_uv(conn, 'windUV', 'windU', 'windV') == 0
+    rows = np.array(conn.execute('SELECT val, lat, lon FROM windUV').fetchall())
+    assert np.all(rows[:,0] == 5)
+    assert set(map(tuple, rows[:,1:])) == set(zip(lat[:50], lon[:50]))
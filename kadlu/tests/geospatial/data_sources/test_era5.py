@@ -2,9 +2,12 @@ import pytest
 import kadlu
 import numpy as np
 from datetime import datetime, timedelta
+from kadlu.geospatial.data_sources import era5
 from kadlu.geospatial.data_sources.era5 import Era5
+from kadlu.geospatial.data_sources.data_util import database_cfg
 from os.path import isfile
 from kadlu.geospatial.data_sources.fetch_handler import fetch_handler
+from kadlu.tests.standin import FakeClient, write_grib2
 
 # gulf st lawrence
 kwargs = dict(
@@ -84,3 +87,62 @@ def test_era5_load_wind():
                         top=0, bottom=0)
 
 
+
+
+def test_era5_plan_requests():
+    qry = dict(south=40.2, north=41, west=-65, east=-63.7,
+               start=datetime(2018, 1, 30), end=datetime(2018, 2, 2))
+    plan = era5.plan_era5(['10m_v_component_of_wind', '10m_u_component_of_wind'], qry)
+    assert len(plan) == 2
+    (fname1, req1), (fname2, req2) = plan
+    assert req1['area'] == [41, -65, 40, -63.5]
+    assert req1['variable'] == ['10m_u_component_of_wind', '10m_v_component_of_wind']
+    assert req1['month'] == '01' and req1['day'] == ['30', '31']
+    assert req2['month'] == '02' and req2['day'] == ['01']
+    assert fname1 != fname2
+
+
+def test_era5_batched_fetch(standin_storage, monkeypatch):
+    monkeypatch.setattr(era5.cdsapi, 'Client', FakeClient)
+    FakeClient.requests.clear()
+
+    y, x = 44, -62
+    qry = dict(south=y, north=y+2, west=x, east=x+2,
+               start=datetime(2015, 3, 10), end=datetime(2015, 3, 12))
+
+    fetch_handler('wind_uv', 'era5', **qry.copy())
+    fetch_handler('wind_u', 'era5', **qry.copy())
+    fetch_handler('wind_v', 'era5', **qry.copy())
+    assert len(FakeClient.requests) == 1
+    assert all(len(req['variable']) == 2 for req in FakeClient.requests)
+
+    u, lat, lon, epoch = Era5().load_wind_u(**qry)
+    assert len(u) == 5 * 5 * 48
+    assert all(u[lat < y+2] == epoch[lat < y+2] % 24)
+
+    # wind speed is materialized when the components are inserted
+    uv, uvlat, uvlon, uvepoch = Era5().load_wind_uv(**qry)
+    assert len(uv) == len(u)
+    assert np.allclose(uv, np.sqrt(2) * u)
+
+
+def test_era5_insert_mixed_grids(standin_storage):
+    """ batched files may hold variables on different grids """
+    t = datetime(2015, 3, 1, 6)
+    field = lambda lats, lons: np.add.outer(lats * 10, lons)
+    fine = np.arange(46, 43.9, -.25), np.arange(-62, -59.9, .25)
+    coarse = np.arange(46, 43.9, -.5), np.arange(-62, -59.9, .5)
+    fpath = str(standin_storage / 'mixed.grib')
+    write_grib2(fpath, [
+            (field(*fine), *fine, t, *FakeClient.params['10m_u_component_of_wind']),
+            (field(*coarse), *coarse, t, *FakeClient.params['significant_height_of_combined_wind_waves_and_swell'])])
+
+    qry = dict(south=44.5, north=45.5, west=-61.5, east=-60.5, start=t, end=t)
+    era5.insert_era5(fpath, ['10m_u_component_of_wind',
+            'significant_height_of_combined_wind_waves_and_swell'], qry)
+    conn, db = database_cfg()
+    rows = lambda table: np.array(db.execute(f'SELECT val, lat, lon FROM {table}').fetchall()).T
+    u, ulat, ulon = rows('u_component_of_wind')
+    h, hlat, hlon = rows('significant_height_of_combined_wind_waves_and_swell')
+    assert len(u) == 5 * 5 and len(h) == 3 * 3
+    assert np.allclose(u, ulat * 10 + ulon) and np.allclose(h, hlat * 10 + hlon)
@@ -1,5 +1,9 @@
-from datetime import datetime
-from kadlu.geospatial.data_sources.fetch_handler import fetch_handler
+import time
+import threading
+from uuid import uuid4
+from datetime import datetime, timedelta
+from kadlu.geospatial.data_sources.fetch_handler import fetch_handler, bin_request
+from kadlu.geospatial.data_sources.data_util import insert_hash
 
 kwargs = dict(
         start=datetime(2015, 2, 1), end=datetime(2015, 2, 1, 12),
@@ -21,6 +25,84 @@ def test_batch_era5():
 def test_batch_chs():
     fetch_handler('bathy', 'chs', south=45, west=-67, north=46, east=-66)
 
+def test_bin_request_fetches_each_file_once():
+    calls = []
+    hash_key = f'test_bin_request_{uuid4()}'
+    qry = dict(start=datetime(2015, 2, 1), end=datetime(2015, 2, 2, 12),
+               south=44, west=-64, north=48, east=-60)
+    group_day = lambda qry: qry['start'].date()
+    bin_request(lambda **kw: calls.append(kw), hash_key, groupby=group_day, **qry.copy())
+    assert len(calls) == 2
+    assert (calls[0]['south'], calls[0]['north']) == (44, 48)
+    assert (calls[0]['west'], calls[0]['east']) == (-64, -60)
+    assert calls[0]['end'] - calls[0]['start'] == timedelta(days=1)
+
+    # all bins were marked as fetched
+    bin_request(lambda **kw: calls.append(kw), hash_key, groupby=group_day, **qry.copy())
+    assert len(calls) == 2
+
+def test_bin_request_skips_fetched_bins_in_file(standin_storage):
+    calls = []
+    hash_key = 'test_bin_request_contiguous'
+    qry = dict(start=datetime(2015, 2, 1), end=datetime(2015, 2, 4),
+               south=44, west=-66, north=46, east=-60)
+    group_month = lambda qry: (qry['start'].year, qry['start'].month)
+
+    # fetched bins: the second day, and the middle column of the third day
+    for x in range(-66, -60, 2):
+        insert_hash(dict(west=x, east=x+2, south=44, north=46, 
+                start=datetime(2015, 2, 2), end=datetime(2015, 2, 3)), hash_key)
+    insert_hash(dict(west=-64, east=-62, south=44, north=46, 
+            start=datetime(2015, 2, 3), end=datetime(2015, 2, 4)), hash_key)
+
+    bin_request(lambda **kw: calls.append(kw), hash_key, groupby=group_month, **qry.copy())
+    boxes = sorted((c['start'].day, c['end'].day, c['west'], c['east']) for c in calls)
+    assert boxes == [(1, 2, -66, -60), (3, 4, -66, -64), (3, 4, -62, -60)]
+
+    # all bins are fetched
+    bin_request(lambda **kw: calls.append(kw), hash_key, groupby=group_month, **qry.copy())
+    assert len(calls) == 3
+
+def test_bin_request_concurrent_fetches_each_bin_once():
+    calls = []
+    def slow_fetch(**kw):
+        calls.append(kw)
+        time.sleep(0.2)
+    hash_key = f'test_bin_request_{uuid4()}'
+    qry = dict(start=datetime(2015, 2, 1), end=datetime(2015, 2, 1, 12),
+               south=44, west=-64, north=46, east=-62)
+    threads = [threading.Thread(target=bin_request, args=(slow_fetch, hash_key),
+                                kwargs=qry.copy()) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(calls) == 1
+
+def test_bin_request_concurrent_fetch_failure(standin_storage):
+    calls = []
+    def failing_fetch(**kw):
+        calls.append(kw)
+        time.sleep(0.2)
+        raise AssertionError('fetch failed')
+    errors = []
+    def request(fetch):
+        try: bin_request(fetch, 'test_bin_request_failure', **qry.copy())
+        except AssertionError as err: errors.append(err)
+    qry = dict(start=datetime(2015, 2, 1), end=datetime(2015, 2, 1, 12),
+               south=44, west=-64, north=46, east=-62)
+    threads = [threading.Thread(target=request, args=(failing_fetch, )) for _ in range(3)]
+    threads[0].start()
+    time.sleep(0.05)
+    for t in threads[1:]: t.start()
+    for t in threads: t.join()
+
+    # the waiting threads raise the error of the thread fetching the bin
+    assert len(calls) == 1
+    assert len(errors) == 3 and all(str(err) == 'fetch failed' for err in errors)
+
+    # the bin was not marked as fetched
+    request(lambda **kw: calls.append(kw))
+    assert len(calls) == 2 and len(errors) == 3
+
 """ interactive testing
 
 
@@ -32,4 +114,3 @@ def test_batch_chs():
         )
 
 """
-
@@ -0,0 +1,109 @@
+import io
+import os
+import zipfile
+import hashlib
+import threading
+import http.server
+
+import pytest
+
+from kadlu.geospatial.data_sources import gebco
+from kadlu.geospatial.data_sources.gebco import fetch_gebco, ZipMemberExtractor
+
+
+path_to_assets = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),"assets")
+
+
+class Unseekable(io.RawIOBase):
+    """ write-only stream, forces zipfile to use data descriptors """
+    def __init__(self): self.data = b''
+    def writable(self): return True
+    def write(self, b): 
+        self.data += bytes(b)
+        return len(b)
+
+
+def make_archive(streamed=False, zip64=False):
+    with open(os.path.join(path_to_assets, 'bornholm.nc'), 'rb') as f: nc = f.read()
+    out = Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('documentation.txt', os.urandom(5000))
+        with z.open('GEBCO_2020.nc', 'w', force_zip64=zip64) as f: f.write(nc)
+        z.writestr('terms_of_use.txt', b'terms' * 100)
+    return (out.data if streamed else out.getvalue()), nc
+
+
+class ArchiveServer(http.server.BaseHTTPRequestHandler):
+    """ serves an archive with range requests, unless 'ranged' is False.
+        drops the connection after 'fail_at' bytes, once
+    """
+    archive, fail_at, ranges, ranged = b'', None, [], True
+
+    def log_message(self, *args): pass
+
+    def do_GET(self):
+        start = int(self.headers['Range'][6:-1]) if self.headers.get('Range') else 0
+        self.ranges.append(start)
+        if not self.ranged: start = 0
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Length', str(len(self.archive) - start))
+        self.end_headers()
+        if self.fail_at is not None:
+            self.wfile.write(self.archive[start:self.fail_at])
+            ArchiveServer.fail_at = None
+            self.close_connection = True
+            return
+        self.wfile.write(self.archive[start:])
+
+
+@pytest.fixture
+def archive_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ArchiveServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ArchiveServer.ranges, ArchiveServer.ranged = [], True
+    yield f'http://127.0.0.1:{server.server_port}/gebco.zip'
+    server.shutdown()
+
+
+@pytest.mark.parametrize('streamed,zip64', [(False, False), (True, False), (True, True)])
+def test_zip_member_extractor(tmp_path, streamed, zip64):
+    archive, nc = make_archive(streamed, zip64)
+    extractor = ZipMemberExtractor('.nc', str(tmp_path / 'out.nc'))
+    for i in range(0, len(archive), 777): extractor.feed(archive[i:i+777])
+    assert extractor.done and extractor.name == 'GEBCO_2020.nc'
+    assert (tmp_path / 'out.nc').read_bytes() == nc
+
+
+@pytest.mark.parametrize('ranged', [True, False])
+def test_fetch_gebco_resume(tmp_path, archive_server, ranged):
+    archive, nc = make_archive()
+    ArchiveServer.archive, ArchiveServer.fail_at = archive, len(archive) // 2
+    ArchiveServer.ranged = ranged
+    fpath = str(tmp_path / 'gebco_bathy.nc')
+    sha256 = hashlib.sha256(archive).hexdigest()
+
+    # the interrupted download is resumed where the connection dropped, 
+    # or restarted if the server doesn't support range requests
+    assert fetch_gebco(archive_server, fpath, sha256, chunk_size=1024) == 'GEBCO_2020.nc'
+    assert len(ArchiveServer.ranges) == 2 and ArchiveServer.ranges[0] == 0
+    assert 0 < ArchiveServer.ranges[1] <= len(archive) // 2
+    with open(fpath, 'rb') as f: assert f.read() == nc
+
+    # the archive is not stored
+    assert os.listdir(tmp_path) == ['gebco_bathy.nc']
+
+
+def test_fetch_gebco_retries(tmp_path, archive_server):
+    ArchiveServer.archive, _ = make_archive()
+    ArchiveServer.fail_at = len(ArchiveServer.archive) // 2
+    fpath = str(tmp_path / 'gebco_bathy.nc')
+    with pytest.raises(AssertionError, match='error fetching'):
+        fetch_gebco(archive_server, fpath, chunk_size=1024, retries=0)
+    assert os.listdir(tmp_path) == []
+
+
+def test_fetch_gebco_checksum(tmp_path, archive_server):
+    ArchiveServer.archive, _ = make_archive()
+    with pytest.raises(AssertionError, match='checksum'):
+        fetch_gebco(archive_server, str(tmp_path / 'gebco_bathy.nc'), sha256='0'*64)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.grib_index import index_grib, iter_fields, field_cache
+from kadlu.tests.standin import write_grib2
+
+
+lats = np.arange(-10, 10.5, 0.5)
+lons = np.arange(0, 360, 0.5)
+times = [datetime(2014, 2, 1) + timedelta(hours=3*h) for h in range(16)]
+
+
+def waveheight(t):
+    z = np.add.outer(lats, lons) + t.hour
+    z[:4, :4] = np.nan  # land
+    return z
+
+
+def make_file(tmp_path):
+    fpath = str(tmp_path / 'multi_1.glo_30m.hs.201402.grb2')
+    write_grib2(fpath, [(waveheight(t), lats, lons, t, 10, 0, 3) for t in times])
+    return fpath
+
+
+def test_grib_index(tmp_path):
+    fpath = make_file(tmp_path)
+    index, lat, lon = index_grib(fpath)
+    assert len(index) == len(times)
+    assert all(index['name'] == 'Significant height of combined wind waves and swell')
+    assert np.array_equal(np.diff(index['time']), np.full(len(times) - 1, 3))
+    assert lon.min() >= -180 and lon.max() < 180
+    assert os.path.isfile(f'{fpath}.idx.npy')
+    index2, _, _ = index_grib(fpath)
+    assert np.array_equal(index, index2)
+
+
+def test_iter_fields_cache(tmp_path):
+    fpath = make_file(tmp_path)
+    kwargs = dict(south=-2, north=2, west=-3, east=3, start=times[8], end=times[9])
+    fields = list(iter_fields(fpath, **kwargs))
+    assert len(fields) == 2
+    name, epoch, z, y, x = fields[0]
+    assert z.shape == (len(y), len(x))
+    assert y.min() >= -2 and y.max() <= 2 and x.min() >= -3 and x.max() <= 3
+
+    cached = list(iter_fields(fpath, **kwargs, cache=True))
+    decoded = np.load(f'{fpath}.decoded.npy')
+    assert decoded.sum() == 2
+    recached = list(iter_fields(fpath, **kwargs, cache=True))
+    for a, b, c in zip(fields, cached, recached):
+        assert np.allclose(a[2], b[2], atol=1e-3)
+        assert np.array_equal(b[2], c[2])
+
+    # masked points are preserved by the cache
+    kwargs.update(south=-10, north=-9, west=0, east=1)
+    z = next(iter_fields(fpath, **kwargs, cache=True))[2]
+    assert z.mask.all()
+
+
+def decode(fpath, start, end):
+    return [f[2].filled(np.nan) for f in iter_fields(fpath, south=-10, north=10,
+            west=0, east=360, start=start, end=end, cache=True)]
+
+
+def test_field_cache_shared_by_processes(tmp_path):
+    fpath = make_file(tmp_path)
+    index, lat, lon = index_grib(fpath)
+
+    # an open cache is not truncated when the cache is opened again
+    fields, decoded = field_cache(fpath, index, lat, lon)
+    fields[0] = 1
+    decoded[0] = True
+    fields.flush(), decoded.flush()
+    fields, decoded = field_cache(fpath, index, lat, lon)
+    assert decoded[0] and np.all(fields[0] == 1)
+
+    # processes decoding the same file concurrently agree with each other
+    for f in ('fields', 'decoded'): os.remove(f'{fpath}.{f}.npy')
+    with ProcessPoolExecutor(4) as pool:
+        runs = list(pool.map(decode, [fpath] * 4, [times[0]] * 4, [times[-1]] * 4))
+    for run in runs[1:]:
+        assert len(run) == len(runs[0])
+        for a, b in zip(runs[0], run):
+            np.testing.assert_array_equal(a, b)
+    fields, decoded = field_cache(fpath, index, lat, lon)
+    assert decoded.all()
+    assert not any(f.endswith('.part') for f in os.listdir(tmp_path))
@@ -6,6 +6,8 @@ from kadlu.geospatial.data_sources import hycom
 #from kadlu.geospatial.data_sources.hycom import Hycom
 import os
 from os.path import isfile
+from kadlu.tests.standin import dap as standin_dap
+from kadlu.tests.standin.dap import dap_ascii
 
 
 # gulf st lawrence - small test area
@@ -30,6 +32,12 @@ bounds = dict(
     )
 
 
+class FakeResponse():
+    def __init__(self, text): self.text, self.content, self.status_code = text, text.encode(), 200
+    def __enter__(self): return self
+    def __exit__(self, *args): pass
+
+
 def test_load_grid_xy():
     xgrid, ygrid = hycom.load_grid()
     assert len(xgrid) > 1
@@ -44,6 +52,38 @@ def test_load_depths():
     depth = hycom.load_depth()
     assert [d in depth for d in (0, 5000)]
 
+def test_fetch_grid_metadata(tmp_path, monkeypatch):
+    """ metadata is fetched concurrently and stored per year without pickling """
+    urls = []
+    def get(url, **kwargs):
+        urls.append(url)
+        year = url.split('/')[-1].split('.')[0]
+        if url.endswith('?time'):
+            n = int(year) - 1990
+            body = f'time[{n}]\n[0], ' + ', '.join(map(str, np.arange(n) * 3.)) + '\n\n'
+        else:
+            body = 'lat[3]\n-80.0, 0.0, 80.0\n\nlon[4]\n-180.0, -90.0, 0.0, 90.0\n\n'
+        return FakeResponse('Dataset {\n}\n---------------------------------------------\n' + body)
+    monkeypatch.setattr(hycom.requests, 'get', get)
+    monkeypatch.setattr(hycom, 'storage_cfg', lambda: f'{tmp_path}/')
+
+    hycom.fetch_grid()
+    assert len(urls) == len(hycom.hycom_years) + 1
+    lat, lon = hycom.load_grid()
+    assert np.array_equal(lat, [-80, 0, 80]) and len(lon) == 4
+    epoch = hycom.load_times()
+    assert sorted(epoch.keys()) == list(hycom.hycom_years)
+    assert len(epoch['1994']) == 4 and len(epoch['2015']) == 25
+    for year in hycom.hycom_years:
+        np.load(f'{tmp_path}/hycom_epoch_{year}.npy', allow_pickle=False)
+
+    # a single missing year is refreshed on its own
+    os.remove(f'{tmp_path}/hycom_epoch_2000.npy')
+    urls.clear()
+    epoch = hycom.load_times()
+    assert urls == [f'{hycom.hycom_src}/2000.ascii?time']
+    assert np.array_equal(epoch['2000'], np.arange(10) * 3.)
+
 def test_load_salinity():
     val, lat, lon, time, depth = hycom.Hycom().load_salinity(south=south, north=north, west=west, east=east, start=start, end=end, top=top, bottom=bottom)
     assert(len(val) == len(lat) == len(lon) == len(time))
@@ -199,3 +239,61 @@ def test_load_water_v():
         }
     self = hycom.Hycom()
 """
+
+@pytest.mark.filterwarnings('error:.*deprecated alias:DeprecationWarning')  # removed in numpy 1.24
+def test_fetch_hycom_multivariable(monkeypatch):
+    """ u and v currents are fetched in one request and split into their tables """
+    urls = []
+    slices = [(0, 1), (0, 1), (0, 2), (0, 3)]
+    shape = (2, 2, 3, 4)
+    cubes = dict(
+            water_u=np.arange(np.prod(shape)).reshape(shape) * 10,
+            water_v=np.arange(np.prod(shape)).reshape(shape) * -10,
+        )
+    cubes['water_v'][1, 1, 2, 3] = -30000  # null value
+    def get(url, **kwargs): 
+        urls.append(url)
+        return FakeResponse(dap_ascii(cubes))
+    monkeypatch.setattr(hycom.requests, 'get', get)
+
+    # stand-in grid near the south pole to avoid collisions with other tests
+    source = hycom.Hycom()
+    source.ygrid = np.array([-89.96, -89.88, -89.80])
+    source.xgrid = np.array([100.00, 100.08, 100.16, 100.24])
+    source.depth = np.array([0., 2.])
+    source.epoch = {'2000': np.array([262992., 262995.])}
+    source.grids = [source.ygrid, source.xgrid, source.epoch, source.depth]
+    qry = dict(south=-90, north=-89.8, west=100, east=100.3, top=0, bottom=2,
+               start=datetime(2000, 1, 1), end=datetime(2000, 1, 1, 3))
+    hycom.fetch_hycom(source, ['water_u', 'water_v'], '2000', slices, qry)
+
+    assert len(urls) == 1
+    assert urls[0].endswith('water_u[0:1:1][0:1:1][0:1:2][0:1:3],water_v[0:1:1][0:1:1][0:1:2][0:1:3]')
+
+    sql = ('SELECT val FROM hycom_{} WHERE lat < -89.79 AND lon >= 100 AND lon <= 100.25 '
+           'AND time >= 262992 AND time <= 262995 ORDER BY time, depth, lat, lon')
+    conn, db = hycom.database_cfg()
+    u = np.array(db.execute(sql.format('water_u')).fetchall())[:,0]
+    v = np.array(db.execute(sql.format('water_v')).fetchall())[:,0]
+    assert np.allclose(u, cubes['water_u'].ravel() * 0.001)
+    assert np.allclose(v, cubes['water_v'].ravel()[:-1] * 0.001)
+
+    # current speed is materialized where both components are present
+    uv = np.array(db.execute(sql.format('water_uv')).fetchall())[:,0]
+    assert np.allclose(uv, np.sqrt(2) * np.abs(u[:-1]))
+
+def test_fetch_load_standin(standin):
+    """ grid metadata and data are fetched from the stand-in server """
+    val, lat, lon, epoch, depth = kadlu.load(source='hycom', var='temp', **bounds)
+    assert len(val) > 0
+    assert np.all((lat >= south) & (lat <= north) & (lon >= west) & (lon <= east))
+    assert set(np.unique(depth)) == set(standin_dap.depth)
+    assert np.all((val > -10) & (val < 20))
+    requests = [path for service, path, _ in standin.requests]
+    assert sum('.ascii?time' in path for path in requests) == len(hycom.hycom_years)
+    assert sum('water_temp%5B' in path for path in requests) == 1
+
+    # previously fetched data is not requested again
+    standin.requests.clear()
+    kadlu.load(source='hycom', var='temp', **bounds)
+    assert len(standin.requests) == 0
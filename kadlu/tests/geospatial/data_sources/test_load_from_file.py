@@ -0,0 +1,83 @@
+import os
+
+import netCDF4
+import numpy as np
+from PIL import Image
+
+from kadlu.geospatial.data_sources.load_from_file import     \
+        axis_slice,                                         \
+        load_netcdf,                                        \
+        load_raster,                                        \
+        read_raster
+
+
+path_to_assets = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),"assets")
+
+
+def test_axis_slice():
+    arr = np.arange(10) * 0.5
+    assert axis_slice(arr, 1, 2) == slice(2, 5, 1)
+    assert list(arr[axis_slice(arr, 0.9, 2.1, 2)]) == [1, 2]
+    desc = arr[::-1]
+    assert list(desc[axis_slice(desc, 1, 2)]) == [2, 1.5, 1]
+
+
+def test_load_netcdf_window():
+    fname = os.path.join(path_to_assets, 'bornholm.nc')
+    val, lat, lon = load_netcdf(fname)
+    assert val.shape == (len(lat), len(lon)) == (48, 84)
+
+    qry = dict(south=55, north=55.2, west=14.6, east=15)
+    wval, wlat, wlon = load_netcdf(fname, **qry)
+    assert wlat.min() >= 55 and wlat.max() <= 55.2
+    assert wlon.min() >= 14.6 and wlon.max() <= 15
+    rows, cols = np.isin(lat, wlat), np.isin(lon, wlon)
+    assert np.array_equal(wval, val[rows][:, cols])
+
+    sval, slat, slon = load_netcdf(fname, stride=2, **qry)
+    assert np.array_equal(sval, wval[::2, ::2])
+    assert np.array_equal(slat, wlat[::2])
+
+
+def test_load_netcdf_elevation(tmp_path):
+    """ gebco files store elevation in a descending order lat axis """
+    fname = str(tmp_path / 'elevation.nc')
+    with netCDF4.Dataset(fname, 'w') as nc:
+        nc.createDimension('lat', 20)
+        nc.createDimension('lon', 30)
+        nc.createVariable('lat', 'f8', ('lat',))[:] = np.linspace(49.5, 40, 20)
+        nc.createVariable('lon', 'f8', ('lon',))[:] = np.linspace(-70, -55.5, 30)
+        nc.createVariable('elevation', 'f4', ('lat', 'lon'))[:] = \
+                -np.add.outer(np.arange(20), np.arange(30) * 100)
+
+    val, lat, lon = load_netcdf(fname, south=44, north=46, west=-62, east=-60)
+    assert list(lat) == [46, 45.5, 45, 44.5, 44]
+    assert list(lon) == [-62, -61.5, -61, -60.5, -60]
+    assert val[0, 0] == 7 + 16 * 100
+
+
+def test_read_raster_window():
+    im = Image.open(os.path.join(path_to_assets, 'tif', 'CA2_4300N06000W.tif'))
+    val = read_raster(im, slice(100, 130), slice(200, 240))
+    assert val.shape == (30, 40)
+    nodata = float(im.tag[42113][0])
+    for yi in range(30):
+        for xi in range(40):
+            pixel = im.getpixel((200 + xi, 100 + yi))
+            assert val.data[yi, xi] == pixel
+            assert val.mask[yi, xi] == (pixel == nodata)
+
+
+def test_load_raster():
+    fname = os.path.join(path_to_assets, 'tif', 'CA2_4400N06000W.tif')
+    val, lat, lon = load_raster(fname)
+    im = Image.open(fname)
+    assert val.shape == (len(lon), len(lat)) == im.size
+    assert np.array_equal(val.data, np.asarray(im, dtype=float).T)
+    assert val.mask.any() and not val.mask.all()
+
+    # windowed reads match the same region of the full raster
+    wval, wlat, wlon = load_raster(fname, south=44.2, north=44.3, west=-59.9, east=-59.5)
+    assert wlat.min() >= 44.2 and wlat.max() <= 44.3
+    assert wlon.min() >= -59.9 and wlon.max() <= -59.5
+    assert np.array_equal(wval, val[np.isin(lon, wlon)][:, np.isin(lat, wlat)])
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import kadlu
+from kadlu.geospatial.data_sources import data_util
+from kadlu.geospatial.data_sources.data_util import dt_2_epoch, bulk_insert
+from kadlu.geospatial.data_sources.points import load_points, node_series
+
+
+start, end = datetime(2015, 1, 1), datetime(2015, 1, 2)
+
+
+def linear(lat, lon, epoch):
+    return 2 * lat + lon + 0.1 * epoch
+
+
+@pytest.fixture
+def waves(standin_storage):
+    """ a 0.5 degree grid of a linear field in the wwiii wave height table """
+    conn, db = data_util.database_cfg()
+    epoch = np.arange(dt_2_epoch(start), dt_2_epoch(end) + 1, 3)
+    t, lat, lon = [a.ravel() for a in np.meshgrid(epoch, np.arange(44, 46.1, 0.5),
+            np.arange(-62, -59.9, 0.5), indexing='ij')]
+    bulk_insert(conn, 'hs', [linear(lat, lon, t), lat, lon, t.astype(int)], 'wwiii')
+    return conn, db, epoch
+
+
+def test_load_points_nearest(waves):
+    conn, db, epoch = waves
+    val, ep = load_points('wwiii', 'waveheight', lat=[44.6, 45.9], lon=[-61.2, -60.1],
+            start=start, end=end, fetch=False)
+    assert val.shape == (2, len(epoch))
+    np.testing.assert_array_equal(ep, epoch)
+    np.testing.assert_allclose(val[0], linear(44.5, -61, epoch))
+    np.testing.assert_allclose(val[1], linear(46, -60, epoch))
+
+
+def test_load_points_bilinear(waves):
+    conn, db, epoch = waves
+    lat, lon = np.array([44.6, 45.3, 45.5]), np.array([-61.2, -60.4, -61])
+    val, ep = load_points('wwiii', 'waveheight', lat=lat, lon=lon,
+            start=start, end=end, method='bilinear', fetch=False)
+    np.testing.assert_allclose(val, linear(lat[:, None], lon[:, None], epoch[None]))
+
+    # a masked corner is left out of the interpolation
+    db.execute('DELETE FROM hs WHERE lat == 45.5 AND lon == -60.5')
+    conn.commit()
+    val, _ = load_points('wwiii', 'waveheight', lat=lat, lon=lon,
+            start=start, end=end, method='bilinear', fetch=False)
+    assert np.all(np.isfinite(val))
+    np.testing.assert_allclose(val[[0, 2]], linear(lat[[0, 2], None], lon[[0, 2], None], epoch[None]))
+
+
+def test_load_points_uses_location_index(waves):
+    conn, db, epoch = waves
+    load_points('wwiii', 'waveheight', lat=[45], lon=[-61], start=start, end=end, fetch=False)
+    plan = ' '.join(str(row) for row in db.execute('EXPLAIN QUERY PLAN SELECT time, val FROM hs '
+            'WHERE lat == 45 AND lon == -61 AND time >= 0 AND time <= 1e9 ORDER BY time'))
+    assert 'idx_hs_loc' in plan
+
+
+def test_load_points_depth(standin_storage):
+    conn, db = data_util.database_cfg()
+    t, depth, lat, lon = [a.ravel() for a in np.meshgrid(
+            np.arange(dt_2_epoch(start), dt_2_epoch(end) + 1, 3), [0, 10, 50],
+            [44, 44.08], [-60, -59.92], indexing='ij')]
+    bulk_insert(conn, 'hycom_water_temp', [10 - depth / 10, lat, lon, t.astype(int), depth], 'hycom')
+    val, ep = load_points('hycom', 'temp', lat=[44.01, 44.01], lon=[-60, -60], depth=40,
+            start=start, end=end, fetch=False)
+    assert val.shape == (2, 9)
+    assert np.all(val == 5)
+    assert len(node_series(db, 'hycom_water_temp', 44, -60, 0, 1e9, depth=1000)[0]) == 9
+
+
+def test_load_points_synthetic():
+    lat, lon = [44.52, 45.1], [-59.47, -60.3]
+    val, ep = load_points('synthetic', 'waveheight', lat=lat, lon=lon, start=start, end=end)
+    full = kadlu.load('synthetic', 'waveheight', south=44, north=46, west=-61, east=-59,
+            start=start, end=end)
+    assert val.shape == (2, 9)
+    for s in range(2):
+        d = (full[1] - lat[s])**2 + (full[2] - lon[s])**2
+        node = (full[1] == full[1][np.argmin(d)]) & (full[2] == full[2][np.argmin(d)])
+        np.testing.assert_allclose(val[s], full[0][node])
+        np.testing.assert_array_equal(ep, full[3][node])
+
+
+def test_load_points_wwiii(standin):
+    qry = dict(start=datetime(2014, 2, 3), end=datetime(2014, 2, 3, 12))
+    val, ep = kadlu.load_points('wwiii', 'waveheight', lat=[47.1], lon=[-63.4], **qry)
+    full = kadlu.load('wwiii', 'waveheight', south=46, north=48, west=-65, east=-62, **qry)
+    d = (full[1] - 47.1)**2 + ((full[2] + 63.4) * np.cos(np.radians(47.1)))**2
+    node = (full[1] == full[1][np.argmin(d)]) & (full[2] == full[2][np.argmin(d)])
+    assert val.shape == (1, len(ep))
+    np.testing.assert_allclose(val[0], full[0][node])
+    np.testing.assert_array_equal(ep, full[3][node])
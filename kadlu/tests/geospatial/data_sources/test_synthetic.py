@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import kadlu
+from kadlu.geospatial.data_sources import data_util
+from kadlu.geospatial.data_sources.synthetic import Synthetic
+from kadlu.geospatial.ocean import Ocean
+from kadlu.sound.sound_speed import SoundSpeed
+
+
+bounds = dict(south=44, north=45, west=-60, east=-59, top=0, bottom=500,
+              start=datetime(2015, 1, 1), end=datetime(2015, 1, 1, 12))
+
+
+@pytest.fixture
+def no_database(monkeypatch):
+    """ fail on any attempt to open the database or fetch data """
+    def fail(*args, **kwargs): raise AssertionError('synthetic source accessed the database')
+    monkeypatch.setattr(data_util, 'database_cfg', fail)
+    monkeypatch.setattr('kadlu.geospatial.ocean.fetch_handler', fail)
+
+
+def test_synthetic_shapes():
+    s = Synthetic(resolution=0.25)
+    bathy = s.load_bathymetry(**bounds)
+    assert bathy.shape == (3, 25)
+    assert np.all(bathy[0] > 0)
+    temp = s.load_temp(**bounds)
+    assert temp.shape[0] == 5
+    assert set(temp[4]) == set(s.depths[s.depths <= 500])
+    assert len(np.unique(temp[3])) == 5  # 3-hourly
+    for fcn in (s.load_wind_uv, s.load_waveheight, s.load_waveperiod, s.load_wavedirection):
+        val, lat, lon, epoch = fcn(**bounds)
+        assert len(val) == 25 * 5
+    assert np.all((s.load_wavedirection(**bounds)[0] >= 0) & (s.load_wavedirection(**bounds)[0] < 360))
+
+
+def test_synthetic_resolution():
+    coarse = Synthetic(resolution=0.1).load_bathymetry(**bounds)
+    fine = Synthetic(resolution=0.01).load_bathymetry(**bounds)
+    assert coarse.shape[1] == 11 ** 2
+    assert fine.shape[1] == 101 ** 2
+    assert Synthetic().load_bathymetry(resolution=0.5, **bounds).shape[1] == 9
+
+
+def test_synthetic_seeded_and_consistent():
+    a = Synthetic(resolution=0.1, seed=1).load_temp(**bounds)
+    b = Synthetic(resolution=0.1, seed=1).load_temp(**bounds)
+    c = Synthetic(resolution=0.1, seed=2).load_temp(**bounds)
+    np.testing.assert_array_equal(a, b)
+    assert not np.allclose(a[0], c[0])
+
+    # values at shared grid points do not depend on the query region
+    sub = Synthetic(resolution=0.1, seed=1).load_temp(**dict(bounds, north=44.5, east=-59.5))
+    rows = {tuple(r[1:]): r[0] for r in np.round(a.T, 6)}
+    assert all(rows[tuple(r[1:])] == r[0] for r in np.round(sub.T, 6))
+
+
+def test_synthetic_small_region():
+    """ a region smaller than the grid spacing returns the bracketing points """
+    val, lat, lon = Synthetic(resolution=1).load_bathymetry(
+            south=44.2, north=44.3, west=-59.8, east=-59.7)
+    assert set(lat) == {44, 45} and set(lon) == {-60, -59}
+
+
+def test_load_synthetic(no_database):
+    assert kadlu.load('synthetic', 'bathymetry', **bounds).shape[0] == 3
+    assert kadlu.load('synthetic', 'salinity', **bounds).shape[0] == 5
+
+
+def test_ocean_synthetic(no_database):
+    variables = ('bathymetry', 'temp', 'salinity', 'wavedir', 'waveheight', 'waveperiod',
+                 'wind_uv', 'wind_u', 'wind_v', 'water_uv', 'water_u', 'water_v')
+    ocean = Ocean(**{f'load_{v}': 'synthetic' for v in variables}, **bounds)
+    assert ocean.bathy(lat=44.5, lon=-59.5) > 0
+    assert np.all(ocean.wind_uv(lat=[44.5, 44.6], lon=[-59.5, -59.5]) >= 0)
+    ss = SoundSpeed(ocean, num_depths=10, rel_err=None)
+    assert np.all(ss.interp(lat=44.5, lon=-59.5, z=[0, 100, 400], grid=True) > 1400)
@@ -1,6 +1,7 @@
 import pytest
 import kadlu
 import logging
+import numpy as np
 from datetime import datetime, timedelta
 from kadlu.geospatial.data_sources import wwiii
 from kadlu.geospatial.data_sources.wwiii import Wwiii, Boundary, wwiii_regions, wwiii_global
@@ -77,3 +78,20 @@ def test_load_wind_uv():
     print(result)
 
 
+
+
+def test_fetch_load_standin(standin):
+    """ grib files are downloaded from the stand-in server and indexed """
+    qry = dict(south=south, west=west, north=north, east=east, start=start, end=end)
+    hs, lat, lon, epoch = kadlu.load(source='wwiii', var='waveheight', **qry)
+    assert len(hs) > 0 and np.all(hs >= 1)
+    assert np.all((lat >= south) & (lat <= north) & (lon >= west) & (lon <= east))
+    assert set(epoch) == {kadlu.dt_2_epoch(start), kadlu.dt_2_epoch(end)}
+
+    u, *_ = kadlu.load(source='wwiii', var='wind_u', **qry)
+    v, *_ = kadlu.load(source='wwiii', var='wind_v', **qry)
+    uv, *_ = kadlu.load(source='wwiii', var='wind_uv', **qry)
+    assert np.allclose(uv, np.sqrt(u**2 + v**2), atol=1e-3)
+    paths = [path for service, path, _ in standin.requests]
+    assert sorted(p.rsplit('/', 1)[-1] for p in paths) == \
+            ['multi_1.glo_30m.hs.201402.grb2', 'multi_1.glo_30m.wind.201402.grb2']
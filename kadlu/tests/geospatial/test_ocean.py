@@ -1,6 +1,6 @@
 import os
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytest
 import numpy as np
@@ -190,6 +190,77 @@ def test_wind_water_uv():
                 **bounds)
     
 
+def test_time_resolved_ocean():
+    """ time-varying layers are interpolated one time slice at a time on 
+        demand, and linearly in time between slices """
+    qry = dict(south=44, north=45, west=-60, east=-59, top=0, bottom=500,
+               start=datetime(2015, 1, 1), end=datetime(2015, 1, 2))
+    load = dict(load_bathymetry='synthetic', load_temp='synthetic', 
+                load_waveheight='synthetic', load_salinity=35)
+    o = Ocean(timestep=timedelta(hours=3), cache_size=2, **load, **qry)
+    assert len(o.times) == 9 and o.time == qry['start']
+    assert o.interps['temp'].slice.cache_info().currsize == 0
+
+    # slices agree with static oceans at the slice times
+    for t in o.times[::4]:
+        static = Ocean(**load, **dict(qry, start=t, end=t))
+        assert o.temp(44.5, -59.5, 10, time=t) == pytest.approx(static.temp(44.5, -59.5, 10))
+        assert o.waveheight(44.5, -59.5, time=t) == pytest.approx(static.waveheight(44.5, -59.5))
+        assert o.bathy(44.5, -59.5) == static.bathy(44.5, -59.5)
+        assert o.salinity(44.5, -59.5, 10, time=t) == 35
+
+    # values between slices are interpolated, defaulting to Ocean.time
+    a, b = (o.waveheight(44.5, -59.5, time=t) for t in o.times[1:3])
+    o.time = o.times[1] + timedelta(hours=1)
+    assert o.waveheight(44.5, -59.5) == pytest.approx(a + (b - a) / 3)
+    assert o.waveheight_xy(0, 0) == pytest.approx(o.waveheight(*o.origin))
+
+    # the least recently used slices are discarded
+    info = o.interps['waveheight'].slice.cache_info()
+    assert info.currsize == 2 and info.misses == 5
+
+
+def test_time_resolved_hourly_slices():
+    """ each slice of an hourly time-resolved ocean holds a single hour of 
+        hourly data, as stored e.g. by ERA5 """
+    from kadlu.geospatial.data_sources.data_util import dt_2_epoch
+    slices = []
+    def hourly(start, end, **kwargs):
+        # rows are selected by epoch hour, as in the database
+        epoch, lat, lon = [a.ravel() for a in np.meshgrid(
+                np.arange(dt_2_epoch(start), dt_2_epoch(end) + 1),
+                [44, 44.5, 45], [-60, -59.5, -59], indexing='ij')]
+        slices.append(np.unique(epoch))
+        return epoch.astype(float), lat, lon, epoch
+    for minute in (0, 30):
+        qry = dict(south=44, north=45, west=-60, east=-59, top=0, bottom=0,
+                   start=datetime(2015, 1, 1, 0, minute), end=datetime(2015, 1, 1, 6))
+        o = Ocean(load_waveheight=hourly, timestep=timedelta(hours=1), **qry)
+        slices.clear()
+        for t in o.times:
+            assert o.waveheight(44.5, -59.5, time=t) == pytest.approx(dt_2_epoch(t))
+        assert [len(epoch) for epoch in slices] == [1] * len(o.times)
+        assert len(np.unique(np.concatenate(slices))) == len(o.times)
+
+
+def test_time_resolved_sound_speed():
+    """ the sound speed of a time-resolved ocean is computed at Ocean.time """
+    from kadlu.sound.sound_speed import SoundSpeed
+    qry = dict(south=44, north=45, west=-60, east=-59, top=0, bottom=500,
+               start=datetime(2015, 1, 1), end=datetime(2015, 1, 1, 12))
+    o = Ocean(load_bathymetry='synthetic', load_temp='synthetic', load_salinity='synthetic', 
+              timestep=timedelta(hours=3), **qry)
+    c = []
+    for t in o.times[::2]:
+        o.time = t
+        ss = SoundSpeed(o, num_depths=10, rel_err=None)
+        c.append(ss.interp(44.5, -59.5, 10))
+        static = Ocean(load_bathymetry='synthetic', load_temp='synthetic', 
+                load_salinity='synthetic', **dict(qry, start=t, end=t))
+        assert c[-1] == pytest.approx(SoundSpeed(static, num_depths=10, rel_err=None).interp(44.5, -59.5, 10))
+    assert len(set(c)) == 3
+
+
 """ interactive testing
 
 from datetime import datetime
@@ -2,9 +2,11 @@
 """
 import pytest
 import os
+from collections import OrderedDict
 import numpy as np
+from kadlu.sound import sound_speed
 from kadlu.sound.sound_speed import SoundSpeed
-from kadlu.geospatial.ocean import Ocean
+from kadlu.geospatial.ocean import Ocean, source_key
 
 path_to_assets = os.path.join(os.path.dirname(os.path.dirname(__file__)),"assets")
 
@@ -34,4 +36,50 @@ def test_sound_speed_from_ssp():
     ss = SoundSpeed(ssp=(c0,z0), num_depths=50, rel_err=None)
     # evaluate
     c = ss.interp_xy(x=0, y=0, z=z0, grid=True)
-    assert np.all(np.abs(c-c0) < 1E-6)
\ No newline at end of file
+    assert np.all(np.abs(c-c0) < 1E-6)
+
+@pytest.fixture
+def field_storage(tmp_path, monkeypatch):
+    """ store sound speed fields in an empty directory """
+    monkeypatch.setattr(sound_speed, 'storage_cfg', lambda: f'{tmp_path}{os.sep}')
+    monkeypatch.setattr(sound_speed, '_field_cache', OrderedDict())
+    return tmp_path
+
+def test_sound_speed_field_is_cached(field_storage):
+    o1 = Ocean(load_bathymetry=1000, load_temp=4, load_salinity=3)
+    o2 = Ocean(load_bathymetry=1000, load_temp=4, load_salinity=3)
+    ss1 = SoundSpeed(o1, num_depths=50, rel_err=None, cache=True)
+    key = sound_speed.field_key(o1, num_depths=50, rel_err=None)
+    assert key in sound_speed._field_cache
+    assert len(os.listdir(field_storage / 'sound_speed')) > 0
+    ss2 = SoundSpeed(o2, num_depths=50, rel_err=None, cache=True)
+    z = np.array([0, 100, 500])
+    c1 = ss1.interp(lat=o1.origin[0], lon=o1.origin[1], z=z, grid=True)
+    c2 = ss2.interp(lat=o2.origin[0], lon=o2.origin[1], z=z, grid=True)
+    assert np.all(c1 == c2)
+
+def test_sound_speed_field_key_depends_on_sources(field_storage):
+    o1 = Ocean(load_bathymetry=1000, load_temp=4, load_salinity=3)
+    o2 = Ocean(load_bathymetry=1000, load_temp=5, load_salinity=3)
+    o3 = Ocean(load_bathymetry=1000, load_temp=4, load_salinity=3)
+    o3.sources['temp'] = source_key(lambda **kwargs: None)
+    k1 = sound_speed.field_key(o1, num_depths=50, rel_err=None)
+    k2 = sound_speed.field_key(o2, num_depths=50, rel_err=None)
+    assert k1 != k2
+    assert sound_speed.field_key(o3, num_depths=50, rel_err=None) is None
+
+def test_sound_speed_field_store(field_storage, monkeypatch):
+    monkeypatch.setattr(sound_speed, 'field_cache_size', 2)
+    lats, lons, depths = np.arange(3.), np.arange(4.), np.arange(5.)
+    for key in range(3):
+        sound_speed.store_field(key, np.full((3, 4, 5), 1500. + key), lats, lons, depths)
+
+    # the least recently used field is discarded from memory
+    assert list(sound_speed._field_cache.keys()) == [1, 2]
+    assert sorted(os.listdir(field_storage / 'sound_speed')) == \
+            sorted(f'{key}{ext}' for key in range(3) for ext in ('.npy', '_axes.npz'))
+
+    # and read back from disk
+    c, la, lo, de = sound_speed.load_field(0)
+    assert np.all(c == 1500) and np.array_equal(de, depths)
+    assert list(sound_speed._field_cache.keys()) == [2, 0]
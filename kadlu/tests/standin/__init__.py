@@ -0,0 +1,20 @@
+""" local stand-ins for the remote services used by the data sources
+
+    the stand-ins serve deterministic synthetic payloads in the wire
+    formats of the real services, so that the fetch pipeline can be
+    tested and benchmarked without network access:
+
+        dap.py      HYCOM THREDDS, DAP2 ascii and binary responses
+        wwiii.py    NOAA WaveWatch III, monthly GRIB2 files
+        arcgis.py   CHS NONNA-100, ArcGIS JSON and geotiff files
+        cds.py      Copernicus Climate Data Store, cdsapi.Client
+        grib.py     GRIB2 encoder used by the above
+
+    the base URLs of the real services can be changed in config.ini
+    (url in sections [hycom], [wwiii], [chs], and [cdsapi]), or for
+    the duration of a context with serve()
+"""
+
+from kadlu.tests.standin.server import StandinServer, serve
+from kadlu.tests.standin.cds import FakeClient
+from kadlu.tests.standin.grib import write_grib2, grib2_message
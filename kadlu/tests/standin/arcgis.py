@@ -0,0 +1,40 @@
+""" stand-in for the CHS NONNA-100 ArcGIS image server
+
+    raster queries and download requests are answered with ArcGIS JSON,
+    and files are served from the geotiffs in the test assets, with
+    support for range requests
+"""
+
+import os
+import json
+import urllib.parse
+
+
+path_to_assets = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets')
+tifs = sorted(os.listdir(os.path.join(path_to_assets, 'tif')))
+
+
+def handle(path, query, headers):
+    """ respond to an ImageServer query, download, or file request
+
+        return:
+            status code, content type, body, and additional headers
+    """
+    qry = urllib.parse.parse_qs(query)
+    if path.endswith('/query'):
+        ids = list(range(len(tifs)))
+        return 200, 'application/json', json.dumps(dict(objectIds=ids)).encode(), {}
+    if path.endswith('/download'):
+        ids = map(int, qry['rasterIds'][0].split(','))
+        files = [dict(id=f'data\\{tifs[i]}', rasterIds=[i]) for i in ids]
+        return 200, 'application/json', json.dumps(dict(rasterFiles=files)).encode(), {}
+    if not path.endswith('/file'):
+        return 200, 'application/json', json.dumps(dict(error=dict(code=400))).encode(), {}
+
+    with open(os.path.join(path_to_assets, 'tif', tifs[int(qry['rasterId'][0])]), 'rb') as f:
+        data = f.read()
+    if headers.get('Range'):
+        start = int(headers['Range'][6:-1])
+        return 206, 'image/tiff', data[start:], \
+                {'Content-Range': f'bytes {start}-{len(data)-1}/{len(data)}'}
+    return 200, 'image/tiff', data, {}
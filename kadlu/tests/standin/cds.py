@@ -0,0 +1,38 @@
+""" stand-in for the Copernicus Climate Data Store API client """
+
+from datetime import datetime
+
+import numpy as np
+
+from kadlu.tests.standin.grib import write_grib2
+
+
+class FakeClient():
+    """ local stand-in for cdsapi.Client. writes requested fields to a grib
+        file, with values equal to the hour of the day
+    """
+    params = {
+            'significant_height_of_combined_wind_waves_and_swell' : (10, 0, 3, (1, 0)),
+            'mean_wave_direction' : (10, 0, 14, (1, 0)),
+            'mean_wave_period' : (10, 0, 15, (1, 0)),
+            '10m_u_component_of_wind' : (0, 2, 2, (103, 10)),
+            '10m_v_component_of_wind' : (0, 2, 3, (103, 10)),
+        }
+    requests = []
+
+    def __init__(self, url=None, key=None, **kwargs): pass
+
+    def retrieve(self, name, request, target):
+        self.requests.append(request)
+        north, west, south, east = request['area']
+        lats, lons = np.arange(north, south - .25, -.5), np.arange(west, east + .25, .5)
+        fields = []
+        for day in request['day']:
+            for hour in request['time']:
+                t = datetime(int(request['year']), int(request['month']), 
+                             int(day), int(hour[:2]))
+                for var in request['variable']:
+                    z = np.full((len(lats), len(lons)), t.hour, dtype=float)
+                    z[0, 0] = t.hour + 1  # avoid constant fields
+                    fields.append((z, lats, lons, t, *self.params[var]))
+        write_grib2(target, fields)
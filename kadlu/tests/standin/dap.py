@@ -0,0 +1,160 @@
+""" stand-in for the HYCOM THREDDS OPeNDAP server
+
+    serves a synthetic GLBv0.08 dataset in the DAP2 ascii and binary
+    (.dods) response formats. values are deterministic functions of the
+    grid indices, stored as scaled integers in the same way as HYCOM:
+    salinity and temperature have an offset of 20, all variables have a
+    scale factor of 0.001, and land is marked with the null value -30000
+"""
+
+import re
+import struct
+import urllib.parse
+from datetime import datetime
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.data_util import dt_2_epoch
+
+
+variables = ('salinity', 'water_temp', 'water_u', 'water_v')
+null_value = -30000
+separator = '---------------------------------------------\n'
+
+lat = np.round(np.linspace(-80, 90, 3251), 4)
+lon = np.round(np.arange(4500) * 0.08 - 180, 2)
+depth = np.array([0.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 15.0, 20.0, 25.0,
+        30.0, 35.0, 40.0, 45.0, 50.0, 60.0, 70.0, 80.0, 90.0, 100.0, 125.0,
+        150.0, 200.0, 250.0, 300.0, 350.0, 400.0, 500.0, 600.0, 700.0, 800.0,
+        900.0, 1000.0, 1250.0, 1500.0, 2000.0, 2500.0, 3000.0, 4000.0, 5000.0])
+
+
+def times(year):
+    """ 3-hourly timestamps of a year in epoch hours """
+    t0, t1 = dt_2_epoch(datetime(int(year), 1, 1)), dt_2_epoch(datetime(int(year) + 1, 1, 1))
+    return np.arange(t0, t1, 3, dtype=float)
+
+
+def values(var, t, d, y, x):
+    """ scaled integer values of a variable at the given index arrays.
+        the arrays are broadcast against each other
+    """
+    shape = (len(t), len(d), len(y), len(x))
+    t, d, y, x = np.ix_(t, d, y, x)
+    if var == 'salinity':     val = 15000 + 20 * d + (y % 50)
+    elif var == 'water_temp': val = -8000 - 150 * d + (x % 50) + (t % 8)
+    elif var == 'water_u':    val = ((t + y + 2 * x) % 200 - 100) * 5
+    elif var == 'water_v':    val = ((t + 2 * y + x) % 200 - 100) * -5
+    else: raise KeyError(f'{var} is not a variable of the stand-in dataset')
+    val = np.where((y + x) % 29 == 0, null_value, val)  # land
+    return np.broadcast_to(val, shape).astype(np.int16)
+
+
+def parse_constraint(query):
+    """ split a DAP constraint expression into variable names and slices
+
+        return:
+            list of (name, slices) tuples, where slices is a list of
+            (start, step, stop) tuples, or None for an unconstrained variable
+    """
+    parsed = []
+    for expr in urllib.parse.unquote(query).split(','):
+        name = expr.split('[', 1)[0]
+        hyperslab = re.findall(r'\[(\d+):(\d+):(\d+)\]', expr)
+        parsed.append((name, [tuple(map(int, s)) for s in hyperslab] or None))
+    return parsed
+
+
+def axis(name, year):
+    """ coordinate array of a map vector """
+    return dict(lat=lat, lon=lon, depth=depth, time=times(year))[name]
+
+
+def select(year, name, slices):
+    """ index arrays and values of a constrained variable """
+    if name in variables:
+        dims = [np.arange(len(axis(a, year))) for a in ('time', 'depth', 'lat', 'lon')]
+        ix = [d[s[0]:s[2]+1:s[1]] for d, s in zip(dims, slices or [(0, 1, len(d)-1) for d in dims])]
+        return ix, values(name, *ix)
+    ix = np.arange(len(axis(name, year)))
+    if slices: ix = ix[slices[0][0]:slices[0][2]+1:slices[0][1]]
+    return [ix], axis(name, year)[ix]
+
+
+def ascii_response(year, query):
+    """ DAP2 ascii response to a constraint expression """
+    body = f'Dataset {{\n}} GLBv0.08/expt_53.X/data/{year};\n' + separator
+    for name, slices in parse_constraint(query):
+        ix, val = select(year, name, slices)
+        if name not in variables:
+            # unconstrained vectors are prefixed by their row index
+            prefix = '[0], ' if slices is None else ''
+            body += f'{name}[{len(val)}]\n{prefix}' + ', '.join(map(str, val)) + '\n\n'
+            continue
+        body += f'{name}.{name}' + ''.join(f'[{n}]' for n in val.shape) + '\n'
+        rows = val.reshape(-1, val.shape[-1])
+        for n, row in enumerate(rows):
+            a, b, c = np.unravel_index(n, val.shape[:-1])
+            body += f'[{a}][{b}][{c}], ' + ', '.join(map(str, row)) + '\n'
+        body += '\n'
+        for i, a in zip(ix, ('time', 'depth', 'lat', 'lon')):
+            body += f'{name}.{a}[{len(i)}]\n' + ', '.join(map(str, axis(a, year)[i])) + '\n\n'
+    return body.encode()
+
+
+def dods_response(year, query):
+    """ DAP2 binary response to a constraint expression. the dataset
+        descriptor is followed by the XDR encoded arrays
+    """
+    dds, data = f'Dataset {{\n', b''
+    xdr = lambda arr, dtype: struct.pack('>II', arr.size, arr.size) + arr.astype(dtype).tobytes()
+    for name, slices in parse_constraint(query):
+        ix, val = select(year, name, slices)
+        if name not in variables:
+            dds += f'    Float64 {name}[{name} = {len(val)}];\n'
+            data += xdr(val, '>f8')
+            continue
+        dims = ''.join(f'[{a} = {len(i)}]' for a, i in zip(('time', 'depth', 'lat', 'lon'), ix))
+        maps = ''.join(f'        Float64 {a}[{a} = {len(i)}];\n'
+                       for a, i in zip(('time', 'depth', 'lat', 'lon'), ix))
+        dds += (f'    Grid {{\n      ARRAY:\n        Int16 {name}{dims};\n'
+                f'      MAPS:\n{maps}    }} {name};\n')
+        data += xdr(val.ravel(), '>i4')  # 16 bit integers are padded to 32 bits
+        for i, a in zip(ix, ('time', 'depth', 'lat', 'lon')):
+            data += xdr(axis(a, year)[i], '>f8')
+    dds += f'}} GLBv0.08/expt_53.X/data/{year};\n'
+    return dds.encode() + b'\nData:\n' + data
+
+
+def dap_ascii(cubes):
+    """ format arrays as an OPeNDAP ascii response to a grid constraint.
+        map vectors are filled with zeros
+    """
+    body = 'Dataset {\n} GLBv0.08/expt_53.X/data/2000;\n' + separator
+    for var, cube in cubes.items():
+        body += f'{var}.{var}' + ''.join(f'[{n}]' for n in cube.shape) + '\n'
+        for a in range(cube.shape[0]):
+            for b in range(cube.shape[1]):
+                for c in range(cube.shape[2]):
+                    row = ', '.join(map(str, cube[a][b][c]))
+                    body += f'[{a}][{b}][{c}], {row}\n'
+        body += '\n'
+        for a, n in zip(('time', 'depth', 'lat', 'lon'), cube.shape):
+            body += f'{var}.{a}[{n}]\n' + ', '.join(['0'] * n) + '\n\n'
+    return body
+
+
+def handle(path, query):
+    """ respond to a request for {year}.ascii or {year}.dods
+
+        return:
+            status code, content type, and body
+    """
+    fname = path.rsplit('/', 1)[-1]
+    year, ext = fname.rsplit('.', 1)
+    if not year.isdigit() or ext not in ('ascii', 'dods'): return 404, 'text/plain', b'not found'
+    try:
+        if ext == 'ascii': return 200, 'text/plain', ascii_response(year, query)
+        return 200, 'application/octet-stream', dods_response(year, query)
+    except (KeyError, IndexError, ValueError) as err:
+        return 400, 'text/plain', f'Error {{ message = "{err}"; }}'.encode()
@@ -0,0 +1,67 @@
+""" minimal GRIB2 writer for generating stand-in payloads and test files
+
+    writes single-field messages on a regular lat/lon grid using simple
+    packing, with a bitmap for masked values
+"""
+
+import struct
+
+import numpy as np
+
+
+def _signed(v, nbytes=4):
+    mag, sign = abs(int(v)), (1 << (8*nbytes - 1)) if v < 0 else 0
+    return (mag | sign).to_bytes(nbytes, 'big')
+
+
+def _section(num, body):
+    return struct.pack('>IB', 5 + len(body), num) + body
+
+
+def grib2_message(values, lats, lons, time, discipline=0, category=0, number=0,
+        surface=(1, 0)):
+    """ encode a 2D field as a GRIB2 message
+
+        values has shape (len(lats), len(lons)). NaN or masked values are
+        written as missing. the parameter is identified by discipline,
+        category and number according to WMO code table 4.2, e.g.
+        (10, 0, 3) is significant wave height and (0, 2, 2) is u wind.
+        surface is the (type, value) of the level according to WMO code
+        table 4.5, e.g. (103, 10) is 10 metres above ground
+    """
+    values = np.ma.masked_invalid(np.ma.asarray(values, dtype=float))
+    nj, ni = values.shape
+    s1 = _section(1, struct.pack('>HHBBBHBBBBBBB', 7, 0, 2, 1, 1, time.year,
+            time.month, time.day, time.hour, time.minute, time.second, 0, 1))
+    dlat, dlon = abs(lats[1] - lats[0]), abs(lons[1] - lons[0])
+    tmpl = (struct.pack('>BBIBIBI', 6, 0, 0, 0, 0, 0, 0) + struct.pack('>II', ni, nj)
+            + struct.pack('>II', 0, 0xFFFFFFFF)
+            + _signed(lats[0]*1e6) + _signed(lons[0]*1e6) + bytes([48])
+            + _signed(lats[-1]*1e6) + _signed(lons[-1]*1e6)
+            + struct.pack('>II', round(dlon*1e6), round(dlat*1e6))
+            + bytes([0 if lats[0] > lats[-1] else 64]))
+    s3 = _section(3, struct.pack('>BIBBH', 0, ni*nj, 0, 0, 0) + tmpl)
+    s4 = _section(4, struct.pack('>HH', 0, 0)
+            + struct.pack('>BBBBBHBB', category, number, 2, 0, 0, 0, 0, 1)
+            + struct.pack('>I', 0) + struct.pack('>BBI', surface[0], 0, surface[1])
+            + struct.pack('>BBI', 255, 0, 0))
+    mask = np.ma.getmaskarray(values).ravel()
+    data = np.ma.getdata(values).ravel()[~mask]
+    ref = float(data.min()) if len(data) else 0.
+    span = float(data.max()) - ref if len(data) else 0.
+    nbits = 16 if span > 0 else 0
+    E = int(np.ceil(np.log2(span / (2**16 - 1)))) if span > 0 else 0
+    X = np.round((data - ref) / 2.**E).astype('>u2') if nbits else np.empty(0, '>u2')
+    s5 = _section(5, struct.pack('>IH', len(data), 0) + struct.pack('>f', ref)
+            + _signed(E, 2) + _signed(0, 2) + bytes([nbits, 0]))
+    if mask.any(): s6 = _section(6, bytes([0]) + np.packbits(~mask).tobytes())
+    else:          s6 = _section(6, bytes([255]))
+    s7 = _section(7, X.tobytes())
+    body = s1 + s3 + s4 + s5 + s6 + s7 + b'7777'
+    return b'GRIB' + bytes([0, 0, discipline, 2]) + struct.pack('>Q', 16 + len(body)) + body
+
+
+def write_grib2(fpath, fields):
+    """ write an iterable of grib2_message argument tuples to a GRIB2 file """
+    with open(fpath, 'wb') as f:
+        for field in fields: f.write(grib2_message(*field))
@@ -0,0 +1,119 @@
+""" local HTTP server routing requests to the stand-in services
+
+    the services are mounted under a path prefix:
+
+        /hycom/     HYCOM THREDDS OPeNDAP server (see dap.py)
+        /wwiii/     NOAA WaveWatch III file server (see wwiii.py)
+        /chs/       CHS NONNA-100 ArcGIS image server (see arcgis.py)
+
+    a latency can be added to each response, and every nth request can
+    be answered with an error, to benchmark concurrency and retries
+"""
+
+import time
+import threading
+import http.server
+import urllib.parse
+from contextlib import contextmanager
+
+from kadlu.tests.standin import arcgis, dap, wwiii
+from kadlu.tests.standin.cds import FakeClient
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, as with the real services
+
+    def log_message(self, *args): pass
+
+    def send(self, code, ctype, body, headers={}):
+        self.send_response(code)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers.items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server.standin
+        url = urllib.parse.urlparse(self.path)
+        service = url.path.strip('/').split('/', 1)[0]
+        with server.lock:
+            server.requests.append((service, self.path, self.headers.get('Range')))
+            num = len(server.requests)
+        if server.delay: time.sleep(server.delay)
+        if server.fail_every and num % server.fail_every == 0:
+            return self.send(503, 'text/plain', b'service unavailable')
+
+        if service == 'hycom':   code, ctype, body, headers = *dap.handle(url.path, url.query), {}
+        elif service == 'wwiii': code, ctype, body, headers = *wwiii.handle(url.path, server.wwiii_res), {}
+        elif service == 'chs':   code, ctype, body, headers = arcgis.handle(url.path, url.query, self.headers)
+        else:                    code, ctype, body, headers = 404, 'text/plain', b'not found', {}
+        self.send(code, ctype, body, headers)
+
+
+class StandinServer():
+    """ stand-in services on a local port, served from a background thread
+
+        args:
+            delay: float
+                seconds of latency added to each response
+            fail_every: int
+                answer every nth request with status 503. 0 to disable
+            wwiii_res: float
+                grid resolution in degrees of the WaveWatch III files
+
+        attrs:
+            url: string
+                base URL of the server
+            requests: list
+                (service, path, range header) of each request received
+    """
+
+    def __init__(self, delay=0, fail_every=0, wwiii_res=2.0):
+        self.delay, self.fail_every, self.wwiii_res = delay, fail_every, wwiii_res
+        self.requests, self.lock = [], threading.Lock()
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def urls(self):
+        """ base URLs of each service, as configured in the source modules """
+        return dict(
+                hycom=f'{self.url}/hycom/GLBv0.08/expt_53.X/data',
+                wwiii=f'{self.url}/wwiii/',
+                chs=f'{self.url}/chs/',
+            )
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@contextmanager
+def serve(**kwargs):
+    """ start the stand-in services, and point the source modules at them
+        for the duration of the context. the ERA5 module is given the
+        stand-in CDS client. keyword arguments are passed to StandinServer
+
+        example:
+            with serve(delay=0.05) as server:
+                Hycom().fetch_temp(**qry)
+            print(len(server.requests))
+    """
+    from kadlu.geospatial.data_sources import chs, era5, hycom
+    import kadlu.geospatial.data_sources.wwiii as wwiii_source
+
+    server = StandinServer(**kwargs)
+    urls = server.urls()
+    patched = [(hycom, 'hycom_src', urls['hycom']), (wwiii_source, 'wwiii_src', urls['wwiii']),
+               (chs, 'chs_src', urls['chs']), (era5.cdsapi, 'Client', FakeClient)]
+    originals = [getattr(module, attr) for module, attr, _ in patched]
+    for module, attr, value in patched: setattr(module, attr, value)
+    try:
+        yield server
+    finally:
+        for (module, attr, _), value in zip(patched, originals): setattr(module, attr, value)
+        server.shutdown()
@@ -0,0 +1,63 @@
+""" stand-in for the NOAA WaveWatch III file server
+
+    serves monthly GRIB2 files of 3-hourly fields on a global grid, at
+    the same paths as the NODC archive. values are deterministic
+    functions of the coordinates and time, and land is masked
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from kadlu.tests.standin.grib import grib2_message
+
+
+# discipline, category, number, and surface of each variable
+params = dict(
+        hs   = [(10, 0,  3, (1, 0))],   # significant height of wind waves and swell
+        dp   = [(10, 0, 10, (1, 0))],   # primary wave direction
+        tp   = [(10, 0, 11, (1, 0))],   # primary wave mean period
+        wind = [( 0, 2,  2, (1, 0)),    # u component of wind
+                ( 0, 2,  3, (1, 0))],   # v component of wind
+    )
+
+# encoded files, keyed by variable, year, month, and resolution
+grib_cache = {}
+
+
+def field(num, lats, lons, t):
+    """ synthetic field of the num'th parameter at time t """
+    y, x = np.meshgrid(lats, lons, indexing='ij')
+    z = 2 + np.sin(np.radians(y)) ** 2 + np.cos(np.radians(x + 15 * t.hour)) + num
+    z[np.cos(np.radians(3 * y)) * np.sin(np.radians(2 * x)) > 0.8] = np.nan  # land
+    return z
+
+
+def grib_file(var, year, month, res=2.0):
+    """ encode a month of 3-hourly fields of a variable as a GRIB2 file """
+    lats, lons = np.arange(90, -90 - res/2, -res), np.arange(0, 360, res)
+    t, end = datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+    messages = []
+    while t < end:
+        for num, p in enumerate(params[var]):
+            messages.append(grib2_message(field(num, lats, lons, t), lats, lons, t, *p))
+        t += timedelta(hours=3)
+    return b''.join(messages)
+
+
+def handle(path, res=2.0):
+    """ respond to a request for {yyyy}/{mm}/(gribs|{region})/multi_1.{region}.{var}.{yyyymm}.grb2
+
+        encoded files are kept in memory, so that repeated requests measure
+        the transfer rather than the encoding
+
+        return:
+            status code, content type, and body
+    """
+    fname = path.rsplit('/', 1)[-1]
+    parts = fname.split('.')
+    if len(parts) != 5 or parts[0] != 'multi_1' or parts[2] not in params.keys():
+        return 404, 'text/plain', b'not found'
+    key = (parts[2], int(parts[3][:4]), int(parts[3][4:]), res)
+    if key not in grib_cache: grib_cache[key] = grib_file(*key)
+    return 200, 'application/octet-stream', grib_cache[key]
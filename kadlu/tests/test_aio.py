@@ -0,0 +1,94 @@
+""" Unit tests for the asynchronous loading API in the 'kadlu' package """
+
+import time
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+import kadlu
+from kadlu.geospatial.ocean import Ocean
+
+
+bounds = dict(south=44, north=45, west=-60, east=-59, top=0, bottom=500,
+              start=datetime(2015, 1, 1), end=datetime(2015, 1, 1, 12))
+
+
+def test_aload_matches_load():
+    val = asyncio.run(kadlu.aload('synthetic', 'temp', **bounds))
+    np.testing.assert_array_equal(val, kadlu.load('synthetic', 'temp', **bounds))
+
+
+def test_aload_coalesces_identical_requests(monkeypatch):
+    calls = []
+    load = kadlu.load
+    def slow_load(*args, **kwargs):
+        calls.append(args)
+        time.sleep(0.1)
+        return load(*args, **kwargs)
+    monkeypatch.setattr(kadlu, 'load', slow_load)
+
+    async def main():
+        return await asyncio.gather(
+                *(kadlu.aload('synthetic', 'salinity', **bounds) for _ in range(4)),
+                kadlu.aload('synthetic', 'salinity', **dict(bounds, north=44.5)))
+    *same, other = asyncio.run(main())
+    assert len(calls) == 2
+    assert all(np.array_equal(same[0], s) for s in same[1:])
+    assert same[0] is not same[1]  # each caller receives a copy
+    assert other.shape[1] < same[0].shape[1]
+
+
+def test_aload_grid(monkeypatch):
+    from kadlu.geospatial.data_sources import source_map
+    lat, lon = np.linspace(44, 45, 5), np.linspace(-60, -59, 7)
+    grid = lambda **kwargs: (np.add.outer(lat, lon), lat, lon)
+    monkeypatch.setitem(source_map.load_map, 'bathy_gebco', grid)
+
+    async def main():
+        return await asyncio.gather(*(kadlu.aload('gebco', 'bathy', **bounds) for _ in range(2)))
+    a, b = asyncio.run(main())
+    assert isinstance(a, tuple) and len(a) == 3
+    assert a[0].shape == (5, 7) and a[1].shape == (5, ) and a[2].shape == (7, )
+    assert all(np.array_equal(x, y) and x is not y for x, y in zip(a, b))
+
+
+def test_aload_does_not_block_event_loop(monkeypatch):
+    monkeypatch.setattr(kadlu, 'load', lambda *args, **kwargs: time.sleep(0.3) or np.zeros((3, 1)))
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.02)
+
+    async def main():
+        await asyncio.gather(kadlu.aload('synthetic', 'bathy', **bounds), ticker())
+    asyncio.run(main())
+    assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.25
+
+
+def test_ocean_acreate():
+    async def main():
+        return await asyncio.gather(
+                Ocean.acreate(load_bathymetry='synthetic', load_temp='synthetic', **bounds),
+                Ocean.acreate(load_bathymetry='synthetic', load_temp='synthetic', **bounds),
+                Ocean.acreate(load_bathymetry='synthetic', **bounds))
+    a, b, c = asyncio.run(main())
+    assert a is b and a is not c
+    assert a.bathy(lat=44.5, lon=-59.5) == c.bathy(lat=44.5, lon=-59.5)
+
+
+def test_aload_shares_fetch_bins(standin):
+    """ concurrent requests for different regions in the same fetch bin
+        download the bin once
+    """
+    qry = dict(west=-64, east=-63, top=0, bottom=5000,
+               start=datetime(2000, 1, 10), end=datetime(2000, 1, 10, 12))
+    async def main():
+        return await asyncio.gather(
+                kadlu.aload('hycom', 'temp', south=45, north=45.4, **qry),
+                kadlu.aload('hycom', 'temp', south=45.5, north=46, **qry))
+    a, b = asyncio.run(main())
+    assert np.all(a[1] <= 45.4) and np.all(b[1] >= 45.5)
+    assert sum('water_temp%5B' in path for _, path, _ in standin.requests) == 1
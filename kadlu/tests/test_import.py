@@ -0,0 +1,20 @@
+import sys
+import subprocess
+
+import kadlu
+
+
+heavy = ('matplotlib', 'cartopy', 'imageio', 'pygrib', 'cdsapi', 'netCDF4', 'PIL', 'sqlite3')
+
+def test_import_is_lazy():
+    code = ('import sys, kadlu; '
+            f'print(",".join(m for m in {heavy} if m in sys.modules))')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ''
+
+def test_lazy_attributes():
+    assert kadlu.dt_2_epoch(kadlu.epoch_2_dt(24)) == 24
+    assert 'temp_hycom' in kadlu.load_map.keys()
+    assert 'HYCOM' in kadlu.source_map
+    assert 'hycom' in dir(kadlu)
+    assert callable(kadlu.hycom)
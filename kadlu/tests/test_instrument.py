@@ -0,0 +1,112 @@
+""" Unit tests for the instrument module in the 'kadlu' package """
+
+import json
+import sqlite3
+import logging
+
+import numpy as np
+import pytest
+
+from kadlu import instrument
+from kadlu.geospatial.data_sources.data_util import bulk_insert
+from kadlu.sound.geophony import transmission_loss
+
+
+@pytest.fixture
+def sink():
+    sink = instrument.MemorySink()
+    previous = instrument.set_sink(sink)
+    yield sink
+    instrument.set_sink(previous)
+
+
+def test_disabled_sink_is_noop():
+    previous = instrument.set_sink(None)
+    try:
+        assert not instrument.enabled()
+        assert instrument.timer('download') is instrument._noop
+        assert instrument.laps('pe') is instrument._noop
+        with instrument.timer('download', source='hycom'): pass
+        with instrument.laps('pe')('fft'): pass
+        instrument.count('requests')
+        instrument.gauge('db.rows', 10)
+    finally:
+        instrument.set_sink(previous)
+
+
+def test_timer_count_gauge(sink):
+    with instrument.timer('download', source='hycom'): pass
+    instrument.count('requests', source='hycom')
+    instrument.count('requests', 2, source='hycom')
+    instrument.gauge('download.bytes', 1024, 'B', source='hycom')
+    kinds = [(e['kind'], e['name']) for e in sink.events]
+    assert kinds == [('timer', 'download'), ('count', 'requests'),
+                     ('count', 'requests'), ('gauge', 'download.bytes')]
+    assert sink.events[0]['source'] == 'hycom' and sink.events[0]['value'] >= 0
+    assert sink.totals()[('count', 'requests')] == 3
+    assert sink.totals()[('gauge', 'download.bytes')] == 1024
+
+
+def test_timer_records_failed_block(sink):
+    with pytest.raises(ValueError):
+        with instrument.timer('parse'): raise ValueError
+    assert sink.events[0]['name'] == 'parse'
+
+
+def test_laps_emit_totals(sink):
+    lap = instrument.laps('pe', freq=10)
+    for _ in range(5):
+        with lap('fft'): pass
+        with lap('save'): pass
+    assert len(sink.events) == 0
+    lap.emit()
+    events = {e['name']: e for e in sink.events}
+    assert set(events.keys()) == {'pe.fft', 'pe.save'}
+    assert events['pe.fft']['calls'] == 5 and events['pe.fft']['freq'] == 10
+
+
+def test_json_sink(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    previous = instrument.set_sink(str(path))
+    try:
+        assert isinstance(instrument.sink, instrument.JsonSink)
+        instrument.gauge('db.rows', 5, table='hs')
+        with instrument.timer('db.query', table='hs'): pass
+    finally:
+        instrument.set_sink(previous)
+    events = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [e['name'] for e in events] == ['db.rows', 'db.query']
+    assert events[0]['value'] == 5 and 'pid' in events[0]
+
+
+def test_log_sink(caplog):
+    previous = instrument.set_sink('log')
+    try:
+        with caplog.at_level(logging.INFO):
+            instrument.gauge('db.rows', 5, table='hs')
+    finally:
+        instrument.set_sink(previous)
+    assert 'gauge db.rows: 5 table=hs' in caplog.text
+
+
+def test_bulk_insert_gauges(sink):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE hs (val REAL, lat REAL, lon REAL, source TEXT, '
+                 'UNIQUE (lat, lon))')
+    cols = [np.arange(4.0), np.array([1.0, 1, 2, 2]), np.array([1.0, 1, 1, 2])]
+    assert bulk_insert(conn, 'hs', cols, 'wwiii') == (3, 1)
+    totals = sink.totals()
+    assert ('timer', 'db.insert') in totals
+    assert totals[('gauge', 'db.rows')] == 3
+    assert totals[('gauge', 'db.duplicates')] == 1
+
+
+def test_transmission_loss_stages(sink):
+    seafloor = {'sound_speed': 1700, 'density': 1.5, 'attenuation': 0.5}
+    tl = transmission_loss(freq=10, propagation_range=1, lat=45, lon=-59,
+            load_bathymetry=10000, ssp=1480, seafloor=seafloor, angular_bin=90,
+            source_depth=[10])
+    tl.calc(rec_depth=[10], progress_bar=False)
+    events = {e['name']: e for e in sink.events}
+    assert {'interp.fit', 'pe.env', 'pe.fft', 'pe.save'} <= set(events.keys())
+    assert events['pe.env']['calls'] == events['pe.save']['calls'] > 0
@@ -0,0 +1,55 @@
+""" Unit tests for the data loading API in the 'kadlu' package """
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import kadlu
+
+
+bounds = dict(south=44, north=45, west=-60, east=-59, top=0, bottom=100,
+              start=datetime(2015, 1, 1), end=datetime(2015, 1, 3))
+
+
+def test_iter_load_slices():
+    full = kadlu.load('synthetic', 'temp', **bounds)
+    slices = list(kadlu.iter_load('synthetic', 'temp', chunk=timedelta(hours=12), **bounds))
+    assert len(slices) == 4
+    assert [len(np.unique(s[3])) for s in slices] == [4, 4, 4, 5]
+    np.testing.assert_array_equal(np.hstack(slices), full)
+
+
+def test_iter_load_uneven_chunk():
+    full = kadlu.load('synthetic', 'waveheight', **bounds)
+    slices = list(kadlu.iter_load('synthetic', 'waveheight', chunk=timedelta(hours=20), **bounds))
+    assert len(slices) == 3
+    np.testing.assert_array_equal(np.hstack(slices), full)
+
+
+def test_iter_load_slices_not_on_the_hour():
+    qry = dict(bounds, start=datetime(2015, 1, 1, 0, 30))
+    full = kadlu.load('synthetic', 'temp', **qry)
+    slices = list(kadlu.iter_load('synthetic', 'temp', chunk=timedelta(minutes=90), **qry))
+    times = [np.unique(s[3]) for s in slices]
+    assert len(np.hstack(times)) == len(np.unique(np.hstack(times)))
+    np.testing.assert_array_equal(np.hstack(slices), full)
+
+
+def test_iter_load_chunk_under_an_hour():
+    with pytest.raises(AssertionError):
+        next(kadlu.iter_load('synthetic', 'temp', chunk=timedelta(minutes=30), **bounds))
+
+
+def test_iter_load_bathymetry():
+    slices = list(kadlu.iter_load('synthetic', 'bathymetry', **bounds))
+    assert len(slices) == 1 and slices[0].shape[0] == 3
+
+
+def test_iter_load_wwiii(standin):
+    qry = dict(south=46, north=48, west=-65, east=-62,
+               start=datetime(2014, 2, 3), end=datetime(2014, 2, 4))
+    full = kadlu.load('wwiii', 'waveheight', **qry)
+    slices = list(kadlu.iter_load('wwiii', 'waveheight', chunk=timedelta(hours=6), **qry))
+    assert len(slices) == 4
+    np.testing.assert_array_equal(np.hstack(slices), full)
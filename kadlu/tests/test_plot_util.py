@@ -0,0 +1,67 @@
+""" Unit tests for the animation pipeline in the 'kadlu.plot_util' module """
+
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib
+
+import kadlu
+from kadlu import plot_util
+
+
+bounds = dict(south=44, north=45, west=-60, east=-59, top=0, bottom=0,
+              start=datetime(2015, 1, 1, 7), end=datetime(2015, 1, 2))
+
+
+def test_frames_stream_time_range():
+    frames = list(plot_util.frames('waveheight', 'synthetic', bounds, timedelta(hours=6)))
+    assert [t for t, _, _ in frames] == [datetime(2015, 1, 1, h) for h in (0, 6, 12, 18)]
+
+    # values are averaged over the time steps of each frame
+    val, lat, lon, epoch = kadlu.load('synthetic', 'waveheight', **dict(bounds,
+            start=datetime(2015, 1, 1, 6), end=datetime(2015, 1, 1, 11, 59)))
+    fval, flat, flon = frames[1][1]
+    assert len(np.unique(epoch)) == 2 and len(fval) == len(val) // 2
+    node = (lat == flat[0]) & (lon == flon[0])
+    assert fval[0] == np.mean(val[node])
+    assert all(wind is None for _, _, wind in frames)
+
+
+def test_frames_wind():
+    frames = list(plot_util.frames('waveheight', 'synthetic', bounds, timedelta(hours=12),
+            plot_wind='synthetic'))
+    assert len(frames) == 2
+    u, v, lat, lon = frames[0][2]
+    assert len(u) == len(v) == len(lat) == len(frames[0][1][0])
+
+
+def slow_square(x):
+    time.sleep(0.01 * (x % 3))
+    return x * x
+
+
+def test_ordered_bounded():
+    read = []
+    def items():
+        for i in range(20):
+            read.append(i)
+            yield i
+    with ProcessPoolExecutor(2) as pool:
+        results = plot_util.ordered(pool, slow_square, items(), backlog=4)
+        assert next(results) == 0 and len(read) == 4
+        assert list(results) == [i * i for i in range(1, 20)]
+
+
+def test_draw_reuses_triangulation():
+    fig = matplotlib.figure.Figure()
+    ax = fig.add_subplot(1, 1, 1, projection=plot_util.proj)
+    val, lat, lon, _ = kadlu.load('synthetic', 'waveheight', **dict(bounds,
+            start=datetime(2015, 1, 1, 6), end=datetime(2015, 1, 1, 6)))
+    triangulations = {}
+    for scale in (1, 2):
+        artists = plot_util.draw(ax, 'waveheight', val * scale, lat, lon,
+                triangulations=triangulations)
+        assert len(artists) == 2
+    assert len(triangulations) == 1
@@ -3,7 +3,6 @@ import os
 from collections import namedtuple
 import math
 from scipy.interpolate import interp1d
-from netCDF4 import Dataset
 import scipy.io as sio
 
 
@@ -393,6 +392,7 @@ def load_data_from_file(path, val_name='bathy', lat_name='lat', lon_name='lon',
 
     # load data
     if ext == '.nc': # NetCDF
+        from netCDF4 import Dataset
         d = Dataset(path)
         val = np.array(d[val_name])
         lat = np.array(d[lat_name])